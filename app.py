@@ -1,111 +1,268 @@
 import streamlit as st
+import logging
 import os
 import time
 from dotenv import load_dotenv
 import numpy as np
-import matplotlib.pyplot as plt
 import io
 import base64
-from openai import OpenAI
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
 from utils.audio_utils import AudioProcessor
 from utils.llm_utils import LLMProcessor
-import sounddevice as sd
 import soundfile as sf
-from utils.audio_utils import play_audio_local
+from utils.playback import PlaybackManager
+from utils.conversation_store import ConversationStore, get_store
+from utils.faq_cache import FAQCache, get_faq_cache, warmup as warmup_faq_audio
+from utils.streaming_tts import StreamingSpeaker
+from utils.speculative import SpeculativeResponder
+from utils.language import detect_language
+from utils.metrics import REGISTRY
+from utils.waveform import (
+    compute_envelope, file_digest, render_png, render_png_matplotlib, samples_envelope
+)
 
 # Load environment variables
 load_dotenv()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
-# Configure OpenAI API
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    st.error("Please set OPENAI_API_KEY in .env file")
-else:
-            # Check API quota
+# Configuration parameters
+SAMPLE_RATE = int(os.getenv("SAMPLE_RATE", "16000"))
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+API_CHECK_TTL = int(os.getenv("OPENAI_HEALTH_CHECK_TTL", "600"))
+API_CHECK_ENABLED = os.getenv("OPENAI_HEALTH_CHECK", "1") != "0"
+# Messages reloaded into the page when a conversation is reopened
+RESTORE_MESSAGES = int(os.getenv("CONVERSATION_RESTORE_MESSAGES", "200"))
+# Uploads whose stage results (transcript, reply, audio) are kept for reruns
+STAGE_RESULTS_UPLOADS = int(os.getenv("STAGE_RESULTS_UPLOADS", "4"))
+
+@st.cache_data(ttl=API_CHECK_TTL, show_spinner=False)
+def check_api_health(api_key: str):
+    """
+    Probe the OpenAI API once per TTL window (per process, not per rerun)
+    
+    Returns:
+        None if the API is usable, otherwise an error kind and message
+    """
+    from openai import OpenAI
     try:
-        client = OpenAI()
+        client = OpenAI(api_key=api_key)
         # Try a small API call to check quota
-        response = client.chat.completions.create(
+        client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[{"role": "user", "content": "Hi"}],
             max_tokens=1
         )
+        return None
     except Exception as e:
         if "insufficient_quota" in str(e):
-            st.error("""
-            ⚠️ OpenAI API quota exceeded!
+            return ("insufficient_quota", str(e))
+        return ("error", str(e))
 
-            Please check your API usage and billing details at:
-            https://platform.openai.com/account/billing/overview
-            
-            You can:
-            1. Add payment method to get more quota
-            2. Wait for next billing cycle
-            3. Create new account for free credits
-            
-            See README.md troubleshooting section for details.
-            """)
-        else:
-            st.error(f"API verification error: {str(e)}")
+# Configure OpenAI API
+api_key = os.getenv("OPENAI_API_KEY")
+if not api_key:
+    st.error("Please set OPENAI_API_KEY in .env file")
+elif API_CHECK_ENABLED:
+    api_problem = check_api_health(api_key)
+    if api_problem and api_problem[0] == "insufficient_quota":
+        st.error("""
+        ⚠️ OpenAI API quota exceeded!
 
-# Configuration parameters
-SAMPLE_RATE = int(os.getenv("SAMPLE_RATE", "16000"))
-LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+        Please check your API usage and billing details at:
+        https://platform.openai.com/account/billing/overview
+        
+        You can:
+        1. Add payment method to get more quota
+        2. Wait for next billing cycle
+        3. Create new account for free credits
+        
+        See README.md troubleshooting section for details.
+        """)
+    elif api_problem:
+        st.error(f"API verification error: {api_problem[1]}")
+
+@st.cache_resource
+def get_audio_processor(sample_rate: int) -> AudioProcessor:
+    """One AudioProcessor per process, shared across reruns and sessions"""
+    return AudioProcessor(sample_rate=sample_rate)
+
+# Initialize processors. The LLM processor holds per-conversation state
+# (mode prompt, context summary) so it lives in the session; the underlying
+# ChatOpenAI client is shared process-wide by LLMProcessor itself.
+audio_processor = get_audio_processor(SAMPLE_RATE)
+if "llm_processor" not in st.session_state:
+    st.session_state.llm_processor = LLMProcessor(model_name=LLM_MODEL)
+llm_processor = st.session_state.llm_processor
+if "responder" not in st.session_state:
+    st.session_state.responder = SpeculativeResponder(audio_processor, llm_processor)
 
-# Initialize processors
-audio_processor = AudioProcessor(sample_rate=SAMPLE_RATE)
-llm_processor = LLMProcessor(model_name=LLM_MODEL)
+@st.cache_resource
+def get_conversation_store() -> ConversationStore:
+    """One conversation store (and background writer) per process"""
+    return get_store()
+
+conversation_store = get_conversation_store()
+
+@st.cache_resource
+def get_faq() -> FAQCache:
+    """FAQ answer cache; answers are pre-rendered to speech in the background"""
+    faq = get_faq_cache()
+    if len(faq):
+        threading.Thread(target=warmup_faq_audio, args=(audio_processor,),
+                         name="faq-warmup", daemon=True).start()
+    return faq
+
+faq_cache = get_faq()
+
+# The conversation id lives in the URL, so a refresh reopens the same conversation
+if "sid" not in st.query_params:
+    st.query_params["sid"] = uuid.uuid4().hex
+session_id = st.query_params["sid"]
 
 # Initialize Streamlit state
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = conversation_store.recent(session_id, RESTORE_MESSAGES)
 if "recording_duration" not in st.session_state:
     st.session_state.recording_duration = 5
 if "mode" not in st.session_state:
     st.session_state.mode = "customer_service"  # Default to customer service mode
+if "auto_stop" not in st.session_state:
+    st.session_state.auto_stop = True
+if "streaming" not in st.session_state:
+    st.session_state.streaming = True
+if "speculative" not in st.session_state:
+    st.session_state.speculative = True
+if "stage_results" not in st.session_state:
+    st.session_state.stage_results = OrderedDict()  # digest -> {(stage, config): result}
+if "processed_uploads" not in st.session_state:
+    st.session_state.processed_uploads = set()
+if "playback" not in st.session_state:
+    st.session_state.playback = PlaybackManager()
+
+WAVEFORM_WIDTH = 1000
+WAVEFORM_HEIGHT = 160
+WAVEFORM_RENDERER = os.getenv("WAVEFORM_RENDERER", "pil")  # "pil" or "matplotlib"
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_waveform(digest: str, width: int, height: int, _audio, _sample_rate: int) -> bytes:
+    """Render a waveform PNG once per (content hash, size)"""
+    if isinstance(_audio, np.ndarray):
+        mins, maxs, duration = samples_envelope(_audio, _sample_rate, width=width)
+    else:
+        mins, maxs, duration = compute_envelope(
+            io.BytesIO(_audio) if isinstance(_audio, bytes) else _audio, width=width
+        )
+    if WAVEFORM_RENDERER == "matplotlib":
+        return render_png_matplotlib(mins, maxs, duration, width=width, height=height)
+    return render_png(mins, maxs, height=height)
 
-def visualize_audio(audio_path):
-    """Visualize audio waveform"""
+def visualize_audio(audio, sample_rate: int = SAMPLE_RATE):
+    """Visualize audio waveform (sample array, encoded bytes, or file path)"""
     try:
-        import soundfile as sf
-        data, _ = sf.read(audio_path)
-        
-        # Create figure
-        fig, ax = plt.subplots(figsize=(10, 2))
-        ax.plot(np.arange(len(data)) / SAMPLE_RATE, data)
-        ax.set_xlabel('Time (seconds)')
-        ax.set_ylabel('Amplitude')
-        ax.set_title('Audio Waveform')
-        
-        
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
+        if isinstance(audio, np.ndarray):
+            digest = hashlib.sha256(audio.tobytes()).hexdigest()
+            duration = len(audio) / sample_rate
+        elif isinstance(audio, bytes):
+            digest = hashlib.sha256(audio).hexdigest()
+            duration = sf.info(io.BytesIO(audio)).duration
+        else:
+            digest = file_digest(audio)
+            duration = sf.info(audio).duration
+        png = render_waveform(digest, WAVEFORM_WIDTH, WAVEFORM_HEIGHT, audio, sample_rate)
         
         # Display image
-        st.image(buf)
+        st.image(png, caption=f"Audio Waveform ({duration:.1f} s)", use_container_width=True)
     except Exception as e:
         st.warning(f"Unable to visualize audio: {str(e)}")
 
-def play_audio_local(filepath: str):
-    data, sr = sf.read(filepath, dtype="float32")
-    sd.play(data, sr)
-    sd.wait()
+def interrupt_playback():
+    """Stop the reply still playing and record how much of it was heard"""
+    result = st.session_state.playback.stop()
+    if result["interrupted"]:
+        heard = llm_processor.note_playback(st.session_state.messages, result["heard_text"], result["fraction"])
+        if heard is not None:
+            # Keep the stored conversation in line, so a reopened call agrees
+            conversation_store.note_heard(session_id, heard, mode=st.session_state.mode)
+    st.session_state.playback.clear()
+
+def record_exchange(user_text: str, response: str):
+    """Add a user/assistant exchange to the page and the conversation store"""
+    for role, content in (("user", user_text), ("assistant", response)):
+        st.session_state.messages.append({"role": role, "content": content})
+        conversation_store.append(session_id, role, content, mode=st.session_state.mode)
+
+def respond_streaming(transcript: str, reply=None):
+    """Stream the reply: speak each sentence while the rest is still generating"""
+    st.success("AI response:")
+    placeholder = st.empty()
+    playback = st.session_state.playback
+    playback.start()
+    if reply is not None:
+        # Prepared by the speculative responder, possibly already under way
+        fragments = reply.fragments()
+        speaker = StreamingSpeaker(audio_processor, play_fn=playback.enqueue, synthesize=reply.synthesize)
+    else:
+        fragments = llm_processor.stream_response(transcript, conversation_history=st.session_state.messages)
+        # One voice for the whole reply, in the caller's language
+        speaker = StreamingSpeaker(audio_processor, play_fn=playback.enqueue,
+                                   lang=detect_language(transcript))
+    response, _ = speaker.speak(fragments, on_text=placeholder.write)
+    # Playback carries on in the background; the caller can talk over it
+    playback.finish()
+    
+    # Update conversation history
+    record_exchange(transcript, response)
 
 def handle_audio_input():
     """Handle audio input"""
-    with st.spinner(f"Recording {st.session_state.recording_duration} seconds..."):
-        audio_file = audio_processor.record_audio(duration=st.session_state.recording_duration)
-        if audio_file:
-            st.audio(audio_file)
-            visualize_audio(audio_file)
+    interrupt_playback()
+    if st.session_state.auto_stop:
+        spinner_text = "Listening... (stops when you finish speaking)"
+    else:
+        spinner_text = f"Recording {st.session_state.recording_duration} seconds..."
+    transcript = None
+    reply = None
+    with st.spinner(spinner_text):
+        if st.session_state.auto_stop:
+            # Transcribed while recording when a streaming model is installed
+            partial = st.empty()
+            
+            def show_partial(text: str):
+                partial.caption(f"Hearing: {text}")
+            
+            if st.session_state.streaming and st.session_state.speculative:
+                # The reply starts while the caller is still trailing off
+                recording, transcript, reply = st.session_state.responder.listen(
+                    st.session_state.messages,
+                    max_duration=st.session_state.recording_duration,
+                    on_partial=show_partial,
+                )
+            else:
+                recording, transcript = audio_processor.record_and_transcribe(
+                    max_duration=st.session_state.recording_duration,
+                    on_partial=show_partial,
+                )
+            partial.empty()
+        else:
+            recording = audio_processor.record_audio(duration=st.session_state.recording_duration)
+        if recording is not None:
+            st.audio(recording, sample_rate=SAMPLE_RATE)
+            visualize_audio(recording)
             
             # Transcribe audio
             with st.spinner("Transcribing..."):
-                transcript = audio_processor.transcribe_audio(audio_file)
+                if transcript is None:
+                    transcript = audio_processor.transcribe_audio(recording)
                 if transcript:
                     st.info(f"Transcription: {transcript}")
                     
+                    if st.session_state.streaming:
+                        respond_streaming(transcript, reply)
+                        return
+                    
                     # Generate response
                     with st.spinner("Generating response..."):
                         response = llm_processor.generate_response(
@@ -114,25 +271,97 @@ def handle_audio_input():
                         )
                         
                         # Update conversation history
-                        st.session_state.messages.append({"role": "user", "content": transcript})
-                        st.session_state.messages.append({"role": "assistant", "content": response})
+                        record_exchange(transcript, response)
                         
                         # Generate voice response
-                        audio_response = audio_processor.text_to_speech(response)
+                        audio_response = audio_processor.text_to_speech(
+                            response, lang=detect_language(transcript)
+                        )
                         if audio_response:
                             st.success("AI response:")
                             st.write(response)
-                            st.audio(audio_response)
-                            play_audio_local(audio_response)
+                            st.audio(audio_response, format=audio_processor.tts_mime)
+                            st.session_state.playback.play(audio_response, text=response)
                 else:
                     st.error("Audio transcription failed")
         else:
             st.error("Recording failed")
 
+def run_stage(digest: str, stage: str, config: tuple, fn):
+    """
+    Run a pipeline stage at most once per (content hash, stage, config)
+    
+    Streamlit reruns the whole script on every interaction; results are kept
+    in the session so an attached upload is not re-transcribed, re-answered
+    and re-synthesized on each rerun. Only the last STAGE_RESULTS_UPLOADS
+    uploads are kept, so the session does not accumulate audio payloads.
+    """
+    key = (stage, config)
+    uploads = st.session_state.stage_results
+    results = uploads.setdefault(digest, {})
+    uploads.move_to_end(digest)
+    while len(uploads) > STAGE_RESULTS_UPLOADS:
+        uploads.popitem(last=False)
+    if key in results:
+        return results[key]
+    result = fn()
+    if result:  # failures are retried on the next run
+        results[key] = result
+    return result
+
+def process_upload(uploaded_file):
+    """Process an uploaded file once, serving repeat renders from stored results"""
+    data = uploaded_file.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+    
+    with st.spinner("Processing uploaded audio..."):
+        # Transcribe audio (long recordings are split and decoded in parallel);
+        # the upload stays in memory unless the ASR backend needs a file
+        if audio_processor.is_long_audio(data):
+            result = run_stage(digest, "asr", ("long", SAMPLE_RATE),
+                               lambda: audio_processor.transcribe_long_audio(io.BytesIO(data)))
+            transcript = result["text"]
+            with st.expander("Transcript segments"):
+                for segment in result["segments"]:
+                    st.write(f"[{segment['start']:.1f}s – {segment['end']:.1f}s] {segment['text']}")
+        else:
+            transcript = run_stage(digest, "asr", ("short", SAMPLE_RATE),
+                                   lambda: audio_processor.transcribe_audio(data))
+        if not transcript:
+            return
+        st.info(f"Transcription: {transcript}")
+        
+        # Generate response
+        with st.spinner("Generating response..."):
+            response = run_stage(
+                digest, "llm", (st.session_state.mode, LLM_MODEL),
+                lambda: llm_processor.generate_response(
+                    transcript,
+                    conversation_history=st.session_state.messages
+                )
+            )
+            
+            # Update conversation history (once per file)
+            if digest not in st.session_state.processed_uploads:
+                st.session_state.processed_uploads.add(digest)
+                record_exchange(transcript, response)
+            
+            # Generate voice response
+            lang = detect_language(transcript)
+            audio_response = run_stage(
+                digest, "tts", (audio_processor.tts_engine, response, lang),
+                lambda: audio_processor.text_to_speech(response, lang=lang)
+            )
+            if audio_response:
+                st.success("AI response:")
+                st.write(response)
+                st.audio(audio_response, format=audio_processor.tts_mime)
+
 def handle_text_input():
     """Handle text input"""
     user_input = st.text_input("Enter your question:")
     if user_input:
+        interrupt_playback()
         with st.spinner("Generating response..."):
             response = llm_processor.generate_response(
                 user_input, 
@@ -140,15 +369,14 @@ def handle_text_input():
             )
             
             # Update conversation history
-            st.session_state.messages.append({"role": "user", "content": user_input})
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            record_exchange(user_input, response)
             
             # Generate voice response
-            audio_response = audio_processor.text_to_speech(response)
+            audio_response = audio_processor.text_to_speech(response, lang=detect_language(user_input))
             if audio_response:
                 st.success("AI response:")
                 st.write(response)
-                st.audio(audio_response)
+                st.audio(audio_response, format=audio_processor.tts_mime)
                 
                 # Reset input box
                 st.rerun()
@@ -160,18 +388,63 @@ def display_conversation_history():
         with st.chat_message(message["role"]):
             st.write(message["content"])
 
+def display_analysis(analysis: dict):
+    """Display a structured conversation analysis"""
+    if analysis["summary"]:
+        st.write(analysis["summary"])
+    lead = analysis["lead"]
+    score = analysis["sentiment_score"]
+    col1, col2 = st.columns(2)
+    col1.metric("Sentiment", analysis["sentiment"].capitalize(),
+                None if score is None else f"{score:+.2f}")
+    col2.metric("Lead qualification", lead["qualification"].capitalize())
+
+    for title, items in (("Needs", analysis["needs"]),
+                         ("Key points", analysis["key_points"]),
+                         ("Next actions", analysis["next_actions"])):
+        if items:
+            st.markdown(f"**{title}**")
+            st.markdown("\n".join(f"- {item}" for item in items))
+
+    details = {k: v for k, v in lead.items() if k != "qualification" and v not in (None, "", [])}
+    if details:
+        st.markdown("**Lead details**")
+        st.table({k.replace("_", " ").capitalize(): [", ".join(v) if isinstance(v, list) else str(v)]
+                  for k, v in details.items()})
+    with st.expander("JSON"):
+        st.json(analysis)
+
 def settings_section():
     """Settings section"""
     st.sidebar.header("Settings")
     
-    # Recording duration setting
+    # Voice-activity endpointing
+    st.session_state.auto_stop = st.sidebar.checkbox(
+        "Stop recording when I stop speaking",
+        value=st.session_state.auto_stop
+    )
+    
+    # Recording duration setting (upper bound when auto-stop is on)
     st.session_state.recording_duration = st.sidebar.slider(
-        "Recording Duration (seconds)", 
+        "Max Recording Duration (seconds)" if st.session_state.auto_stop else "Recording Duration (seconds)", 
         min_value=3, 
         max_value=15, 
         value=st.session_state.recording_duration
     )
     
+    # Streaming replies
+    st.session_state.streaming = st.sidebar.checkbox(
+        "Stream spoken replies (start speaking after the first sentence)",
+        value=st.session_state.streaming
+    )
+    
+    # Speculative replies (needs auto-stop and streaming)
+    if st.session_state.auto_stop and st.session_state.streaming:
+        st.session_state.speculative = st.sidebar.checkbox(
+            "Start replying before I finish (speculative)",
+            value=st.session_state.speculative
+        )
+    
     # Mode selection
     mode = st.sidebar.radio(
         "Select mode",
@@ -187,9 +460,60 @@ def settings_section():
         llm_processor.customize_for_lead_generation()
         st.sidebar.success("Switched to Lead Generation mode")
     
+    # Prompt size of the last turn
+    if llm_processor.last_prompt_tokens:
+        st.sidebar.caption(f"Prompt tokens (last turn): {llm_processor.last_prompt_tokens}")
+    
+    # TTS cache counters
+    tts_stats = audio_processor.tts_cache.stats()
+    st.sidebar.caption(
+        f"TTS cache: {tts_stats['hits']} hits / {tts_stats['misses']} misses "
+        f"({tts_stats['hit_rate']:.0%})"
+    )
+    
+    # FAQ short-circuit counters (customer service mode)
+    faq_stats = faq_cache.stats()
+    if faq_stats["entries"]:
+        st.sidebar.caption(
+            f"FAQ cache: {faq_stats['hits']} hits / {faq_stats['misses']} misses "
+            f"({faq_stats['hit_rate']:.0%}), {faq_stats['entries']} questions"
+        )
+    
+    # Speculative reply outcomes
+    spec = st.session_state.responder.stats
+    if spec["speculations"]:
+        st.sidebar.caption(
+            f"Speculative replies: {spec['committed']} used / {spec['discarded']} discarded "
+            f"({st.session_state.responder.hit_rate():.0%}), "
+            f"{spec['saved_s']:.1f}s saved, {spec['wasted_s']:.1f}s wasted"
+        )
+    
+    # Per-stage latency percentiles
+    latency = REGISTRY.summary()
+    if latency:
+        with st.sidebar.expander("Stage latency (ms)"):
+            st.dataframe(
+                [
+                    {"stage": stage, "n": m["count"],
+                     **{q: round(m[q] * 1000) for q in ("p50", "p95", "p99")}}
+                    for stage, m in latency.items()
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+    
     # Clear conversation history
     if st.sidebar.button("Clear Conversation History"):
+        # The store is append-only: start a new conversation instead
+        conversation_store.forget(session_id)
+        st.query_params["sid"] = uuid.uuid4().hex
+        conversation_store.begin(st.query_params["sid"])
         st.session_state.messages = []
+        st.session_state.analysis = None
+        # An upload still attached is answered again, into the new conversation
+        st.session_state.processed_uploads = set()
+        st.session_state.stage_results = OrderedDict()
+        st.session_state.playback.clear()
         st.sidebar.success("Conversation History Cleared")
         st.rerun()
 
@@ -211,33 +535,7 @@ def main():
         # Upload audio file
         uploaded_file = st.file_uploader("Or Upload Audio File", type=["wav", "mp3"])
         if uploaded_file:
-            with st.spinner("Processing uploaded audio..."):
-                # Save uploaded file
-                with open("temp_upload.wav", "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                
-                # Transcribe audio
-                transcript = audio_processor.transcribe_audio("temp_upload.wav")
-                if transcript:
-                    st.info(f"Transcription: {transcript}")
-                    
-                    # Generate response
-                    with st.spinner("Generating response..."):
-                        response = llm_processor.generate_response(
-                            transcript, 
-                            conversation_history=st.session_state.messages
-                        )
-                        
-                        # Update conversation history
-                        st.session_state.messages.append({"role": "user", "content": transcript})
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                        
-                        # Generate voice response
-                        audio_response = audio_processor.text_to_speech(response)
-                        if audio_response:
-                            st.success("AI response:")
-                            st.write(response)
-                            st.audio(audio_response)
+            process_upload(uploaded_file)
     
     with tab2:
         st.subheader("Text Interaction")
@@ -248,8 +546,12 @@ def main():
         if st.session_state.messages:
             if st.button("Analyze Conversation"):
                 with st.spinner("Analyzing conversation..."):
-                    analysis = llm_processor.analyze_conversation(st.session_state.messages)
-                    st.write(analysis["analysis"])
+                    try:
+                        st.session_state.analysis = llm_processor.analyze_conversation(st.session_state.messages)
+                    except Exception as e:
+                        st.error(f"Analysis error: {str(e)}")
+            if st.session_state.get("analysis"):
+                display_analysis(st.session_state.analysis)
         else:
             st.info("Conversation history is empty, cannot perform analysis")
     
@@ -0,0 +1,97 @@
+# benchmarks/bench_app_startup.py
+"""
+Startup / rerun timing benchmark for the Streamlit app.
+
+Runs app.py headless through Streamlit's AppTest harness: one cold run in a
+fresh interpreter (imports + processor construction), then repeated reruns of
+the same session, which is what every widget interaction costs.
+
+    python benchmarks/bench_app_startup.py --reruns 20 --output startup.json
+    python benchmarks/bench_app_startup.py --max-rerun-ms 150   # fail on regression
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+cold = time.perf_counter() - t0
+reruns = []
+for _ in range(int(sys.argv[1])):
+    t = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - t)
+errors = [e.value for e in at.exception]
+print(json.dumps({"cold_s": cold, "reruns_s": reruns, "exceptions": errors}))
+"""
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app.py cold start and rerun cost")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument("--max-rerun-ms", type=float, default=None,
+                        help="Exit non-zero if the median rerun exceeds this")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    env["OPENAI_HEALTH_CHECK"] = "0"  # no network in the timing loop
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep benchmark sessions out of the real conversation store
+        env["CONVERSATION_DB_URL"] = "sqlite:///" + os.path.join(tmp, "conversations.db")
+        wall = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-c", _CHILD, str(args.reruns)],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        wall = time.perf_counter() - wall
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        sys.exit(proc.returncode)
+
+    raw = json.loads(proc.stdout.strip().splitlines()[-1])
+    reruns_ms = [r * 1000 for r in raw["reruns_s"]]
+    result = {
+        "process_wall_s": round(wall, 3),
+        "cold_run_ms": round(raw["cold_s"] * 1000, 1),
+        "rerun_ms": {
+            "n": len(reruns_ms),
+            "p50": round(statistics.median(reruns_ms), 1),
+            "p95": round(_percentile(reruns_ms, 95), 1),
+            "max": round(max(reruns_ms), 1),
+        } if reruns_ms else {},
+        "exceptions": raw["exceptions"],
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if raw["exceptions"]:
+        sys.exit(1)
+    if args.max_rerun_ms is not None and reruns_ms and result["rerun_ms"]["p50"] > args.max_rerun_ms:
+        print(f"Median rerun {result['rerun_ms']['p50']} ms exceeds {args.max_rerun_ms} ms", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# benchmarks/bench_e2e.py
+"""
+End-to-end turn benchmark, fully offline.
+
+Drives the real AudioProcessor / LLMProcessor code paths (preprocessing,
+ASR dispatch, context building, streaming reply, sentence segmentation, TTS
+cache) with local stand-ins for the expensive parts:
+
+    ASR  benchmarks/stub_sherpa_onnx_offline.py (load and decode delays)
+    LLM  benchmarks/mock_openai.py (first-token delay and token rate)
+    TTS  FakeTTSBackend below (fixed + per-character delay)
+
+Each concurrency level runs N sessions in parallel, each doing a number of
+turns with its own conversation history. Reports turn latency and
+time-to-first-audio distributions, per-stage latencies, throughput and peak
+RSS as JSON so runs can be compared across commits.
+
+    python benchmarks/bench_e2e.py --sessions 1 4 16 --turns 5 --output e2e.json
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+QUESTIONS = [
+    "Where is my order?",
+    "Can I change the delivery address?",
+    "What is your return policy?",
+    "Do you offer a discount for annual plans?",
+    "How do I reset my password?",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_mock_llm(port: int, args) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "mock_openai.py"), "--port", str(port),
+         "--latency-ms", str(args.llm_latency_ms), "--first-token-ms", str(args.llm_first_token_ms),
+         "--tokens-per-second", str(args.llm_tokens_per_second)],
+        cwd=ROOT,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/v1/models", timeout=1)
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("Mock OpenAI server did not start")
+
+
+def _utterance(seconds: float, sample_rate: int) -> bytes:
+    """Speech-like test signal (syllable-modulated noise) encoded as WAV bytes."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t))
+    samples = (0.2 * envelope * rng.standard_normal(t.size)).astype(np.float32)
+    buf = io.BytesIO()
+    sf.write(buf, samples, sample_rate, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+def _summary(values_s):
+    values = sorted(v * 1000 for v in values_s)
+    if not values:
+        return {}
+    q = np.percentile(values, [50, 95, 99])
+    return {"n": len(values), "mean": round(statistics.fmean(values), 1),
+            "p50": round(q[0], 1), "p95": round(q[1], 1), "p99": round(q[2], 1),
+            "max": round(values[-1], 1)}
+
+
+def _peak_rss_mb(who) -> float:
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _make_processor(args):
+    from utils.audio_utils import AudioProcessor
+    from utils.tts_backends import TTSBackend
+
+    class FakeTTSBackend(TTSBackend):
+        """Backend that sleeps instead of synthesizing and returns silence."""
+
+        name = "bench-fake"
+
+        def synthesize_pcm(self, text: str, lang: str):
+            time.sleep((args.tts_base_ms + args.tts_ms_per_char * len(text)) / 1000)
+            return np.zeros(int(0.06 * len(text) * 16000), dtype=np.float32), 16000
+
+    return AudioProcessor(sample_rate=16000, tts_backend=FakeTTSBackend())
+
+
+def _run_session(session_index: int, turns: int, audio: bytes, audio_processor, model: str):
+    from utils.language import detect_language
+    from utils.llm_utils import LLMProcessor
+    from utils.streaming_tts import StreamingSpeaker
+
+    llm = LLMProcessor(model_name=model)
+    history = []
+    records = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        first_audio = []
+        try:
+            transcript = audio_processor.transcribe_audio(audio)
+            if not transcript:
+                raise RuntimeError("empty transcript")
+            # Vary the prompt so replies and cache keys are not all identical
+            prompt = f"{transcript} {QUESTIONS[(session_index + turn) % len(QUESTIONS)]}"
+            speaker = StreamingSpeaker(
+                audio_processor,
+                lang=detect_language(prompt),
+                play_fn=lambda _audio, _text: first_audio or first_audio.append(time.perf_counter()),
+            )
+            response, _ = speaker.speak(llm.stream_response(prompt, conversation_history=history))
+            history.append({"role": "user", "content": prompt})
+            history.append({"role": "assistant", "content": response})
+            end = time.perf_counter()
+            records.append({
+                "turn_s": end - start,
+                "first_audio_s": (first_audio[0] - start) if first_audio else None,
+            })
+        except Exception as e:
+            records.append({"error": str(e)})
+    return records
+
+
+def run_level(sessions: int, args, audio: bytes, audio_processor):
+    from utils.metrics import REGISTRY
+
+    REGISTRY.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [
+            pool.submit(_run_session, i, args.turns, audio, audio_processor, args.model)
+            for i in range(sessions)
+        ]
+        records = [r for f in futures for r in f.result()]
+    wall = time.perf_counter() - start
+
+    ok = [r for r in records if "error" not in r]
+    errors = [r["error"] for r in records if "error" in r]
+    stages = {
+        stage: {k: (round(v * 1000, 1) if isinstance(v, float) else v) for k, v in m.items()}
+        for stage, m in REGISTRY.summary().items()
+    }
+    return {
+        "sessions": sessions,
+        "turns": len(records),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "wall_s": round(wall, 3),
+        "throughput_turns_per_s": round(len(ok) / wall, 3) if wall else None,
+        "turn_ms": _summary([r["turn_s"] for r in ok]),
+        "first_audio_ms": _summary([r["first_audio_s"] for r in ok if r["first_audio_s"] is not None]),
+        "stages_ms": stages,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end voice turn benchmark")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4],
+                        help="Concurrency levels to run")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session")
+    parser.add_argument("--utterance-s", type=float, default=3.0)
+    parser.add_argument("--input-sr", type=int, default=44100, help="Sample rate of the test audio")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--asr-load-ms", type=float, default=1500)
+    parser.add_argument("--asr-decode-rtf", type=float, default=0.1)
+    parser.add_argument("--asr-workers", type=int, default=0,
+                        help="Resident ASR workers (0 = stub binary per request)")
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--llm-first-token-ms", type=float, default=250)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=60)
+    parser.add_argument("--tts-base-ms", type=float, default=150)
+    parser.add_argument("--tts-ms-per-char", type=float, default=2)
+    parser.add_argument("--tts-cache", action="store_true",
+                        help="Keep the TTS cache enabled (off by default so every sentence is synthesized)")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    port = _free_port()
+    cache_dir = tempfile.mkdtemp(prefix="bench-tts-")
+    # Configure the stand-ins before any utils module reads its settings
+    os.environ.update({
+        "OMNI_ASR_BIN": f"{sys.executable} {os.path.join(HERE, 'stub_sherpa_onnx_offline.py')}",
+        "OMNI_ASR_WORKERS": str(args.asr_workers),
+        "STUB_ASR_LOAD_MS": str(args.asr_load_ms),
+        "STUB_ASR_DECODE_RTF": str(args.asr_decode_rtf),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "OPENAI_API_KEY": "sk-benchmark",
+        "TTS_CACHE_DIR": cache_dir,
+        "TTS_CACHE_MAX_MB": "512" if args.tts_cache else "0",
+    })
+
+    mock = _start_mock_llm(port, args)
+    try:
+        audio_processor = _make_processor(args)
+        audio = _utterance(args.utterance_s, args.input_sr)
+        levels = [run_level(n, args, audio, audio_processor) for n in args.sessions]
+    finally:
+        mock.terminate()
+        mock.wait()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    result = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "levels": levels,
+        # The benchmark process only: stub ASR launches and the mock server stand in
+        # for external processes whose footprint is not what is being measured
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if any(level["errors"] for level in levels):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
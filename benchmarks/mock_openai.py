@@ -0,0 +1,139 @@
+# benchmarks/mock_openai.py
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Answers /v1/chat/completions (plain and streaming) after a configurable
+delay, and can inject 429s to exercise rate limiting and retries.
+
+    python benchmarks/mock_openai.py --port 8001 --latency-ms 400 --fail-rate 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=sk-mock python -m streamlit run app.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_REPLY = (
+    "Thank you for calling. Our support team is available from nine to five, Monday to Friday. "
+    "Is there anything else I can help you with today?"
+)
+
+# Returned when the request asks for JSON (response_format json_object)
+JSON_REPLY = json.dumps({
+    "summary": "The customer asked about support hours.",
+    "needs": ["support hours"],
+    "sentiment": "neutral",
+    "sentiment_score": 0.1,
+    "key_points": [],
+    "lead": {"qualification": "cold"},
+    "next_actions": ["Send the support schedule by email"],
+})
+
+
+def create_app(latency_ms: float = 300.0, first_token_ms: float = 150.0,
+               tokens_per_second: float = 60.0, fail_rate: float = 0.0,
+               reply: str = DEFAULT_REPLY) -> FastAPI:
+    """
+    Build the mock API app
+
+    Args:
+        latency_ms: Total time for a non-streaming completion
+        first_token_ms: Delay before the first streamed token
+        tokens_per_second: Streaming rate after the first token
+        fail_rate: Probability of answering 429
+        reply: Text returned for every completion (JSON_REPLY when JSON is requested)
+    """
+    app = FastAPI(title="Mock OpenAI")
+    app.state.stats = {"requests": 0, "rate_limited": 0}
+
+    def rate_limited():
+        app.state.stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after-ms": "200"},
+            content={"error": {"message": "Rate limit reached (mock)", "type": "requests",
+                               "code": "rate_limit_exceeded"}},
+        )
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "gpt-3.5-turbo", "object": "model"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        app.state.stats["requests"] += 1
+        if random.random() < fail_rate:
+            return rate_limited()
+
+        model = body.get("model", "gpt-3.5-turbo")
+        prompt_tokens = sum(len(m.get("content") or "") // 4 + 4 for m in body.get("messages", []))
+        wants_json = (body.get("response_format") or {}).get("type") == "json_object"
+        text = JSON_REPLY if wants_json else reply
+        words = text.split(" ")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency_ms / 1000)
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                          "total_tokens": prompt_tokens + len(words)},
+            }
+
+        async def events():
+            await asyncio.sleep(first_token_ms / 1000)
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": None,
+                                 "delta": {"role": "assistant", "content": (" " if i else "") + word}}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(1.0 / tokens_per_second)
+            done = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [],
+                         "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                                   "total_tokens": prompt_tokens + len(words)}}
+                yield f"data: {json.dumps(usage)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--first-token-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.first_token_ms, args.tokens_per_second, args.fail_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# benchmarks/stub_sherpa_onnx_offline.py
+"""
+Stand-in for the sherpa-onnx-offline binary.
+
+Accepts the same command line as the OmniASR calls in utils/omni_asr.py,
+sleeps to imitate model loading and decoding, and prints each input path
+followed by a JSON result, like the real binary.
+
+    OMNI_ASR_BIN="python benchmarks/stub_sherpa_onnx_offline.py"
+
+Delays (environment):
+    STUB_ASR_LOAD_MS     model load time per launch (default 1500)
+    STUB_ASR_DECODE_RTF  decode time as a fraction of audio duration (default 0.1)
+"""
+import json
+import os
+import sys
+import time
+
+import soundfile as sf
+
+LOAD_MS = float(os.getenv("STUB_ASR_LOAD_MS", "1500"))
+DECODE_RTF = float(os.getenv("STUB_ASR_DECODE_RTF", "0.1"))
+
+
+def main():
+    paths = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if not paths:
+        print("usage: stub_sherpa_onnx_offline.py [--options] file.wav ...", file=sys.stderr)
+        sys.exit(1)
+
+    time.sleep(LOAD_MS / 1000)
+    for path in paths:
+        try:
+            info = sf.info(path)
+        except Exception as e:
+            print(f"Failed to read {path}: {e}", file=sys.stderr)
+            sys.exit(1)
+        duration = info.frames / info.samplerate
+        time.sleep(duration * DECODE_RTF)
+        print(path)
+        print(json.dumps({
+            "text": "I would like to know the status of my order.",
+            "duration": round(duration, 3),
+        }))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
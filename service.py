@@ -0,0 +1,371 @@
+# service.py
+"""
+Headless voice-bot service.
+
+Exposes the record -> transcribe -> respond -> speak pipeline over REST and a
+streaming WebSocket, for telephony gateways and other non-browser clients.
+
+    uvicorn service:app --host 0.0.0.0 --port 8000
+
+REST:
+    POST   /v1/calls                      {"mode": "customer_service"} -> {"call_id"}
+    GET    /v1/calls/{call_id}            conversation so far (ended calls from the store)
+    DELETE /v1/calls/{call_id}
+    POST   /v1/calls/{call_id}/turns      multipart "audio" file -> transcript, reply, audio (base64)
+    POST   /v1/calls/{call_id}/text       {"text": "..."} -> reply, audio (base64)
+    GET    /healthz
+    GET    /metrics                       per-stage latency histograms (Prometheus text format)
+
+WebSocket /v1/calls/{call_id}/stream?sample_rate=16000:
+    client -> server: binary frames of 16-bit little-endian mono PCM;
+                      optional text frame {"type": "end"} to force end of utterance
+    server -> client: {"type": "ready", "audio_mime"} once, on connect
+                      {"type": "transcript", "text"}
+                      {"type": "response_text", "text"} followed by one binary audio frame, per sentence
+                      {"type": "turn_end", "response"}
+
+Audio replies are MP3 or WAV depending on the TTS backend (TTS_BACKEND); the
+format is reported as "audio_mime" in REST replies and in the WebSocket
+"ready" message.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import FastAPI, File, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from utils.asr_engine import get_engine
+from utils.audio_utils import AudioProcessor
+from utils.conversation_store import get_store
+from utils.language import detect_language
+from utils.faq_cache import get_faq_cache, warmup as warmup_faq_audio
+from utils.llm_utils import LLMProcessor
+from utils.metrics import REGISTRY
+from utils.streaming_tts import SentenceSegmenter
+from utils.vad import EnergyVAD, Endpointer
+
+load_dotenv()
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+SAMPLE_RATE = int(os.getenv("SAMPLE_RATE", "16000"))
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+ASR_WORKERS = int(os.getenv("SERVICE_ASR_WORKERS", "2"))
+LLM_WORKERS = int(os.getenv("SERVICE_LLM_WORKERS", "16"))
+TTS_WORKERS = int(os.getenv("SERVICE_TTS_WORKERS", "4"))
+MAX_ACTIVE_TURNS = int(os.getenv("SERVICE_MAX_ACTIVE_TURNS", "32"))
+MAX_QUEUED_TURNS = int(os.getenv("SERVICE_MAX_QUEUED_TURNS", "64"))
+MAX_SESSIONS = int(os.getenv("SERVICE_MAX_SESSIONS", "1000"))
+SESSION_TTL = float(os.getenv("SERVICE_SESSION_TTL", "1800"))
+MAX_UTTERANCE_SECONDS = float(os.getenv("SERVICE_MAX_UTTERANCE_SECONDS", "30"))
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the resident ASR workers before the first call arrives
+    await _in_pool(asr_pool, get_engine)
+    if len(get_faq_cache()):
+        # Pre-render FAQ answers so cache hits are spoken without synthesis
+        asyncio.get_running_loop().run_in_executor(tts_pool, warmup_faq_audio, audio_processor)
+    expiry = asyncio.get_running_loop().create_task(_expire_sessions())
+    yield
+    expiry.cancel()
+
+
+app = FastAPI(title="Omnilingual Voice Bot", lifespan=lifespan)
+
+audio_processor = AudioProcessor(sample_rate=SAMPLE_RATE)
+asr_pool = ThreadPoolExecutor(max_workers=ASR_WORKERS, thread_name_prefix="asr")
+llm_pool = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+tts_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+
+
+class Admission:
+    """
+    Bounded admission for turns: up to `active` run at once, up to `queued`
+    more wait, anything beyond is rejected so overload turns into fast 503s
+    instead of unbounded latency.
+    """
+
+    def __init__(self, active: int, queued: int):
+        self.capacity = active + queued
+        self.pending = 0
+        self.semaphore = asyncio.Semaphore(active)
+
+    async def __aenter__(self):
+        if self.pending >= self.capacity:
+            raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            await self.semaphore.acquire()
+        except BaseException:
+            self.pending -= 1
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+        self.pending -= 1
+
+
+admission = Admission(MAX_ACTIVE_TURNS, MAX_QUEUED_TURNS)
+
+
+class CallSession:
+    def __init__(self, mode: str):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.messages: List[Dict[str, str]] = []
+        self.llm = LLMProcessor(model_name=LLM_MODEL)
+        if mode == "lead_generation":
+            self.llm.customize_for_lead_generation()
+        else:
+            self.llm.customize_for_call_center()
+        self.lock = asyncio.Lock()  # one turn at a time per call
+        self.last_active = time.monotonic()
+        get_store().begin(self.id)
+
+    def record(self, transcript: str, response: str) -> None:
+        """Add an exchange to the call and queue it for the conversation store"""
+        store = get_store()
+        for role, content in (("user", transcript), ("assistant", response)):
+            self.messages.append({"role": role, "content": content})
+            store.append(self.id, role, content, mode=self.mode)
+
+    def close(self) -> None:
+        """Release the call's conversation store state"""
+        get_store().forget(self.id)
+
+
+sessions: Dict[str, CallSession] = {}
+
+
+def _end_session(call_id: str) -> None:
+    session = sessions.pop(call_id, None)
+    if session is not None:
+        session.close()
+
+
+class CallRequest(BaseModel):
+    mode: str = "customer_service"
+
+
+class TextTurn(BaseModel):
+    text: str
+    speak: bool = True
+
+
+def _get_session(call_id: str) -> CallSession:
+    session = sessions.get(call_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown call")
+    session.last_active = time.monotonic()
+    return session
+
+
+async def _in_pool(pool, fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+
+async def _respond(session: CallSession, transcript: str, speak: bool) -> dict:
+    response = await session.llm.agenerate_response(transcript, conversation_history=session.messages)
+    session.record(transcript, response)
+
+    result = {"transcript": transcript, "response": response, "audio_b64": None,
+              "audio_mime": audio_processor.tts_mime}
+    if speak:
+        audio = await _in_pool(tts_pool, audio_processor.text_to_speech, response,
+                               detect_language(transcript))
+        if audio:
+            result["audio_b64"] = base64.b64encode(audio).decode("ascii")
+    return result
+
+
+async def _expire_sessions():
+    while True:
+        await asyncio.sleep(60)
+        cutoff = time.monotonic() - SESSION_TTL
+        for call_id in [k for k, s in sessions.items() if s.last_active < cutoff]:
+            _end_session(call_id)
+
+
+@app.get("/healthz")
+async def healthz():
+    engine = get_engine()
+    return {
+        "status": "ok",
+        "sessions": len(sessions),
+        "pending_turns": admission.pending,
+        "asr_resident": engine.available,
+        # Last background check: pinging here would block the loop and take idle workers
+        "asr_workers": engine.worker_status(),
+        "tts_backend": audio_processor.tts_engine,
+        "tts_cache": audio_processor.tts_cache.stats(),
+        "faq_cache": get_faq_cache().stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return REGISTRY.render_prometheus()
+
+
+@app.post("/v1/calls")
+async def create_call(request: CallRequest):
+    if len(sessions) >= MAX_SESSIONS:
+        raise HTTPException(status_code=503, detail="Too many active calls", headers={"Retry-After": "5"})
+    session = CallSession(request.mode)
+    sessions[session.id] = session
+    return {"call_id": session.id, "mode": session.mode}
+
+
+@app.get("/v1/calls/{call_id}")
+async def get_call(call_id: str):
+    session = sessions.get(call_id)
+    if session is None:
+        # Ended or expired calls are still readable from the conversation store
+        messages = await _in_pool(llm_pool, get_store().history, call_id)
+        if not messages:
+            raise HTTPException(status_code=404, detail="Unknown call")
+        return {"call_id": call_id, "mode": None, "messages": messages, "ended": True}
+    session.last_active = time.monotonic()
+    return {"call_id": session.id, "mode": session.mode, "messages": session.messages}
+
+
+@app.delete("/v1/calls/{call_id}")
+async def end_call(call_id: str):
+    _end_session(call_id)
+    return {"call_id": call_id, "ended": True}
+
+
+@app.post("/v1/calls/{call_id}/turns")
+async def audio_turn(call_id: str, audio: UploadFile = File(...), speak: bool = True):
+    session = _get_session(call_id)
+    # Starlette spools uploads to disk; only read what the limit allows
+    if audio.size is not None and audio.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Audio upload too large")
+    data = await audio.read(MAX_UPLOAD_BYTES + 1)
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Audio upload too large")
+    async with admission, session.lock:
+        transcript = await _in_pool(asr_pool, audio_processor.transcribe_audio, data)
+        if not transcript:
+            raise HTTPException(status_code=422, detail="No speech recognized")
+        return await _respond(session, transcript, speak)
+
+
+@app.post("/v1/calls/{call_id}/text")
+async def text_turn(call_id: str, turn: TextTurn):
+    session = _get_session(call_id)
+    async with admission, session.lock:
+        return await _respond(session, turn.text, turn.speak)
+
+
+async def _stream_reply(websocket: WebSocket, session: CallSession, transcript: str) -> str:
+    """Stream the reply from the model and send each sentence as soon as it is spoken."""
+    loop = asyncio.get_running_loop()
+    lang = detect_language(transcript)  # one voice for the whole reply
+    segmenter = SentenceSegmenter()
+    pending_tts: "asyncio.Queue" = asyncio.Queue()
+    response = ""
+
+    async def send_audio():
+        while True:
+            item = await pending_tts.get()
+            if item is None:
+                return
+            sentence, audio_future = item
+            await websocket.send_json({"type": "response_text", "text": sentence})
+            audio = await audio_future
+            if audio:
+                await websocket.send_bytes(audio)
+
+    sender = asyncio.create_task(send_audio())
+    try:
+        async for fragment in session.llm.astream_response(transcript, conversation_history=session.messages):
+            response += fragment
+            for sentence in segmenter.feed(fragment):
+                pending_tts.put_nowait((sentence, loop.run_in_executor(
+                    tts_pool, audio_processor.text_to_speech, sentence, lang)))
+        tail = segmenter.flush()
+        if tail:
+            pending_tts.put_nowait((tail, loop.run_in_executor(tts_pool, audio_processor.text_to_speech, tail, lang)))
+    finally:
+        pending_tts.put_nowait(None)
+        await sender
+    return response
+
+
+@app.websocket("/v1/calls/{call_id}/stream")
+async def stream_call(websocket: WebSocket, call_id: str, sample_rate: int = SAMPLE_RATE):
+    session = sessions.get(call_id)
+    if session is None:
+        await websocket.close(code=4404)
+        return
+    await websocket.accept()
+    await websocket.send_json({"type": "ready", "audio_mime": audio_processor.tts_mime})
+
+    def new_endpointer():
+        return Endpointer(
+            EnergyVAD(sample_rate=sample_rate),
+            max_duration=MAX_UTTERANCE_SECONDS,
+            no_speech_timeout=24 * 3600,  # callers may stay silent; the client decides
+        )
+
+    endpointer = new_endpointer()
+    carry = b""  # odd trailing byte of a frame that split a PCM16 sample
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            forced = False
+            if message.get("text"):
+                try:
+                    forced = json.loads(message["text"]).get("type") == "end"
+                except (ValueError, AttributeError):
+                    pass
+            if message.get("bytes"):
+                data = carry + message["bytes"]
+                usable = len(data) - len(data) % 2
+                carry = data[usable:]
+                pcm = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+                endpointer.process(pcm)
+            if not (endpointer.finished or forced):
+                continue
+
+            speech = endpointer.audio()
+            endpointer = new_endpointer()
+            carry = b""
+            if speech is None:
+                continue
+
+            # Frames are not read while a turn runs, so a client that keeps
+            # sending is slowed down by the socket instead of queuing audio here
+            session.last_active = time.monotonic()
+            try:
+                async with admission, session.lock:
+                    transcript = await _in_pool(
+                        asr_pool, audio_processor.transcribe_audio, speech, sample_rate
+                    )
+                    await websocket.send_json({"type": "transcript", "text": transcript})
+                    if not transcript:
+                        continue
+                    response = await _stream_reply(websocket, session, transcript)
+                    session.record(transcript, response)
+                    await websocket.send_json({"type": "turn_end", "response": response})
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+    except WebSocketDisconnect:
+        pass
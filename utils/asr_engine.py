@@ -0,0 +1,363 @@
+# utils/asr_engine.py
+"""
+Resident OmniASR engine.
+
+Loading the omnilingual_1b ONNX model dominates the cost of a one-shot
+`sherpa-onnx-offline` run, so this module keeps a small pool of worker
+processes that load the model once (through the sherpa-onnx Python
+bindings) and then serve decode requests over a pipe. Workers are
+health-checked and restarted when they die; if the bindings are missing or
+a worker fails mid-request, the request falls back to the one-shot
+subprocess path in `utils.omni_asr`.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import atexit
+import tempfile
+import multiprocessing as mp
+from typing import Optional, List
+
+import numpy as np
+import soundfile as sf
+
+from utils.omni_asr import MODEL, TOKENS, transcribe_with_omni_asr
+
+logger = logging.getLogger(__name__)
+
+NUM_WORKERS = int(os.getenv("OMNI_ASR_WORKERS", "1"))
+NUM_THREADS = int(os.getenv("OMNI_ASR_THREADS", "2"))
+STARTUP_TIMEOUT = float(os.getenv("OMNI_ASR_STARTUP_TIMEOUT", "120"))
+REQUEST_TIMEOUT = float(os.getenv("OMNI_ASR_REQUEST_TIMEOUT", "60"))
+HEALTH_INTERVAL = float(os.getenv("OMNI_ASR_HEALTH_INTERVAL", "30"))
+MAX_RESTARTS = int(os.getenv("OMNI_ASR_MAX_RESTARTS", "5"))
+
+
+def _worker_main(conn, model: str, tokens: str, num_threads: int):
+    """
+    Worker process entry point: load the model once, then serve requests.
+
+    Protocol (tuples over the pipe):
+        ("ping", None)        -> ("pong", None)
+        ("decode", wav_path)  -> ("ok", text) | ("error", message)
+        ("decode_pcm", (samples, sample_rate)) -> same as "decode"
+        ("stop", None)        -> process exits
+    """
+    try:
+        import sherpa_onnx
+        import soundfile as sf
+
+        recognizer = sherpa_onnx.OfflineRecognizer.from_omnilingual_asr_ctc(
+            model=model,
+            tokens=tokens,
+            num_threads=num_threads,
+        )
+    except Exception as e:
+        conn.send(("fatal", f"{type(e).__name__}: {e}"))
+        return
+
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            op, payload = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+
+        if op == "stop":
+            break
+        if op == "ping":
+            conn.send(("pong", None))
+            continue
+
+        try:
+            if op == "decode_pcm":
+                samples, sr = payload
+            else:
+                samples, sr = sf.read(payload, dtype="float32")
+            if samples.ndim > 1:
+                samples = samples.mean(axis=1)
+            stream = recognizer.create_stream()
+            stream.accept_waveform(sr, samples)
+            recognizer.decode_stream(stream)
+            conn.send(("ok", stream.result.text.strip()))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """A single resident model process and its pipe."""
+
+    def __init__(self, ctx, index: int):
+        self.ctx = ctx
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.restarts = 0  # consecutive failed boots / crashes
+        self.given_up = False
+
+    def start(self) -> None:
+        parent_conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(
+            target=_worker_main,
+            args=(child_conn, MODEL, TOKENS, NUM_THREADS),
+            name=f"omni-asr-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+
+    def wait_ready(self, timeout: float) -> None:
+        status, detail = self._recv(timeout)
+        if status == "fatal":
+            raise ImportError(detail)
+        if status != "ready":
+            raise RuntimeError(f"unexpected worker status: {status}")
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def request(self, op: str, payload, timeout: float):
+        self.conn.send((op, payload))
+        return self._recv(timeout)
+
+    def _recv(self, timeout: float):
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"worker {self.index} did not answer within {timeout:.0f}s")
+        return self.conn.recv()
+
+    def stop(self) -> None:
+        try:
+            if self.is_alive():
+                self.conn.send(("stop", None))
+                self.process.join(timeout=2)
+        except Exception:
+            pass
+        if self.is_alive():
+            self.process.kill()
+            self.process.join(timeout=2)
+        if self.conn is not None:
+            self.conn.close()
+
+
+class OmniASREngine:
+    def __init__(self, num_workers: int = NUM_WORKERS):
+        """
+        Initialize the resident ASR engine
+
+        Args:
+            num_workers: Number of model processes to keep loaded
+                (0 disables the resident engine: every request runs sherpa-onnx-offline)
+        """
+        self.num_workers = max(0, num_workers)
+        self._ctx = mp.get_context("spawn")
+        self._workers: List[_Worker] = []
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+        self._last_health: dict = {}
+        self.available = self.num_workers > 0
+        self.started = False
+
+    def start(self) -> None:
+        """
+        Spawn the worker processes and the health-check thread
+        """
+        with self._lock:
+            if self.started:
+                return
+            self.started = True
+            for i in range(self.num_workers):
+                worker = _Worker(self._ctx, i)
+                self._workers.append(worker)
+                threading.Thread(target=self._boot, args=(worker,), daemon=True).start()
+            self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+            self._health_thread.start()
+
+    def _boot(self, worker: _Worker) -> None:
+        try:
+            worker.start()
+            worker.wait_ready(STARTUP_TIMEOUT)
+            worker.restarts = 0  # a healthy boot earns a fresh restart budget
+            self._idle.put(worker)
+        except ImportError as e:
+            # sherpa-onnx bindings are not installed: stay on the subprocess path
+            logger.warning("Resident engine unavailable, using subprocess fallback: %s", e)
+            self.available = False
+            worker.stop()
+        except Exception as e:
+            logger.error("Worker %d failed to start: %s", worker.index, e)
+            worker.stop()
+            self._schedule_restart(worker)
+
+    def _schedule_restart(self, worker: _Worker) -> None:
+        if self._stop.is_set() or not self.available:
+            return
+        if worker.restarts >= MAX_RESTARTS:
+            logger.error("Worker %d exceeded %d restarts, giving up", worker.index, MAX_RESTARTS)
+            worker.given_up = True
+            if all(w.given_up for w in self._workers):
+                # Nothing left to wait for: send every request down the subprocess path
+                logger.error("No resident ASR workers left, using subprocess fallback")
+                self.available = False
+            return
+        worker.restarts += 1
+        threading.Thread(target=self._boot, args=(worker,), daemon=True).start()
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(HEALTH_INTERVAL):
+            self.health_check()
+
+    def health_check(self) -> dict:
+        """
+        Ping every idle worker and restart the ones that do not answer
+
+        Returns:
+            Mapping of worker index to "ok" / "restarting" / "busy"
+        """
+        status = {w.index: "busy" for w in self._workers}
+        checked = []
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                reply, _ = worker.request("ping", None, timeout=5)
+                if reply != "pong":
+                    raise RuntimeError(reply)
+                status[worker.index] = "ok"
+                checked.append(worker)
+            except Exception:
+                status[worker.index] = "restarting"
+                worker.stop()
+                self._schedule_restart(worker)
+        for worker in checked:
+            self._idle.put(worker)
+        self._last_health = status
+        return status
+
+    def worker_status(self) -> dict:
+        """
+        Worker states from the last background health check (non-blocking)
+
+        Returns:
+            Mapping of worker index to "ok" / "restarting" / "busy" /
+            "starting" (not checked yet) / "failed" (out of restarts) /
+            "fallback" (engine disabled: requests use the subprocess path)
+        """
+        if not self.available:
+            return {w.index: "fallback" for w in self._workers}
+        last = self._last_health
+        return {w.index: "failed" if w.given_up else last.get(w.index, "starting")
+                for w in self._workers}
+
+    def _acquire(self, timeout: float) -> Optional[_Worker]:
+        deadline = time.monotonic() + timeout
+        while self.available and time.monotonic() < deadline:
+            try:
+                return self._idle.get(timeout=0.25)
+            except queue.Empty:
+                continue
+        return None
+
+    def transcribe(self, wav_path: str) -> str:
+        """
+        Transcribe a wav file with a resident worker
+
+        Args:
+            wav_path: Path to the audio file
+
+        Returns:
+            Transcribed text
+        """
+        return self._decode(
+            "decode", os.path.abspath(wav_path), lambda: transcribe_with_omni_asr(wav_path)
+        )
+
+    def transcribe_samples(self, samples: np.ndarray, sample_rate: int) -> str:
+        """
+        Transcribe in-memory audio with a resident worker
+
+        The samples go to the worker over the pipe; a temporary wav file is
+        only written if the request has to fall back to the subprocess path.
+
+        Args:
+            samples: Float32 mono samples
+            sample_rate: Sampling rate in Hz
+
+        Returns:
+            Transcribed text
+        """
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        return self._decode(
+            "decode_pcm", (samples, sample_rate),
+            lambda: _transcribe_spilled(samples, sample_rate),
+        )
+
+    def _decode(self, op: str, payload, fallback) -> str:
+        if not self.started:
+            self.start()
+        if not self.available:
+            return fallback()
+
+        worker = self._acquire(STARTUP_TIMEOUT)
+        if worker is None:
+            logger.warning("No resident worker ready, using subprocess fallback")
+            return fallback()
+
+        try:
+            status, result = worker.request(op, payload, timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            # Crash or hang: replace the worker and serve this request the slow way
+            logger.warning("Worker %d failed (%s), restarting", worker.index, e)
+            worker.stop()
+            self._schedule_restart(worker)
+            return fallback()
+
+        self._idle.put(worker)
+        if status != "ok":
+            logger.warning("Worker %d could not decode (%s), using subprocess fallback",
+                           worker.index, result)
+            return fallback()
+        return result
+
+    def close(self) -> None:
+        """
+        Stop all worker processes
+        """
+        self._stop.set()
+        for worker in self._workers:
+            worker.stop()
+        self._workers = []
+        self.started = False
+
+
+def _transcribe_spilled(samples: np.ndarray, sample_rate: int) -> str:
+    """Write samples to a uniquely named wav, run the one-shot path, delete it."""
+    fd, path = tempfile.mkstemp(prefix="omni_asr_", suffix=".wav")
+    os.close(fd)
+    try:
+        sf.write(path, samples, sample_rate)
+        return transcribe_with_omni_asr(path)
+    finally:
+        os.remove(path)
+
+
+_engine: Optional[OmniASREngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> OmniASREngine:
+    """Return the process-wide ASR engine, starting it on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = OmniASREngine()
+            _engine.start()
+            atexit.register(_engine.close)
+        return _engine
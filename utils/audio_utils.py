@@ -1,33 +1,95 @@
-import sounddevice as sd
+# sounddevice is imported where it is used: importing it initializes
+# PortAudio, which headless callers (batch jobs, services) never need.
+import logging
 import soundfile as sf
 import numpy as np
-import tempfile
-from gtts import gTTS
-import os
-from typing import Optional
-from utils.omni_asr import transcribe_with_omni_asr
-
-def play_audio_local(path: str):
-    """Play an audio file locally through the system speakers."""
+import io
+import queue
+from typing import Callable, Optional, Tuple, Union
+from utils.asr_engine import get_engine
+from utils.vad import EnergyVAD, Endpointer
+from utils.tts_cache import TTSCache
+from utils.tts_backends import TTSBackend, get_backend
+from utils.language import detect_language
+from utils.long_audio import LONG_AUDIO_SECONDS, transcribe_long_audio
+from utils.resample import Resampler, normalize, resample
+from utils.metrics import span
+from utils import streaming_asr
+
+logger = logging.getLogger(__name__)
+
+# Audio can travel through the pipeline as a file path, encoded bytes
+# (WAV/MP3/...), a file-like object, or a NumPy array of samples.
+AudioInput = Union[str, bytes, io.IOBase, np.ndarray]
+
+def load_audio(audio: AudioInput, sample_rate: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """
+    Decode any supported audio input to float32 mono samples
+    
+    Args:
+        audio: Path, encoded bytes, file-like object, or sample array
+        sample_rate: Rate of `audio` when it is a sample array
+        
+    Returns:
+        Tuple of (samples, sample rate)
+    """
+    if isinstance(audio, np.ndarray):
+        if sample_rate is None:
+            raise ValueError("sample_rate is required for array input")
+        data, sr = audio, sample_rate
+    else:
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            audio = io.BytesIO(audio)
+        elif hasattr(audio, "seek"):
+            audio.seek(0)
+        data, sr = sf.read(audio, dtype="float32")
+    data = np.asarray(data, dtype=np.float32)
+    if data.ndim > 1:
+        data = data.mean(axis=1)
+    return data, sr
+
+def play_audio_local(audio: Union[str, bytes]) -> Optional[dict]:
+    """
+    Play an audio file or encoded audio bytes and wait until it finishes
+    
+    The caller can still cut playback short by speaking (see PlaybackManager).
+    
+    Returns:
+        Playback result with the fraction heard, or None on error
+    """
+    from utils.playback import PlaybackManager
     try:
-        data, sr = sf.read(path)
-        sd.play(data, sr)
-        sd.wait()
+        manager = PlaybackManager()
+        manager.play(audio)
+        return manager.wait()
     except Exception as e:
-        print(f"[Audio Playback Error] {e}")
+        logger.error("Audio playback error: %s", e)
+        return None
 
 class AudioProcessor:
-    def __init__(self, sample_rate: int = 16000):
+    def __init__(self, sample_rate: int = 16000, tts_backend: Optional[TTSBackend] = None):
         """
         Initialize the audio processor
         
         Args:
             sample_rate: Sampling rate in Hz (default: 16000)
+            tts_backend: Speech synthesis backend (default: selected by TTS_BACKEND)
         """
         self.sample_rate = sample_rate
-        self.temp_dir = tempfile.mkdtemp()
+        self.tts_backend = tts_backend or get_backend()
+        self.tts_cache = TTSCache()
+
+    @property
+    def tts_engine(self) -> str:
+        """Name of the TTS backend (part of the TTS cache key)"""
+        return self.tts_backend.name
 
-    def record_audio(self, duration: int = 5) -> Optional[str]:
+    @property
+    def tts_mime(self) -> str:
+        """MIME type of the audio returned by text_to_speech"""
+        return self.tts_backend.mime
+
+    def record_audio(self, duration: int = 5) -> Optional[np.ndarray]:
         """
         Record audio
         
@@ -35,101 +97,254 @@ class AudioProcessor:
             duration: Recording duration in seconds
             
         Returns:
-            Path to the recorded file
+            Float32 mono samples at `self.sample_rate`
         """
         try:
+            import sounddevice as sd
+
             # Record audio
-            recording = sd.rec(
-                int(duration * self.sample_rate),
-                samplerate=self.sample_rate,
-                channels=1
-            )
-            sd.wait()  # Wait for recording to complete
+            with span("record"):
+                recording = sd.rec(
+                    int(duration * self.sample_rate),
+                    samplerate=self.sample_rate,
+                    channels=1,
+                    dtype="float32"
+                )
+                sd.wait()  # Wait for recording to complete
             
-            # Save the recorded audio
-            temp_path = os.path.join(self.temp_dir, 'recording.wav')
-            sf.write(temp_path, recording, self.sample_rate)
+            return recording[:, 0]
+        except Exception as e:
+            logger.error("Recording error: %s", e)
+            return None
+
+    def record_speech(self, max_duration: float = 15.0, pre_roll_ms: int = 300,
+                      hangover_ms: int = 700, no_speech_timeout: float = 5.0,
+                      block_ms: int = 30,
+                      on_chunk: Optional[Callable[[np.ndarray], None]] = None) -> Optional[np.ndarray]:
+        """
+        Record a single utterance, stopping when the speaker goes quiet
+        
+        Audio is captured from a streaming input and run through an
+        energy/zero-crossing VAD; only the speech (plus pre-roll) is kept.
+        
+        Args:
+            max_duration: Maximum utterance length in seconds
+            pre_roll_ms: Audio kept from before the detected speech onset
+            hangover_ms: Trailing silence that ends the utterance
+            no_speech_timeout: Seconds to wait for speech before giving up
+            block_ms: Capture block size in milliseconds
+            on_chunk: Called with every captured block as it arrives (on the
+                calling thread), e.g. to feed a streaming recognizer
             
-            return temp_path
+        Returns:
+            Float32 mono samples at `self.sample_rate`, or None if nothing was said
+        """
+        endpointer = Endpointer(
+            EnergyVAD(sample_rate=self.sample_rate),
+            pre_roll_ms=pre_roll_ms,
+            hangover_ms=hangover_ms,
+            max_duration=max_duration,
+            no_speech_timeout=no_speech_timeout,
+        )
+        blocks: "queue.Queue" = queue.Queue()
+
+        def callback(indata, frames, time_info, status):
+            blocks.put(indata[:, 0].copy())
+
+        try:
+            import sounddevice as sd
+
+            with span("record"), sd.InputStream(
+                samplerate=self.sample_rate,
+                channels=1,
+                dtype="float32",
+                blocksize=int(self.sample_rate * block_ms / 1000),
+                callback=callback,
+            ):
+                # Safety net in case the callback stops delivering audio
+                deadline = max_duration + no_speech_timeout + 1.0
+                waited = 0.0
+                while waited < deadline:
+                    try:
+                        block = blocks.get(timeout=0.5)
+                    except queue.Empty:
+                        waited += 0.5
+                        continue
+                    waited += len(block) / self.sample_rate
+                    if on_chunk:
+                        on_chunk(block)
+                    if endpointer.process(block):
+                        break
+
+            return endpointer.audio()
         except Exception as e:
-            print(f"Recording error: {str(e)}")
+            logger.error("Recording error: %s", e)
             return None
 
-    def transcribe_audio(self, audio_file):
+    def transcribe_audio(self, audio: AudioInput, sample_rate: Optional[int] = None) -> str:
         """
         Transcription function using OmniASR.
+
+        Requests go to the resident ASR engine, which keeps the model loaded
+        between calls and falls back to a one-shot sherpa-onnx run on failure.
+        Input is converted to clean mono audio at `self.sample_rate` first
+        (see preprocess_audio) and decoded in memory; a file is only written
+        if the fallback path needs one.
+
+        Args:
+            audio: Path, encoded bytes, file-like object, or sample array
+            sample_rate: Rate of `audio` when it is a sample array
+                (default: `self.sample_rate`)
+
+        Returns:
+            Transcribed text
+        """
+        with span("preprocess"):
+            samples = self.preprocess_audio(audio, sample_rate)
+        if samples is None:
+            return ""
+        with span("asr"):
+            return get_engine().transcribe_samples(samples, self.sample_rate)
+
+    def record_and_transcribe(self, max_duration: float = 15.0,
+                              on_partial: Optional[Callable[[str], None]] = None,
+                              **record_kwargs) -> Tuple[Optional[np.ndarray], str]:
+        """
+        Record one utterance while transcribing it
+        
+        With a streaming model available, capture blocks are decoded as they
+        arrive and `on_partial` receives the running hypothesis. The final
+        transcript comes from transcribe_audio on the recording, unless
+        STREAMING_ASR_FINAL is set, in which case only the streaming model's
+        tail is left to decode at end of speech.
+        
+        Args:
+            max_duration: Maximum utterance length in seconds
+            on_partial: Called with each new partial transcript
+            **record_kwargs: Passed to record_speech
+            
+        Returns:
+            Tuple of (recorded samples or None, transcript)
         """
-        if isinstance(audio_file, str):
-            return transcribe_with_omni_asr(audio_file)
+        if not streaming_asr.is_available():
+            audio = self.record_speech(max_duration=max_duration, **record_kwargs)
+            return audio, (self.transcribe_audio(audio) if audio is not None else "")
+        
+        transcriber = streaming_asr.StreamingTranscriber(sample_rate=self.sample_rate)
         
-        temp_path = "temp_input.wav"
+        def feed(block):
+            text = transcriber.feed(block)
+            if text and on_partial:
+                on_partial(text)
+        
+        audio = self.record_speech(max_duration=max_duration, on_chunk=feed, **record_kwargs)
+        if audio is None:
+            return None, ""
+        if streaming_asr.FINAL_TRANSCRIPT:
+            return audio, transcriber.finalize()
+        # The streaming model may not know the caller's language; OmniASR does
+        return audio, self.transcribe_audio(audio)
 
-        # save uploaded file to disk
-        with open(temp_path, "wb") as f:
-            f.write(audio_file.read())
+    def transcribe_long_audio(self, audio_path: Union[str, io.IOBase]) -> dict:
+        """
+        Transcribe a long recording in parallel silence-bounded chunks
         
-        return transcribe_with_omni_asr(temp_path)
+        Args:
+            audio_path: Path to the audio file, or a seekable file-like object
+            
+        Returns:
+            {"text": full transcript, "segments": [{"start", "end", "text"}]}
+        """
+        return transcribe_long_audio(audio_path, target_sr=self.sample_rate)
 
+    @staticmethod
+    def is_long_audio(audio: AudioInput, sample_rate: Optional[int] = None) -> bool:
+        """
+        Whether audio is long enough to be worth chunked transcription
+        """
+        try:
+            if isinstance(audio, np.ndarray):
+                return len(audio) / sample_rate > LONG_AUDIO_SECONDS
+            if isinstance(audio, (bytes, bytearray)):
+                audio = io.BytesIO(audio)
+            with sf.SoundFile(audio) as f:
+                duration = f.frames / f.samplerate
+            if hasattr(audio, "seek"):
+                audio.seek(0)
+            return duration > LONG_AUDIO_SECONDS
+        except Exception:
+            return False
 
-    def text_to_speech(self, text: str, lang: str = 'zh') -> Optional[str]:
+    def text_to_speech(self, text: str, lang: Optional[str] = None) -> Optional[bytes]:
         """
         Convert text to speech
         
+        Rendered audio is served from the on-disk TTS cache when the same
+        text has been spoken before, skipping synthesis entirely.
+        
         Args:
             text: Text to convert
-            lang: Language code
+            lang: Language code (default: detected from the text, so replies
+                are spoken in the language the caller used)
             
         Returns:
-            Path to generated audio file
+            Encoded audio bytes in the backend's format (see `tts_mime`)
         """
         try:
-            tts = gTTS(text=text, lang=lang)
-            temp_path = os.path.join(self.temp_dir, 'response.mp3')
-            tts.save(temp_path)
-            return temp_path
+            lang = lang or detect_language(text)
+            ext = self.tts_backend.ext
+            with span("tts"):
+                cached = self.tts_cache.get(text, lang, self.tts_engine, ext=ext)
+                if cached:
+                    with open(cached, "rb") as f:
+                        return f.read()
+
+                data = self.tts_backend.synthesize(text, lang)
+                self.tts_cache.put(text, lang, self.tts_engine, data, ext=ext)
+                return data
         except Exception as e:
-            print(f"Text-to-speech error: {str(e)}")
+            logger.error("Text-to-speech error: %s", e)
             return None
 
-    def preprocess_audio(self, audio_path: str) -> Optional[str]:
+    def preprocess_audio(self, audio: AudioInput, sample_rate: Optional[int] = None,
+                         block_s: float = 10.0) -> Optional[np.ndarray]:
         """
-        Preprocess audio file (resampling, noise reduction, etc.)
+        Preprocess audio for ASR (downmix, resampling, DC removal, level normalization)
+        
+        Files are decoded and resampled block by block, so long inputs are
+        never held in memory at their original rate.
         
         Args:
-            audio_path: Input audio file path
+            audio: Path, encoded bytes, file-like object, or sample array
+            sample_rate: Rate of `audio` when it is a sample array
+                (default: `self.sample_rate`)
+            block_s: Decode block length in seconds for file input
             
         Returns:
-            Path to processed audio file
+            Float32 mono samples at `self.sample_rate`
         """
         try:
-            # Read audio file
-            data, sample_rate = sf.read(audio_path)
-            
-            # Convert stereo to mono if needed
-            if len(data.shape) > 1:
-                data = np.mean(data, axis=1)
-            
-            # Resample to target sample rate
-            if sample_rate != self.sample_rate:
-                # Resampling logic can be added here
-                pass
-            
-            # Save processed audio
-            processed_path = os.path.join(self.temp_dir, 'processed_audio.wav')
-            sf.write(processed_path, data, self.sample_rate)
-            
-            return processed_path
-        except Exception as e:
-            print(f"Audio preprocessing error: {str(e)}")
-            return None
+            if isinstance(audio, np.ndarray):
+                data, sr = load_audio(audio, sample_rate or self.sample_rate)
+                data = resample(data, sr, self.sample_rate)
+            else:
+                if isinstance(audio, (bytes, bytearray, memoryview)):
+                    audio = io.BytesIO(audio)
+                elif hasattr(audio, "seek"):
+                    audio.seek(0)
+                parts = []
+                with sf.SoundFile(audio) as f:
+                    resampler = Resampler(f.samplerate, self.sample_rate)
+                    blocksize = int(block_s * f.samplerate)
+                    for block in f.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+                        # Convert stereo to mono if needed
+                        mono = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+                        parts.append(resampler.process(mono))
+                    parts.append(resampler.flush())
+                data = np.concatenate(parts)
 
-    def cleanup(self):
-        """
-        Clean up temporary files
-        """
-        import shutil
-        try:
-            shutil.rmtree(self.temp_dir)
+            return normalize(data)
         except Exception as e:
-            print(f"Error cleaning temporary files: {str(e)}")
+            logger.error("Audio preprocessing error: %s", e)
+            return None
             
\ No newline at end of file
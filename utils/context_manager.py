@@ -0,0 +1,176 @@
+# utils/context_manager.py
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from langchain.schema import AIMessage, HumanMessage, SystemMessage
+
+CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "3000"))
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """
+Update the running summary of a customer conversation.
+Keep facts the assistant will need later: the customer's issue or needs, names, contact details,
+order or account numbers, commitments made, and open questions. Be brief.
+
+Current summary:
+{summary}
+
+New conversation lines:
+{lines}
+
+Updated summary:
+"""
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when available, else estimate ~4 chars per token."""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+class ConversationContext:
+    def __init__(self, chat, token_budget: int = CONTEXT_TOKENS, min_recent: int = 4):
+        """
+        Keep the prompt for a conversation within a token budget
+
+        Recent turns are sent verbatim; when they no longer fit, the oldest
+        ones are folded into a running summary that is updated incrementally
+        (only the newly folded lines are sent to the summarizer). Converted
+        message objects and their token counts are cached, so each turn only
+        processes what is new in the history.
+
+        Args:
+            chat: LangChain chat model used for summarization
+            token_budget: Maximum prompt tokens (system + summary + history + input)
+            min_recent: Messages always kept verbatim, even over budget
+        """
+        self.chat = chat
+        self.token_budget = token_budget
+        self.min_recent = min_recent
+        self.summary = ""
+        self.summary_tokens = 0
+        self.last_prompt_tokens = 0
+        self._messages: List[Any] = []  # verbatim, not yet summarized
+        self._tokens: List[int] = []
+        self._synced = 0                # history entries consumed so far
+        self._last_entry: Optional[Dict[str, str]] = None
+
+    def reset(self) -> None:
+        self.summary = ""
+        self.summary_tokens = 0
+        self._messages = []
+        self._tokens = []
+        self._synced = 0
+        self._last_entry = None
+
+    def sync(self, history: List[Dict[str, str]]) -> None:
+        """
+        Convert history entries added since the last call
+        """
+        # The history was cleared or replaced: start over
+        if len(history) < self._synced or (
+            self._synced and history[self._synced - 1] != self._last_entry
+        ):
+            self.reset()
+
+        for entry in history[self._synced:]:
+            if entry["role"] == "user":
+                message = HumanMessage(content=entry["content"])
+            elif entry["role"] == "assistant":
+                message = AIMessage(content=entry["content"])
+            else:
+                continue
+            self._messages.append(message)
+            self._tokens.append(count_tokens(entry["content"]) + 4)
+
+        self._synced = len(history)
+        self._last_entry = dict(history[-1]) if history else None
+
+    def amend_last(self, history: List[Dict[str, str]]) -> None:
+        """
+        Pick up an in-place edit of the newest history entry
+
+        Without this, editing the last entry looks like a replaced history and
+        forces a full rebuild (and re-summarization).
+        """
+        if not history or self._synced != len(history) or not self._messages:
+            return
+        entry = history[-1]
+        if entry["role"] != "assistant" or not isinstance(self._messages[-1], AIMessage):
+            return
+        self._messages[-1] = AIMessage(content=entry["content"])
+        self._tokens[-1] = count_tokens(entry["content"]) + 4
+        self._last_entry = dict(entry)
+
+    def build(self, system_content: str, prompt: str,
+              history: Optional[List[Dict[str, str]]] = None) -> List[Any]:
+        """
+        Build the message list for a turn within the token budget
+
+        Args:
+            system_content: System prompt
+            prompt: Current user input
+            history: Conversation history (append-only list of role/content dicts)
+
+        Returns:
+            LangChain messages: system, optional summary, recent turns, input
+        """
+        if history is not None:
+            self.sync(history)
+
+        fixed = count_tokens(system_content) + count_tokens(prompt) + 8
+        if self._over_budget(fixed):
+            self._fold(fixed)
+
+        messages = [SystemMessage(content=system_content)]
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        messages.extend(self._messages)
+        messages.append(HumanMessage(content=prompt))
+
+        self.last_prompt_tokens = fixed + self.summary_tokens + sum(self._tokens)
+        return messages
+
+    def _over_budget(self, fixed: int) -> bool:
+        return fixed + self.summary_tokens + sum(self._tokens) > self.token_budget
+
+    def _fold(self, fixed: int) -> None:
+        # Fold down to 75% of the budget so we do not summarize on every turn
+        target = int(self.token_budget * 0.75)
+        count = 0
+        total = fixed + self.summary_tokens + sum(self._tokens)
+        while total > target and len(self._messages) - count > self.min_recent:
+            total -= self._tokens[count]
+            count += 1
+        if not count:
+            return
+
+        folded, self._messages = self._messages[:count], self._messages[count:]
+        self._tokens = self._tokens[count:]
+        lines = "\n".join(
+            f"{'Customer' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}" for m in folded
+        )
+        try:
+            response = self.chat([HumanMessage(content=SUMMARY_PROMPT.format(
+                summary=self.summary or "(none)", lines=lines
+            ))])
+            self.summary = response.content.strip()
+        except Exception as e:
+            # Keep the turns rather than lose them if summarization fails
+            logger.warning("Context summarization failed, keeping the turns verbatim: %s", e)
+            self.summary = f"{self.summary}\n{lines}".strip()
+        self.summary_tokens = count_tokens(self.summary) + 8
@@ -0,0 +1,442 @@
+# utils/conversation_analysis.py
+"""
+Structured, incremental conversation analysis.
+
+A conversation is split into segments of about SEGMENT_TOKENS. Each segment
+is extracted on its own (map) into the ConversationAnalysis schema, with the
+map calls running concurrently, and the partial extractions are merged into
+one (reduce). Segment boundaries are fixed from the start of the
+conversation, so new turns only change the last segment: extractions of
+earlier segments are cached and re-analyzing a growing conversation costs
+one map call plus the reduce.
+
+Requests go through utils.openai_async at batch priority, so analysis yields
+to live calls. A day's calls from the conversation store can be analyzed and
+aggregated in one run:
+
+    python -m utils.conversation_analysis --mode lead_generation --since 2026-10-16 --output day.jsonl
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from utils.context_manager import count_tokens
+from utils.openai_async import chat_completion, run_sync
+from utils.rate_limit import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_TOKENS = int(os.getenv("ANALYSIS_SEGMENT_TOKENS", "1500"))
+MAP_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "8"))
+CACHE_SEGMENTS = int(os.getenv("ANALYSIS_CACHE_SEGMENTS", "4096"))
+# Bump when the prompts or schema change, so cached extractions are not reused
+PROMPT_VERSION = "1"
+
+SENTIMENTS = ("positive", "neutral", "negative", "mixed", "unknown")
+QUALIFICATIONS = ("hot", "warm", "cold", "unknown")
+
+
+class LeadInfo(BaseModel):
+    name: Optional[str] = None
+    company: Optional[str] = None
+    contact: Optional[str] = None
+    budget: Optional[str] = None
+    timeline: Optional[str] = None
+    products: List[str] = Field(default_factory=list)
+    decision_maker: Optional[bool] = None
+    qualification: str = "unknown"
+
+    @field_validator("qualification", mode="before")
+    @classmethod
+    def _qualification(cls, value):
+        value = str(value or "unknown").strip().lower()
+        return value if value in QUALIFICATIONS else "unknown"
+
+
+class ConversationAnalysis(BaseModel):
+    summary: str = ""
+    needs: List[str] = Field(default_factory=list)
+    sentiment: str = "unknown"
+    sentiment_score: Optional[float] = None  # -1 (negative) to 1 (positive)
+    key_points: List[str] = Field(default_factory=list)
+    lead: LeadInfo = Field(default_factory=LeadInfo)
+    next_actions: List[str] = Field(default_factory=list)
+
+    @field_validator("sentiment", mode="before")
+    @classmethod
+    def _sentiment(cls, value):
+        value = str(value or "unknown").strip().lower()
+        return value if value in SENTIMENTS else "unknown"
+
+    @field_validator("sentiment_score")
+    @classmethod
+    def _score(cls, value):
+        return None if value is None else max(-1.0, min(1.0, value))
+
+
+_SCHEMA = json.dumps(ConversationAnalysis.model_json_schema(), separators=(",", ":"))
+
+SYSTEM_PROMPT = (
+    "You are a professional conversation analysis expert, capable of extracting key information "
+    "from conversations. Reply with a single JSON object that follows this JSON schema:\n" + _SCHEMA
+)
+
+MAP_PROMPT = """
+Analyze part {part} of a conversation between a customer and an assistant.
+Extract only what this part says:
+- needs: the customer's main issues or needs
+- sentiment and sentiment_score (-1 to 1): the customer's emotional state
+- key_points: key information such as product interest or budget considerations
+- lead: contact and qualification details the customer gave
+- next_actions: suggested follow-up actions
+Leave fields empty or null when this part does not mention them.
+
+Conversation part:
+{lines}
+"""
+
+REDUCE_PROMPT = """
+Below are analyses of consecutive parts of one conversation, in order.
+Merge them into one analysis of the whole conversation: combine and
+deduplicate the lists, prefer later parts for lead details and for the
+customer's current sentiment, and write a summary of the whole conversation.
+
+Part analyses:
+{parts}
+"""
+
+
+def _lines(messages: List[Dict[str, str]]) -> str:
+    return "\n".join(
+        f"{'Customer' if m['role'] == 'user' else 'Assistant'}: {m['content']}" for m in messages
+    )
+
+
+def parse_analysis(content: str) -> Optional[ConversationAnalysis]:
+    """
+    Parse a model reply into the schema
+
+    Returns:
+        The analysis, or None if the reply holds no valid JSON object
+    """
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        return None
+    try:
+        return ConversationAnalysis.model_validate_json(content[start:end + 1])
+    except ValidationError as e:
+        logger.warning("Analysis reply does not match the schema: %s", e.errors()[:3])
+        return None
+
+
+def _dedupe(items: Iterable[str]) -> List[str]:
+    seen, out = set(), []
+    for item in items:
+        key = item.strip().lower()
+        if key and key not in seen:
+            seen.add(key)
+            out.append(item.strip())
+    return out
+
+
+def merge_analyses(parts: List[ConversationAnalysis]) -> ConversationAnalysis:
+    """
+    Merge part analyses without a model call (fallback for the reduce step)
+
+    Lists are combined in order, later parts win for lead details and
+    sentiment, and sentiment scores are averaged.
+    """
+    lead = LeadInfo()
+    for part in parts:
+        for field, value in part.lead.model_dump().items():
+            if field == "products":
+                lead.products = _dedupe(lead.products + value)
+            elif value not in (None, "", "unknown"):
+                setattr(lead, field, value)
+    scores = [p.sentiment_score for p in parts if p.sentiment_score is not None]
+    sentiments = [p.sentiment for p in parts if p.sentiment != "unknown"]
+    return ConversationAnalysis(
+        summary=" ".join(p.summary for p in parts if p.summary),
+        needs=_dedupe(n for p in parts for n in p.needs),
+        sentiment=sentiments[-1] if sentiments else "unknown",
+        sentiment_score=sum(scores) / len(scores) if scores else None,
+        key_points=_dedupe(k for p in parts for k in p.key_points),
+        lead=lead,
+        next_actions=_dedupe(a for p in parts for a in p.next_actions),
+    )
+
+
+class ConversationAnalyzer:
+    def __init__(self, model_name: str = "gpt-3.5-turbo", segment_tokens: int = SEGMENT_TOKENS,
+                 concurrency: int = MAP_CONCURRENCY, cache_size: int = CACHE_SEGMENTS,
+                 priority: int = PRIORITY_BATCH):
+        """
+        Map-reduce conversation analyzer with per-segment caching
+
+        Args:
+            model_name: Model used for extraction
+            segment_tokens: Target size of a segment (one map call)
+            concurrency: Map calls in flight per conversation
+            cache_size: Segment extractions kept in memory
+            priority: Limiter priority for the requests
+        """
+        self.model_name = model_name
+        self.segment_tokens = segment_tokens
+        self.concurrency = concurrency
+        self.cache_size = cache_size
+        self.priority = priority
+        self._cache: "OrderedDict[str, ConversationAnalysis]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"map_calls": 0, "reduce_calls": 0, "cache_hits": 0}
+
+    def segments(self, conversation_history: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+        """
+        Split a conversation into segments of about `segment_tokens`
+
+        Boundaries depend only on the messages before them, so appending
+        turns never moves an earlier boundary.
+        """
+        segments: List[List[Dict[str, str]]] = []
+        current: List[Dict[str, str]] = []
+        tokens = 0
+        for message in conversation_history:
+            size = count_tokens(message["content"]) + 4
+            if current and tokens + size > self.segment_tokens:
+                segments.append(current)
+                current, tokens = [], 0
+            current.append(message)
+            tokens += size
+        if current:
+            segments.append(current)
+        return segments
+
+    def _key(self, *parts: str) -> str:
+        digest = hashlib.sha1()
+        for part in (self.model_name, PROMPT_VERSION, *parts):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _cached(self, key: str) -> Optional[ConversationAnalysis]:
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+            return result
+
+    def _remember(self, key: str, result: ConversationAnalysis) -> None:
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def _complete(self, prompt: str, priority: int) -> str:
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+        return await chat_completion(messages, self.model_name, 0.0, priority=priority,
+                                     response_format={"type": "json_object"})
+
+    async def _map(self, index: int, segment: List[Dict[str, str]],
+                   semaphore: asyncio.Semaphore, priority: int) -> Tuple[str, ConversationAnalysis]:
+        lines = _lines(segment)
+        key = self._key("map", str(index), lines)
+        cached = self._cached(key)
+        if cached is not None:
+            return key, cached
+        async with semaphore:
+            self.stats["map_calls"] += 1
+            content = await self._complete(MAP_PROMPT.format(part=index + 1, lines=lines), priority)
+        result = parse_analysis(content)
+        if result is None:
+            # Keep the text, but do not cache it so the segment is retried
+            return key, ConversationAnalysis(summary=content.strip())
+        self._remember(key, result)
+        return key, result
+
+    async def analyze(self, conversation_history: List[Dict[str, str]],
+                      priority: Optional[int] = None) -> ConversationAnalysis:
+        """
+        Analyze a conversation, reusing cached segment extractions
+
+        Args:
+            conversation_history: Conversation history
+            priority: Limiter priority (default: the analyzer's)
+
+        Returns:
+            Structured analysis of the whole conversation
+        """
+        segments = self.segments(conversation_history)
+        if not segments:
+            return ConversationAnalysis()
+        priority = self.priority if priority is None else priority
+        semaphore = asyncio.Semaphore(self.concurrency)
+        mapped = await asyncio.gather(*(self._map(i, s, semaphore, priority) for i, s in enumerate(segments)))
+        if len(mapped) == 1:
+            return mapped[0][1]
+
+        key = self._key("reduce", *(k for k, _ in mapped))
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        parts = [result for _, result in mapped]
+        self.stats["reduce_calls"] += 1
+        content = await self._complete(REDUCE_PROMPT.format(
+            parts="\n".join(p.model_dump_json(exclude_defaults=True) for p in parts)), priority)
+        result = parse_analysis(content)
+        if result is None:
+            return merge_analyses(parts)
+        self._remember(key, result)
+        return result
+
+    def analyze_sync(self, conversation_history: List[Dict[str, str]]) -> ConversationAnalysis:
+        """
+        Blocking `analyze` for synchronous callers (the Streamlit app)
+
+        Runs on the shared background loop, so repeated analyses reuse its
+        connection pool and rate limiter; async code should await `analyze`.
+        """
+        return run_sync(self.analyze(conversation_history))
+
+
+def aggregate(results: Iterable[ConversationAnalysis], top: int = 10) -> dict:
+    """
+    Summarize many analyses (e.g. a day's calls)
+
+    Returns:
+        Dictionary with conversation count, sentiment and lead qualification
+        distributions, mean sentiment score, and the most common needs,
+        products and next actions
+    """
+    count = 0
+    sentiments: Counter = Counter()
+    qualifications: Counter = Counter()
+    needs: Counter = Counter()
+    products: Counter = Counter()
+    actions: Counter = Counter()
+    scores = []
+    for result in results:
+        count += 1
+        sentiments[result.sentiment] += 1
+        qualifications[result.lead.qualification] += 1
+        needs.update({_normalize(n) for n in result.needs})
+        products.update({_normalize(p) for p in result.lead.products})
+        actions.update({_normalize(a) for a in result.next_actions})
+        if result.sentiment_score is not None:
+            scores.append(result.sentiment_score)
+    return {
+        "conversations": count,
+        "sentiment": dict(sentiments),
+        "mean_sentiment_score": round(sum(scores) / len(scores), 3) if scores else None,
+        "qualification": dict(qualifications),
+        "top_needs": needs.most_common(top),
+        "top_products": products.most_common(top),
+        "top_next_actions": actions.most_common(top),
+    }
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^\w\s]", "", text.lower()).strip()
+
+
+async def analyze_store(analyzer: ConversationAnalyzer, store, mode: Optional[str] = None,
+                        since: Optional[float] = None, until: Optional[float] = None,
+                        concurrency: int = 16, on_result=None) -> dict:
+    """
+    Analyze every stored conversation in a time window and aggregate them
+
+    Conversations are streamed from the store and analyzed `concurrency` at
+    a time.
+
+    Args:
+        analyzer: Conversation analyzer
+        store: ConversationStore to scan
+        mode: Only conversations in this bot mode
+        since: Start of the window (Unix time)
+        until: End of the window (Unix time)
+        concurrency: Conversations analyzed at once
+        on_result: Called with (session_id, analysis) as each finishes
+
+    Returns:
+        Aggregate (see `aggregate`)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[ConversationAnalysis] = []
+    failures = 0
+
+    async def run(session_id: str, messages: List[Dict[str, str]]) -> None:
+        nonlocal failures
+        try:
+            result = await analyzer.analyze(messages)
+        except Exception as e:
+            failures += 1
+            logger.error("Analysis of %s failed: %s", session_id, e)
+            return
+        finally:
+            semaphore.release()
+        results.append(result)
+        if on_result is not None:
+            on_result(session_id, result)
+
+    tasks = []
+    for session_id, messages in store.scan(mode, since, until):
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(run(session_id, messages)))
+    await asyncio.gather(*tasks)
+    summary = aggregate(results)
+    summary["failed"] = failures
+    return summary
+
+
+def _timestamp(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    from utils.conversation_store import get_store
+
+    parser = argparse.ArgumentParser(description="Analyze stored conversations and aggregate the results")
+    parser.add_argument("--mode", default=None)
+    parser.add_argument("--since", default=None, help="ISO date/time or Unix time (default: 24 hours ago)")
+    parser.add_argument("--until", default=None, help="ISO date/time or Unix time")
+    parser.add_argument("--output", default=None, help="Write one analysis per conversation as JSONL")
+    parser.add_argument("--concurrency", type=int, default=16, help="Conversations analyzed at once")
+    parser.add_argument("--model", default=os.getenv("LLM_MODEL", "gpt-3.5-turbo"))
+    args = parser.parse_args()
+
+    since = _timestamp(args.since) if args.since else time.time() - 86400
+    until = _timestamp(args.until) if args.until else None
+    analyzer = ConversationAnalyzer(model_name=args.model)
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+
+    def write(session_id: str, result: ConversationAnalysis) -> None:
+        if out is not None:
+            out.write(json.dumps({"session_id": session_id, **result.model_dump()}, ensure_ascii=False) + "\n")
+
+    start = time.perf_counter()
+    try:
+        summary = asyncio.run(analyze_store(analyzer, get_store(), args.mode, since, until,
+                                            args.concurrency, on_result=write))
+    finally:
+        if out is not None:
+            out.close()
+    summary["elapsed_s"] = round(time.perf_counter() - start, 2)
+    summary.update(analyzer.stats)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
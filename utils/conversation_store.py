@@ -0,0 +1,413 @@
+# utils/conversation_store.py
+"""
+Durable, append-only conversation store.
+
+Every user and assistant message is a row in one `turns` table, indexed by
+(session_id, seq) for reading a call back, by created_at for time windows,
+and by (mode, created_at) for per-mode analysis. Writes are queued and
+committed in batches by a background thread, so a turn never waits on disk;
+reads of a session merge rows still in the queue, so they always see the
+latest turns.
+
+Rows are never updated. When the caller interrupts a reply, a "heard" row
+holding the part that was actually played is appended after it, and readers
+show that text in place of the full reply.
+
+The default database is a local SQLite file (CONVERSATION_DB_URL, default
+~/.local/share/voice-bot/conversations.db); any SQLAlchemy URL works.
+
+    python -m utils.conversation_store stats
+    python -m utils.conversation_store export calls.jsonl --mode lead_generation
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, Float, Index, Integer, MetaData, String, Table, Text,
+    create_engine, event, func, insert, select,
+)
+
+logger = logging.getLogger(__name__)
+
+DB_URL = os.getenv(
+    "CONVERSATION_DB_URL",
+    "sqlite:///" + os.path.expanduser("~/.local/share/voice-bot/conversations.db"),
+)
+BATCH_SIZE = int(os.getenv("CONVERSATION_BATCH_SIZE", "256"))
+FLUSH_INTERVAL = float(os.getenv("CONVERSATION_FLUSH_INTERVAL", "0.25"))
+# Sessions whose next sequence number is kept in memory (least recent dropped)
+SEQ_CACHE_SIZE = int(os.getenv("CONVERSATION_SEQ_CACHE", "10000"))
+MAX_WRITE_ATTEMPTS = 3
+
+metadata = MetaData()
+
+turns = Table(
+    "turns",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("session_id", String(64), nullable=False),
+    Column("seq", Integer, nullable=False),
+    Column("role", String(16), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("mode", String(32)),
+    Column("created_at", Float, nullable=False),
+    Index("ix_turns_session_seq", "session_id", "seq"),
+    Index("ix_turns_created_at", "created_at"),
+    Index("ix_turns_mode_created_at", "mode", "created_at"),
+)
+
+_STOP = object()
+
+# Role of the rows that amend the previous assistant message after barge-in
+HEARD_ROLE = "heard"
+
+
+def _as_message(row) -> Dict[str, str]:
+    return {"role": row.role, "content": row.content}
+
+
+def _apply_heard(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Fold "heard" rows into the assistant message they amend."""
+    folded: List[Dict[str, str]] = []
+    for message in messages:
+        if message["role"] != HEARD_ROLE:
+            folded.append(message)
+        elif folded and folded[-1]["role"] == "assistant":
+            folded[-1] = {"role": "assistant", "content": message["content"]}
+    return folded
+
+
+class ConversationStore:
+    def __init__(self, url: str = DB_URL, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL):
+        """
+        Initialize the conversation store
+
+        Args:
+            url: SQLAlchemy database URL
+            batch_size: Maximum rows per write transaction
+            flush_interval: Seconds the writer waits to fill a batch
+        """
+        if url.startswith("sqlite:///"):
+            os.makedirs(os.path.dirname(os.path.abspath(url[len("sqlite:///"):])), exist_ok=True)
+        self.engine = create_engine(url)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", _sqlite_pragmas)
+        metadata.create_all(self.engine)
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[dict]] = {}  # queued, not yet committed
+        self._next_seq: "OrderedDict[str, int]" = OrderedDict()
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-store", daemon=True)
+        self._writer.start()
+
+    def append(self, session_id: str, role: str, content: str, mode: Optional[str] = None) -> None:
+        """
+        Queue one message for writing (returns immediately)
+
+        Args:
+            session_id: Conversation (call) identifier
+            role: "user" or "assistant"
+            content: Message text
+            mode: Bot mode at the time of the message
+        """
+        with self._lock:
+            known = session_id in self._next_seq
+            pending = self._pending.get(session_id)
+            queued_max = pending[-1]["seq"] if pending else -1
+        if not known:
+            # Seeded outside the lock so other sessions' writes do not wait on it.
+            # Rows queued before the query may commit while it runs: count them too.
+            stored_max = self._max_seq(session_id)
+        with self._lock:
+            if session_id not in self._next_seq:
+                pending = self._pending.get(session_id)
+                self._next_seq[session_id] = max(
+                    stored_max, queued_max, pending[-1]["seq"] if pending else -1) + 1
+            self._next_seq.move_to_end(session_id)
+            while len(self._next_seq) > SEQ_CACHE_SIZE:
+                self._next_seq.popitem(last=False)
+            row = {
+                "session_id": session_id,
+                "seq": self._next_seq[session_id],
+                "role": role,
+                "content": content,
+                "mode": mode,
+                "created_at": time.time(),
+            }
+            self._next_seq[session_id] += 1
+            self._pending.setdefault(session_id, []).append(row)
+        self._queue.put(row)
+
+    def begin(self, session_id: str) -> None:
+        """
+        Register a new conversation, so its first append skips the sequence query
+
+        Args:
+            session_id: Freshly generated identifier with no stored messages
+        """
+        with self._lock:
+            self._next_seq.setdefault(session_id, 0)
+
+    def forget(self, session_id: str) -> None:
+        """
+        Drop the in-memory state of a finished conversation
+
+        A later append to the same session seeds its sequence from the database.
+        """
+        with self._lock:
+            self._next_seq.pop(session_id, None)
+
+    def note_heard(self, session_id: str, content: str, mode: Optional[str] = None) -> None:
+        """
+        Record that only part of the last assistant reply was heard
+
+        Args:
+            session_id: Conversation (call) identifier
+            content: Replacement text for the reply (the heard part and a note)
+            mode: Bot mode at the time of the message
+        """
+        self.append(session_id, HEARD_ROLE, content, mode=mode)
+
+    def _max_seq(self, session_id: str) -> int:
+        with self.engine.connect() as conn:
+            value = conn.execute(
+                select(func.max(turns.c.seq)).where(turns.c.session_id == session_id)
+            ).scalar()
+        return -1 if value is None else value
+
+    def recent(self, session_id: str, n: int = 20) -> List[Dict[str, str]]:
+        """
+        Last `n` messages of a session, oldest first
+
+        Interrupted replies are returned as heard (see note_heard).
+
+        Returns:
+            List of {"role", "content"} dictionaries
+        """
+        with self._lock:
+            pending = list(self._pending.get(session_id, []))
+        stored: List[Dict[str, str]] = []
+        missing = n - sum(r["role"] != HEARD_ROLE for r in pending)
+        if missing > 0:
+            # Queued rows are newer than anything committed for this session
+            below = pending[0]["seq"] if pending else None
+            in_session = [turns.c.session_id == session_id]
+            if below is not None:
+                in_session.append(turns.c.seq < below)
+            stmt = (select(turns.c.seq, turns.c.role, turns.c.content)
+                    .where(*in_session, turns.c.role != HEARD_ROLE)
+                    .order_by(turns.c.seq.desc(), turns.c.id.desc()).limit(missing))
+            with self.engine.connect() as conn:
+                rows = list(conn.execute(stmt))
+                if rows:
+                    # Amendments to the fetched replies, wherever they fell
+                    heard = select(turns.c.seq, turns.c.role, turns.c.content).where(
+                        *in_session, turns.c.role == HEARD_ROLE, turns.c.seq > rows[-1].seq)
+                    rows += list(conn.execute(heard))
+            stored = [_as_message(row) for row in sorted(rows, key=lambda r: r.seq)]
+        queued = [{"role": r["role"], "content": r["content"]} for r in pending]
+        return _apply_heard(stored + queued)[-n:] if n > 0 else []
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        """
+        Every message of a session, oldest first
+        """
+        self.flush()
+        stmt = (select(turns.c.role, turns.c.content)
+                .where(turns.c.session_id == session_id)
+                .order_by(turns.c.seq, turns.c.id))
+        with self.engine.connect() as conn:
+            return _apply_heard([_as_message(row) for row in conn.execute(stmt)])
+
+    def _window(self, mode: Optional[str], since: Optional[float], until: Optional[float]):
+        conditions = []
+        if mode is not None:
+            conditions.append(turns.c.mode == mode)
+        if since is not None:
+            conditions.append(turns.c.created_at >= since)
+        if until is not None:
+            conditions.append(turns.c.created_at < until)
+        return conditions
+
+    def sessions(self, mode: Optional[str] = None, since: Optional[float] = None,
+                 until: Optional[float] = None, limit: Optional[int] = None) -> List[dict]:
+        """
+        Sessions with activity matching the filters, most recent first
+
+        Returns:
+            List of {"session_id", "turns", "started_at", "last_at"}
+        """
+        self.flush()
+        stmt = (select(turns.c.session_id,
+                       func.count().label("turns"),
+                       func.min(turns.c.created_at).label("started_at"),
+                       func.max(turns.c.created_at).label("last_at"))
+                .where(*self._window(mode, since, until))
+                .group_by(turns.c.session_id)
+                .order_by(func.max(turns.c.created_at).desc()))
+        if limit:
+            stmt = stmt.limit(limit)
+        with self.engine.connect() as conn:
+            return [dict(row._mapping) for row in conn.execute(stmt)]
+
+    def scan(self, mode: Optional[str] = None, since: Optional[float] = None,
+             until: Optional[float] = None, batch_size: int = 1000) -> Iterator[Tuple[str, List[Dict[str, str]]]]:
+        """
+        Stream whole conversations for bulk analysis
+
+        Sessions with any message matching the filters are returned complete,
+        one at a time, while rows are fetched from the database in batches, so
+        memory stays bounded by the largest single conversation.
+
+        Yields:
+            Tuples of (session_id, messages oldest first)
+        """
+        self.flush()
+        stmt = select(turns.c.session_id, turns.c.role, turns.c.content)
+        conditions = self._window(mode, since, until)
+        if conditions:
+            matching = select(turns.c.session_id).where(*conditions).distinct()
+            stmt = stmt.where(turns.c.session_id.in_(matching))
+        stmt = stmt.order_by(turns.c.session_id, turns.c.seq, turns.c.id)
+
+        with self.engine.connect() as conn:
+            result = conn.execution_options(yield_per=batch_size).execute(stmt)
+            current, messages = None, []
+            for row in result:
+                if row.session_id != current:
+                    if current is not None:
+                        yield current, _apply_heard(messages)
+                    current, messages = row.session_id, []
+                messages.append(_as_message(row))
+            if current is not None:
+                yield current, _apply_heard(messages)
+
+    def stats(self) -> dict:
+        self.flush()
+        with self.engine.connect() as conn:
+            row = conn.execute(select(func.count(), func.count(turns.c.session_id.distinct()))).one()
+        return {"turns": row[0], "sessions": row[1], "queued": self._queue.qsize()}
+
+    def flush(self, timeout: Optional[float] = 10.0) -> None:
+        """
+        Wait until every queued message has been written
+        """
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        """
+        Write everything still queued and stop the writer
+        """
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=10)
+        self.engine.dispose()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or waiters or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _write(self, batch: List[dict]) -> None:
+        for attempt in range(1, MAX_WRITE_ATTEMPTS + 1):
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(insert(turns), batch)
+                break
+            except Exception as e:
+                if attempt == MAX_WRITE_ATTEMPTS:
+                    logger.error("Dropping %d conversation rows after %d attempts: %s",
+                                 len(batch), attempt, e)
+                else:
+                    logger.warning("Conversation write failed (%s), retrying", e)
+                    time.sleep(0.1 * attempt)
+        with self._lock:
+            for row in batch:
+                pending = self._pending.get(row["session_id"])
+                if pending:
+                    pending.remove(row)
+                    if not pending:
+                        del self._pending[row["session_id"]]
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run while the writer commits; NORMAL sync is safe with WAL
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ConversationStore:
+    """Return the process-wide conversation store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ConversationStore()
+            atexit.register(_store.close)
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation store maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Show row and session counts")
+    export = sub.add_parser("export", help="Write conversations as JSONL")
+    export.add_argument("output")
+    export.add_argument("--mode", default=None)
+    export.add_argument("--since", type=float, default=None, help="Unix time")
+    export.add_argument("--until", type=float, default=None, help="Unix time")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.command == "stats":
+        print(json.dumps(store.stats()))
+    else:
+        count = 0
+        with open(args.output, "w", encoding="utf-8") as f:
+            for session_id, messages in store.scan(args.mode, args.since, args.until):
+                f.write(json.dumps({"session_id": session_id, "messages": messages}, ensure_ascii=False) + "\n")
+                count += 1
+        print(f"Exported {count} conversation(s) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
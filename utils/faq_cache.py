@@ -0,0 +1,343 @@
+# utils/faq_cache.py
+"""
+Local FAQ answer cache for customer-service mode.
+
+Questions are normalized and embedded as hashed character n-gram (3-5)
+TF-IDF vectors in NumPy; a new question is answered from the cache when its
+cosine similarity to a known question reaches FAQ_THRESHOLD, skipping the
+LLM round trip. The answers' speech is pre-rendered into the TTS cache, so a
+hit is spoken without synthesis as well. Replies are voiced in the language of
+the caller's question, so each answer is rendered in the language(s) of the
+questions it is stored under (or in the languages given to `warmup --lang`).
+
+Approved answers are loaded from FAQ_FILE (default faq.json):
+
+    [
+      {"questions": ["What are your opening hours?", "When are you open?"],
+       "answer": "We are open from nine to five, Monday to Friday."}
+    ]
+
+With FAQ_LEARN=1, answers the LLM gives to a conversation's opening
+question are added as well; those expire after FAQ_TTL seconds and at most
+FAQ_MAX_ENTRIES of them are kept (least recently used evicted first).
+
+    python -m utils.faq_cache warmup [--lang en --lang es]
+    python -m utils.faq_cache query "when are you open"
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.language import detect_language
+from utils.metrics import observe
+
+logger = logging.getLogger(__name__)
+
+FAQ_FILE = os.getenv("FAQ_FILE", "faq.json")
+# High on purpose: a wrong canned answer costs more than an LLM round trip.
+# List several phrasings per answer in FAQ_FILE rather than lowering it.
+THRESHOLD = float(os.getenv("FAQ_THRESHOLD", "0.8"))
+TTL = float(os.getenv("FAQ_TTL", "86400"))
+MAX_ENTRIES = int(os.getenv("FAQ_MAX_ENTRIES", "2000"))
+LEARN = os.getenv("FAQ_LEARN", "0") == "1"
+
+DIM = 4096  # hashed feature space
+NGRAM_SIZES = (3, 4, 5)
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _NON_WORD.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def ngram_vector(normalized: str, dim: int = DIM) -> np.ndarray:
+    """
+    Sublinear term frequencies of the hashed character n-grams of a question
+    """
+    padded = f" {normalized} "
+    hashes = [
+        zlib.crc32(padded[i:i + n].encode("utf-8")) % dim
+        for n in NGRAM_SIZES
+        for i in range(len(padded) - n + 1)
+    ]
+    counts = np.bincount(np.asarray(hashes, dtype=np.int64), minlength=dim).astype(np.float32)
+    nonzero = counts > 0
+    counts[nonzero] = 1.0 + np.log(counts[nonzero])
+    return counts
+
+
+class _Entry:
+    def __init__(self, question: str, answer: str, vector: np.ndarray,
+                 expires_at: Optional[float]):
+        self.question = question
+        self.answer = answer
+        self.vector = vector
+        self.expires_at = expires_at  # None for approved entries
+        self.last_used = time.monotonic()
+
+
+class FAQCache:
+    def __init__(self, threshold: float = THRESHOLD, ttl: float = TTL,
+                 max_entries: int = MAX_ENTRIES, dim: int = DIM):
+        """
+        Similarity index over known questions and their answers
+
+        Args:
+            threshold: Minimum cosine similarity to serve a cached answer
+            ttl: Lifetime (s) of learned entries; 0 keeps them until evicted
+            max_entries: Maximum learned entries (approved ones are not counted)
+            dim: Size of the hashed n-gram space
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.dim = dim
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: Dict[str, _Entry] = {}  # normalized question -> entry
+        self._lock = threading.Lock()
+        self._index: Optional[Tuple[List[_Entry], np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, question: str, answer: str, ttl: Optional[float] = None) -> None:
+        """
+        Add or replace a question/answer pair
+
+        Args:
+            question: Question text
+            answer: Answer to serve
+            ttl: Lifetime in seconds; None adds a permanent (approved) entry
+        """
+        normalized = normalize_question(question)
+        if not normalized or not answer.strip():
+            return
+        if ttl is None:
+            expires_at = None
+        elif ttl > 0:
+            expires_at = time.monotonic() + ttl
+        else:
+            expires_at = math.inf  # learned, but kept until evicted
+        with self._lock:
+            previous = self._entries.get(normalized)
+            if previous is not None and previous.expires_at is None and expires_at is not None:
+                return  # never let a learned answer replace an approved one
+            self._entries[normalized] = _Entry(question, answer.strip(),
+                                               ngram_vector(normalized, self.dim), expires_at)
+            self._index = None
+            self._evict_learned()
+
+    def learn(self, question: str, answer: str) -> None:
+        """
+        Remember an LLM answer as a learned entry (when FAQ_LEARN is on)
+        """
+        if LEARN:
+            self.add(question, answer, ttl=self.ttl)
+
+    def load(self, path: str) -> int:
+        """
+        Load approved entries from a JSON file
+
+        Returns:
+            Number of questions added
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        count = 0
+        for item in items:
+            questions = item.get("questions") or [item["question"]]
+            for question in questions:
+                self.add(question, item["answer"])
+                count += 1
+        return count
+
+    def lookup(self, question: str) -> Optional[str]:
+        """
+        Find the answer to a near-repeat of a known question
+
+        Returns:
+            The cached answer, or None if nothing is similar enough
+        """
+        start = time.perf_counter()
+        normalized = normalize_question(question)
+        with self._lock:
+            self._expire()
+            if not self._entries or not normalized:
+                self.misses += 1
+                return None
+            entries, matrix, idf = self._build_index()
+            query = ngram_vector(normalized, self.dim) * idf
+            norm = np.linalg.norm(query)
+            scores = matrix @ (query / norm) if norm else np.zeros(len(entries))
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                answer = None
+            else:
+                self.hits += 1
+                entries[best].last_used = time.monotonic()
+                answer = entries[best].answer
+                logger.debug("FAQ hit %.2f: %r ~ %r", scores[best], question, entries[best].question)
+        observe("faq_lookup", time.perf_counter() - start)
+        return answer
+
+    def answers(self) -> List[str]:
+        """Distinct answers in the cache"""
+        with self._lock:
+            return list(dict.fromkeys(e.answer for e in self._entries.values()))
+
+    def answer_languages(self) -> Dict[str, List[str]]:
+        """
+        Languages a caller would ask for each answer in
+
+        Returns:
+            Mapping of answer to the languages detected from its questions
+        """
+        with self._lock:
+            pairs = [(e.answer, e.question) for e in self._entries.values()]
+        languages: Dict[str, List[str]] = {}
+        for answer, question in pairs:
+            langs = languages.setdefault(answer, [])
+            lang = detect_language(question)
+            if lang not in langs:
+                langs.append(lang)
+        return languages
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        with self._lock:
+            learned = sum(e.expires_at is not None for e in self._entries.values())
+        return {
+            "entries": len(self._entries),
+            "learned": learned,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _build_index(self) -> Tuple[List[_Entry], np.ndarray, np.ndarray]:
+        # Rebuilt only after the entries change; IDF depends on all of them
+        if self._index is None:
+            entries = list(self._entries.values())
+            tf = np.stack([e.vector for e in entries])
+            df = np.count_nonzero(tf, axis=0)
+            idf = (np.log((1.0 + len(entries)) / (1.0 + df)) + 1.0).astype(np.float32)
+            matrix = tf * idf
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms > 0, norms, 1.0)
+            self._index = (entries, matrix, idf)
+        return self._index
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        expired = [k for k, e in self._entries.items() if e.expires_at is not None and e.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+            self.evictions += 1
+        if expired:
+            self._index = None
+
+    def _evict_learned(self) -> None:
+        learned = [(e.last_used, k) for k, e in self._entries.items() if e.expires_at is not None]
+        if len(learned) <= self.max_entries:
+            return
+        learned.sort()
+        for _, key in learned[:len(learned) - self.max_entries]:
+            del self._entries[key]
+            self.evictions += 1
+
+
+_cache: Optional[FAQCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_faq_cache() -> FAQCache:
+    """Return the process-wide FAQ cache, loading FAQ_FILE on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = FAQCache()
+            if os.path.isfile(FAQ_FILE):
+                try:
+                    logger.info("Loaded %d FAQ questions from %s", _cache.load(FAQ_FILE), FAQ_FILE)
+                except Exception as e:
+                    logger.error("Could not load FAQ file %s: %s", FAQ_FILE, e)
+        return _cache
+
+
+def warmup(audio_processor=None, langs: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    Pre-render every FAQ answer into the TTS cache
+
+    Answers are rendered whole (non-streaming replies) and sentence by
+    sentence, as the streaming speaker splits them. Replies take their voice
+    from the caller's question, so by default each answer is rendered in the
+    languages detected from the questions it is stored under.
+
+    Args:
+        audio_processor: Processor to render with (default: a new one)
+        langs: Render every answer in these languages instead
+
+    Returns:
+        TTS cache statistics after warm-up
+    """
+    from utils.audio_utils import AudioProcessor
+    from utils.streaming_tts import SentenceSegmenter
+
+    processor = audio_processor or AudioProcessor()
+    for answer, answer_langs in get_faq_cache().answer_languages().items():
+        segmenter = SentenceSegmenter()
+        chunks = segmenter.feed(answer)
+        tail = segmenter.flush()
+        if tail:
+            chunks.append(tail)
+        for lang in langs or answer_langs:
+            processor.text_to_speech(answer, lang=lang)
+            if len(chunks) > 1:
+                for chunk in chunks:
+                    processor.text_to_speech(chunk, lang=lang)
+    return processor.tts_cache.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAQ answer cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm = sub.add_parser("warmup", help="Pre-render FAQ answers into the TTS cache")
+    warm.add_argument("--lang", action="append",
+                      help="Language to render (repeatable; default: from each answer's questions)")
+    query = sub.add_parser("query", help="Look up a question")
+    query.add_argument("question")
+    sub.add_parser("stats", help="Show the number of entries")
+    args = parser.parse_args()
+
+    cache = get_faq_cache()
+    if args.command == "warmup":
+        stats = warmup(langs=args.lang)
+        print(f"Warm-up done: {stats['misses']} rendered, {stats['hits']} already cached")
+    elif args.command == "query":
+        answer = cache.lookup(args.question)
+        print(answer if answer is not None else f"No answer above similarity {cache.threshold}")
+    else:
+        print(json.dumps(cache.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# utils/language.py
+"""
+Lightweight language identification for choosing the TTS voice.
+
+OmniASR returns text only, so the language is inferred from the text: the
+Unicode script settles most languages outright, and for Latin script a
+handful of very common function words separate the major European
+languages. Anything undetermined falls back to DEFAULT_LANG.
+"""
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Optional
+
+DEFAULT_LANG = os.getenv("TTS_LANG", "en")
+
+# Unicode name prefix -> language code, for scripts used by one main language
+_SCRIPTS = (
+    ("HIRAGANA", "ja"),
+    ("KATAKANA", "ja"),
+    ("HANGUL", "ko"),
+    ("CJK", "zh"),
+    ("CYRILLIC", "ru"),
+    ("ARABIC", "ar"),
+    ("HEBREW", "he"),
+    ("DEVANAGARI", "hi"),
+    ("BENGALI", "bn"),
+    ("TAMIL", "ta"),
+    ("THAI", "th"),
+    ("GREEK", "el"),
+    ("GEORGIAN", "ka"),
+    ("ARMENIAN", "hy"),
+)
+
+_FUNCTION_WORDS = {
+    "en": {"the", "and", "is", "you", "to", "of", "it", "what", "my", "can", "i", "for", "this"},
+    "es": {"el", "la", "de", "que", "y", "es", "en", "los", "por", "para", "con", "una", "mi"},
+    "fr": {"le", "la", "les", "de", "et", "est", "je", "vous", "pour", "une", "que", "pas", "des"},
+    "de": {"der", "die", "das", "und", "ist", "ich", "nicht", "sie", "mit", "ein", "eine", "zu"},
+    "pt": {"o", "a", "de", "que", "e", "do", "da", "em", "um", "uma", "para", "com", "não", "meu"},
+    "it": {"il", "di", "che", "e", "la", "per", "un", "una", "sono", "non", "con", "mi", "è"},
+}
+
+_WORD = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def detect_language(text: str, default: Optional[str] = None) -> str:
+    """
+    Guess the language of a piece of text
+
+    Args:
+        text: Text to inspect (a transcript or a reply)
+        default: Code returned when the language cannot be determined
+            (default: DEFAULT_LANG)
+
+    Returns:
+        ISO 639-1 language code
+    """
+    default = default or DEFAULT_LANG
+    scripts: Counter = Counter()
+    latin = 0
+    for ch in text:
+        if not ch.isalpha():
+            continue
+        name = unicodedata.name(ch, "")
+        if name.startswith("LATIN"):
+            latin += 1
+            continue
+        for prefix, lang in _SCRIPTS:
+            if name.startswith(prefix):
+                scripts[lang] += 1
+                break
+
+    if scripts:
+        # Japanese text mixes kana with kanji; any kana means Japanese
+        if scripts["ja"]:
+            return "ja"
+        lang, count = scripts.most_common(1)[0]
+        if count >= latin:
+            return lang
+
+    words = [w.lower() for w in _WORD.findall(text)]
+    if not words:
+        return default
+    scores = {lang: sum(w in vocab for w in words) for lang, vocab in _FUNCTION_WORDS.items()}
+    best = max(scores, key=scores.get)
+    return best if scores[best] else default
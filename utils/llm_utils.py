@@ -1,9 +1,63 @@
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage, AIMessage
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
+from functools import lru_cache
+import asyncio
 import os
+import threading
+import time
+from utils.context_manager import ConversationContext
+from utils.conversation_analysis import ConversationAnalyzer
+from utils.faq_cache import get_faq_cache
+from utils.metrics import observe, span
+from utils.openai_async import chat_completion, chat_completion_stream
+from utils.rate_limit import PRIORITY_LIVE, PRIORITY_BATCH
+
+@lru_cache(maxsize=None)
+def _shared_chat(model_name: str, temperature: float) -> ChatOpenAI:
+    """
+    One ChatOpenAI client (and HTTP connection pool) per model configuration
+    """
+    kwargs = {}
+    if os.getenv("OPENAI_BASE_URL"):
+        kwargs["openai_api_base"] = os.getenv("OPENAI_BASE_URL")
+    return ChatOpenAI(
+        model_name=model_name,
+        temperature=temperature,
+        **kwargs
+    )
+
+def _to_openai(messages: List[Any]) -> List[Dict[str, str]]:
+    """
+    Convert LangChain messages to OpenAI chat format
+    """
+    roles = {SystemMessage: "system", HumanMessage: "user", AIMessage: "assistant"}
+    return [{"role": roles[type(m)], "content": m.content} for m in messages]
 
 class LLMProcessor:
+    # Appended to a reply the caller talked over before it finished playing
+    INTERRUPTED_NOTE = "[interrupted: the caller did not hear the rest of this reply]"
+    
+    # Phrases each mode says over and over; pre-rendered by the TTS cache warm-up
+    COMMON_PHRASES = {
+        "customer_service": [
+            "Hello, thank you for calling. How can I help you today?",
+            "Please hold for a moment while I look into that.",
+            "Thank you for your patience.",
+            "Is there anything else I can help you with?",
+            "Let me transfer you to a human agent.",
+            "Thank you for calling. Have a great day!",
+        ],
+        "lead_generation": [
+            "Hello, thanks for taking the time to speak with me today.",
+            "Could you tell me a little about what you are looking for?",
+            "What would be the best way and time to reach you?",
+            "Would you like me to arrange a demonstration?",
+            "I will send you some materials by email.",
+            "Thank you for your time. Have a great day!",
+        ],
+    }
+
     def __init__(self, model_name: str = "gpt-3.5-turbo", temperature: float = 0.7):
         """
         Initialize LLM processor
@@ -14,10 +68,19 @@ class LLMProcessor:
         """
         self.model_name = model_name
         self.temperature = temperature
-        self.chat = ChatOpenAI(
-            model_name=model_name,
-            temperature=temperature
-        )
+        self.chat = _shared_chat(model_name, temperature)
+        
+        # Token-budgeted view of the conversation (summary + recent turns)
+        self.context = ConversationContext(self.chat)
+        
+        # Structured analysis with per-segment caching
+        self.analyzer = ConversationAnalyzer(model_name)
+        
+        # Current scenario; the default prompt is the customer service one
+        self.mode = "customer_service"
+        
+        # A speculative reply may build its prompt while another turn does
+        self._build_lock = threading.Lock()
         
         # Default system prompt
         self.default_system_prompt = """
@@ -40,31 +103,207 @@ class LLMProcessor:
         Returns:
             Generated response
         """
+        answer = self._faq_answer(prompt)
+        if answer is not None:
+            return answer
+        
+        with span("llm_total"):
+            messages = self._build_messages(prompt, conversation_history, system_prompt)
+            
+            # Generate response
+            response = self.chat(messages)
+        self._learn_answer(prompt, response.content, conversation_history)
+        return response.content
+
+    async def agenerate_response(self, prompt: str,
+                                 conversation_history: Optional[List[Dict[str, str]]] = None,
+                                 system_prompt: Optional[str] = None,
+                                 priority: int = PRIORITY_LIVE) -> str:
+        """
+        Generate response without blocking the event loop
+        
+        Requests share a pooled HTTP client, pass through the rate limiter
+        (live traffic ahead of batch work) and are retried with jittered
+        backoff on 429s, timeouts and server errors.
+        
+        Args:
+            prompt: User input
+            conversation_history: Conversation history
+            system_prompt: System prompt
+            priority: Limiter priority
+            
+        Returns:
+            Generated response
+        """
+        answer = self._faq_answer(prompt)
+        if answer is not None:
+            return answer
+        
+        # Building may summarize old turns (a blocking call), so keep it off the loop
+        with span("llm_total"):
+            messages = await asyncio.to_thread(
+                self._build_messages, prompt, conversation_history, system_prompt
+            )
+            response = await chat_completion(
+                _to_openai(messages), self.model_name, self.temperature, priority=priority
+            )
+        self._learn_answer(prompt, response, conversation_history)
+        return response
+
+    def stream_response(self, prompt: str,
+                        conversation_history: Optional[List[Dict[str, str]]] = None,
+                        system_prompt: Optional[str] = None,
+                        learn: bool = True) -> Iterator[str]:
+        """
+        Generate response incrementally
+        
+        Closing the generator closes the model stream, which stops generation.
+        
+        Args:
+            prompt: User input
+            conversation_history: Conversation history
+            system_prompt: System prompt
+            learn: Offer the finished reply to the FAQ cache (off for replies
+                to a transcript that may still change)
+            
+        Yields:
+            Response text fragments as they arrive from the model
+        """
+        answer = self._faq_answer(prompt)
+        if answer is not None:
+            yield answer
+            return
+        
+        start = time.perf_counter()
+        first = True
+        parts = []
+        messages = self._build_messages(prompt, conversation_history, system_prompt)
+        stream = self.chat.stream(messages)
+        try:
+            for chunk in stream:
+                if chunk.content:
+                    if first:
+                        observe("llm_first_token", time.perf_counter() - start)
+                        first = False
+                    parts.append(chunk.content)
+                    yield chunk.content
+        finally:
+            stream.close()
+        observe("llm_total", time.perf_counter() - start)
+        if learn:
+            self._learn_answer(prompt, "".join(parts), conversation_history)
+    
+    async def astream_response(self, prompt: str,
+                               conversation_history: Optional[List[Dict[str, str]]] = None,
+                               system_prompt: Optional[str] = None,
+                               priority: int = PRIORITY_LIVE) -> AsyncIterator[str]:
+        """
+        Generate response incrementally without blocking the event loop
+        
+        Uses the same pooled client, rate limiter and retries as
+        agenerate_response; a failed request is retried only until its
+        first token has arrived.
+        
+        Args:
+            prompt: User input
+            conversation_history: Conversation history
+            system_prompt: System prompt
+            priority: Limiter priority
+            
+        Yields:
+            Response text fragments as they arrive from the model
+        """
+        answer = self._faq_answer(prompt)
+        if answer is not None:
+            yield answer
+            return
+        
+        start = time.perf_counter()
+        first = True
+        parts = []
+        messages = await asyncio.to_thread(
+            self._build_messages, prompt, conversation_history, system_prompt
+        )
+        async for fragment in chat_completion_stream(
+            _to_openai(messages), self.model_name, self.temperature, priority=priority
+        ):
+            if first:
+                observe("llm_first_token", time.perf_counter() - start)
+                first = False
+            parts.append(fragment)
+            yield fragment
+        observe("llm_total", time.perf_counter() - start)
+        self._learn_answer(prompt, "".join(parts), conversation_history)
+    
+    def _faq_answer(self, prompt: str) -> Optional[str]:
+        """
+        Approved answer for a near-repeat question (customer service mode only)
+        """
+        if self.mode != "customer_service":
+            return None
+        return get_faq_cache().lookup(prompt)
+    
+    def _learn_answer(self, prompt: str, response: str,
+                      conversation_history: Optional[List[Dict[str, str]]]) -> None:
+        """
+        Offer an opening question's answer to the FAQ cache
+        
+        Later turns depend on the conversation so far and are not reusable.
+        """
+        if self.mode == "customer_service" and not conversation_history and response:
+            get_faq_cache().learn(prompt, response)
+
+    def _build_messages(self, prompt: str,
+                        conversation_history: Optional[List[Dict[str, str]]],
+                        system_prompt: Optional[str]) -> List[Any]:
+        """
+        Build the LangChain message list for a turn
+        """
         # Use default system prompt or custom prompt
         system_content = system_prompt if system_prompt else self.default_system_prompt
         
-        # Build message list
-        messages = [SystemMessage(content=system_content)]
+        # History is trimmed to the token budget; older turns are summarized
+        with self._build_lock:
+            return self.context.build(system_content, prompt, conversation_history or [])
+
+    @property
+    def last_prompt_tokens(self) -> int:
+        """
+        Prompt tokens sent on the most recent turn
+        """
+        return self.context.last_prompt_tokens
+    
+    def note_playback(self, conversation_history: List[Dict[str, str]],
+                      heard_text: str, fraction: float) -> Optional[str]:
+        """
+        Record how much of the last reply the caller actually heard
         
-        # Add conversation history
-        if conversation_history:
-            for message in conversation_history:
-                if message["role"] == "user":
-                    messages.append(HumanMessage(content=message["content"]))
-                elif message["role"] == "assistant":
-                    messages.append(AIMessage(content=message["content"]))
+        When playback was cut short (barge-in), the last assistant message is
+        replaced by the part that was heard plus a note, so the next response
+        does not assume the caller got the rest.
         
-        # Add current user input
-        messages.append(HumanMessage(content=prompt))
+        Args:
+            conversation_history: Conversation history (edited in place)
+            heard_text: Text of the reply up to where playback stopped
+            fraction: Share of the reply audio that was played (0-1)
         
-        # Generate response
-        response = self.chat(messages)
-        return response.content
+        Returns:
+            The amended reply text, or None if nothing changed
+        """
+        if fraction >= 1.0 or not conversation_history:
+            return None
+        last = conversation_history[-1]
+        if last["role"] != "assistant" or last["content"].endswith(self.INTERRUPTED_NOTE):
+            return None
+        last["content"] = f"{heard_text.strip()} {self.INTERRUPTED_NOTE}".strip()
+        self.context.amend_last(conversation_history)
+        return last["content"]
     
     def customize_for_call_center(self) -> None:
         """
         Customize LLM for call center scenarios
         """
+        self.mode = "customer_service"
         self.default_system_prompt = """
         You are a professional call center customer service representative, capable of handling various customer inquiries and issues.
         
@@ -82,6 +321,7 @@ class LLMProcessor:
         """
         Customize LLM for lead generation scenarios
         """
+        self.mode = "lead_generation"
         self.default_system_prompt = """
         You are a professional sales representative, responsible for initial communication with potential customers and collecting information.
         
@@ -99,38 +339,30 @@ class LLMProcessor:
         """
         Analyze conversation content and extract key information
         
+        Only turns added since the last analysis are sent to the model;
+        earlier segments come from the analyzer's cache.
+        
         Args:
             conversation_history: Conversation history
             
         Returns:
-            Analysis results containing key information
+            Analysis results (ConversationAnalysis fields: summary, needs,
+            sentiment, sentiment_score, key_points, lead, next_actions)
         """
-        # Build analysis prompt
-        analysis_prompt = """
-        Please analyze the following conversation and extract the following information:
-        1. Customer's main issues or needs
-        2. Customer's emotional state
-        3. Key information points (such as product interest, budget considerations, etc.)
-        4. Suggested follow-up actions
-        
-        Conversation content:
+        return self.analyzer.analyze_sync(conversation_history).model_dump()
+
+    async def aanalyze_conversation(self, conversation_history: List[Dict[str, str]],
+                                    priority: int = PRIORITY_BATCH) -> Dict[str, Any]:
         """
+        Analyze conversation content without blocking the event loop
         
-        # Add conversation history to prompt
-        for message in conversation_history:
-            role = "Customer" if message["role"] == "user" else "Assistant"
-            analysis_prompt += f"\n{role}: {message['content']}"
-        
-        # Build messages
-        messages = [
-            SystemMessage(content="You are a professional conversation analysis expert, capable of extracting key information from conversations."),
-            HumanMessage(content=analysis_prompt)
-        ]
+        Runs at batch priority by default so analysis jobs yield to live calls.
         
-        # Generate analysis
-        response = self.chat(messages)
-        
-        # More structured processing logic can be added here
-        # Currently simply returns text analysis results
-        return {"analysis": response.content}
-    
\ No newline at end of file
+        Args:
+            conversation_history: Conversation history
+            priority: Limiter priority
+            
+        Returns:
+            Analysis results (see analyze_conversation)
+        """
+        return (await self.analyzer.analyze(conversation_history, priority)).model_dump()
@@ -0,0 +1,191 @@
+# utils/long_audio.py
+"""
+Long-audio transcription: split a recording at silences into bounded chunks
+while streaming it from disk, transcribe the chunks in parallel, and stitch
+the text back together in order with per-chunk time offsets.
+"""
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from utils.asr_engine import get_engine
+from utils.omni_asr import _transcribe_batch_safe
+from utils.resample import Resampler, normalize
+from utils.vad import EnergyVAD
+
+LONG_AUDIO_SECONDS = float(os.getenv("LONG_AUDIO_SECONDS", "60"))
+# Each one-shot launch loads the whole model, so keep this small
+FALLBACK_LAUNCHES = int(os.getenv("LONG_AUDIO_LAUNCHES", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+def split_on_silence(path: str, out_dir: str, target_chunk_s: float = 20.0,
+                     max_chunk_s: float = 30.0, min_silence_ms: int = 300,
+                     block_s: float = 5.0,
+                     target_sr: Optional[int] = None) -> Iterator[Tuple[str, float, float]]:
+    """
+    Stream an audio file and cut it into chunks at silence boundaries
+
+    Once a chunk reaches `target_chunk_s`, it is closed in the middle of the
+    next silent stretch; if none arrives before `max_chunk_s`, it is cut hard.
+    Only the current chunk is held in memory.
+
+    Args:
+        path: Input audio file (anything libsndfile reads), path or file-like
+        out_dir: Directory for the chunk wav files
+        target_chunk_s: Preferred chunk length in seconds
+        max_chunk_s: Upper bound on chunk length in seconds
+        min_silence_ms: Silence needed to count as a boundary
+        block_s: Read block length in seconds
+        target_sr: Resample (and level-normalize) chunks to this rate;
+            None keeps the file's rate untouched
+
+    Yields:
+        Tuples of (chunk path, start offset in seconds, duration in seconds)
+    """
+    audio = sf.SoundFile(path)
+    resampler = Resampler(audio.samplerate, target_sr) if target_sr else None
+    sr = target_sr or audio.samplerate
+    vad = EnergyVAD(sample_rate=sr)
+    frame_len = vad.frame_len
+    min_silence_frames = max(1, int(min_silence_ms / 1000 * sr / frame_len))
+    target = int(target_chunk_s * sr)
+    limit = int(max_chunk_s * sr)
+
+    pending: List[np.ndarray] = []  # whole frames of the current chunk
+    pending_len = 0
+    silent_run = 0
+    chunk_start = 0
+    index = 0
+
+    def flush(n_samples: int):
+        nonlocal pending, pending_len, chunk_start, index
+        data = np.concatenate(pending)
+        head, rest = data[:n_samples], data[n_samples:]
+        chunk_path = os.path.join(out_dir, f"chunk_{index:05d}.wav")
+        sf.write(chunk_path, normalize(head) if resampler else head, sr)
+        result = (chunk_path, chunk_start / sr, len(head) / sr)
+        index += 1
+        chunk_start += len(head)
+        pending = [rest] if rest.size else []
+        pending_len = rest.size
+        return result
+
+    with audio:
+        for block in audio.blocks(blocksize=int(block_s * audio.samplerate), dtype="float32", always_2d=True):
+            mono = block.mean(axis=1)
+            if resampler:
+                mono = resampler.process(mono)
+            frames = vad.frames(mono)
+            if not frames.size:
+                continue
+            speech = vad.classify(frames)
+            for frame, is_speech in zip(frames, speech):
+                pending.append(frame)
+                pending_len += frame_len
+                silent_run = 0 if is_speech else silent_run + 1
+                if pending_len >= target and silent_run >= min_silence_frames:
+                    # Cut in the middle of the silent stretch
+                    yield flush(pending_len - (silent_run // 2) * frame_len)
+                    silent_run = 0
+                elif pending_len >= limit:
+                    yield flush(pending_len)
+                    silent_run = 0
+
+    tail = [vad.take_remainder()]
+    if resampler:
+        tail.append(resampler.flush())
+    for leftover in tail:
+        if leftover.size:
+            pending.append(leftover)
+            pending_len += leftover.size
+    if pending_len:
+        yield flush(pending_len)
+
+
+def _transcribe_chunk_safe(engine, chunk_path: str) -> List[dict]:
+    """Decode one chunk with the resident engine; errors only lose that chunk."""
+    try:
+        return [{"path": chunk_path, "text": engine.transcribe(chunk_path)}]
+    except Exception as e:
+        return [{"path": chunk_path, "error": str(e)}]
+
+
+def transcribe_long_audio(path, workers: Optional[int] = None,
+                          chunks_per_launch: int = 4, num_threads: int = 2,
+                          target_chunk_s: float = 20.0,
+                          max_chunk_s: float = 30.0,
+                          target_sr: Optional[int] = None) -> Dict[str, object]:
+    """
+    Transcribe a long recording chunk by chunk in parallel
+
+    Chunks are submitted as soon as they are cut, so splitting and decoding
+    overlap. Each chunk is decoded by the resident ASR engine, whose
+    OMNI_ASR_WORKERS processes bound both concurrency and memory; only when
+    the engine is unavailable are chunks batched into one-shot
+    sherpa-onnx-offline launches, at most LONG_AUDIO_LAUNCHES at a time.
+
+    Args:
+        path: Input audio file, path or seekable file-like
+        workers: Concurrent subprocess launches in the fallback path
+            (default and upper bound: LONG_AUDIO_LAUNCHES)
+        chunks_per_launch: Chunks decoded per fallback launch
+        num_threads: ONNX threads per fallback launch
+        target_chunk_s: Preferred chunk length in seconds
+        max_chunk_s: Upper bound on chunk length in seconds
+        target_sr: Resample chunks to this rate before decoding
+
+    Returns:
+        {"text": stitched transcript,
+         "segments": [{"start", "end", "text"} ...] in time order}
+    """
+    engine = get_engine()
+    resident = engine.available
+    if resident:
+        workers = max(1, engine.num_workers)
+    else:
+        workers = max(1, min(workers or FALLBACK_LAUNCHES, FALLBACK_LAUNCHES))
+    out_dir = tempfile.mkdtemp(prefix="long_audio_")
+    offsets: Dict[str, Tuple[float, float]] = {}
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            batch: List[str] = []
+            for chunk_path, start, duration in split_on_silence(
+                path, out_dir, target_chunk_s=target_chunk_s, max_chunk_s=max_chunk_s,
+                target_sr=target_sr,
+            ):
+                offsets[chunk_path] = (start, duration)
+                if resident:
+                    futures.append(pool.submit(_transcribe_chunk_safe, engine, chunk_path))
+                    continue
+                batch.append(chunk_path)
+                if len(batch) >= chunks_per_launch:
+                    futures.append(pool.submit(_transcribe_batch_safe, batch, num_threads))
+                    batch = []
+            if batch:
+                futures.append(pool.submit(_transcribe_batch_safe, batch, num_threads))
+
+            records = [record for future in futures for record in future.result()]
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    segments = []
+    for record in sorted(records, key=lambda r: offsets[r["path"]][0]):
+        start, duration = offsets[record["path"]]
+        text = record.get("text", "")
+        if "error" in record:
+            logger.warning("Chunk transcription error at %.1fs: %s", start, record["error"])
+        segments.append({"start": start, "end": start + duration, "text": text})
+
+    return {
+        "text": " ".join(s["text"] for s in segments if s["text"]),
+        "segments": segments,
+    }
@@ -0,0 +1,142 @@
+# utils/metrics.py
+"""
+In-process latency metrics for the voice pipeline.
+
+Each turn is timed in stages (record, preprocess, asr, llm_first_token,
+llm_total, tts, playback). Timings go into per-stage histograms that keep
+cumulative Prometheus buckets plus a bounded window of recent samples for
+p50/p95/p99, so the Streamlit sidebar and the service's /metrics endpoint
+read from the same numbers.
+
+    with span("asr"):
+        text = transcribe(...)
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("record", "preprocess", "asr", "llm_first_token", "llm_total", "tts", "playback")
+
+# Seconds; covers cached TTS hits (ms) up to long recordings
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+WINDOW = 1024
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS, window: int = WINDOW):
+        """
+        Latency histogram
+
+        Args:
+            buckets: Upper bounds (seconds) of the cumulative buckets
+            window: Number of recent samples kept for quantiles
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)) -> Dict[str, Optional[float]]:
+        """
+        Quantiles over the recent window
+
+        Returns:
+            Dictionary like {"p50": 0.12, "p95": ..., "p99": ...}; values are
+            None until something has been observed
+        """
+        with self._lock:
+            recent = np.fromiter(self.recent, dtype=np.float64)
+        if not recent.size:
+            return {f"p{int(q * 100)}": None for q in qs}
+        values = np.quantile(recent, qs)
+        return {f"p{int(q * 100)}": float(v) for q, v in zip(qs, values)}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage: str) -> Histogram:
+        with self._lock:
+            if stage not in self._histograms:
+                self._histograms[stage] = Histogram()
+            return self._histograms[stage]
+
+    def observe(self, stage: str, seconds: float) -> None:
+        self.histogram(stage).observe(seconds)
+        logger.debug("stage=%s seconds=%.4f", stage, seconds)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """
+        Time the enclosed block as one observation of `stage`
+
+        Failed blocks are not recorded, so errors do not skew the latencies.
+        """
+        start = time.perf_counter()
+        yield
+        self.observe(stage, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Per-stage count, mean and p50/p95/p99 (seconds), in pipeline order
+        """
+        with self._lock:
+            names = sorted(self._histograms, key=lambda s: (STAGES.index(s) if s in STAGES else len(STAGES), s))
+            histograms = [(name, self._histograms[name]) for name in names]
+        result = {}
+        for name, h in histograms:
+            entry = {"count": h.count, "mean": h.sum / h.count if h.count else None}
+            entry.update(h.quantiles())
+            result[name] = entry
+        return result
+
+    def render_prometheus(self, prefix: str = "voicebot") -> str:
+        """
+        Render all histograms in the Prometheus text exposition format
+        """
+        name = f"{prefix}_stage_latency_seconds"
+        lines: List[str] = [
+            f"# HELP {name} Latency of each voice pipeline stage.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for stage, h in histograms:
+            with h._lock:
+                counts, total, count = list(h.counts), h.sum, h.count
+            cumulative = 0
+            for bound, n in zip(h.buckets, counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+REGISTRY = MetricsRegistry()
+span = REGISTRY.span
+observe = REGISTRY.observe
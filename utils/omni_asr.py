@@ -1,34 +1,41 @@
 # utils/omni_asr.py
-import os, subprocess, shlex, json
+import os, subprocess, shlex, json, argparse, logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional
 
-BIN = "/Users/boydlever/sherpa-build/sherpa-onnx/build/bin/sherpa-onnx-offline"
+BIN = os.getenv(
+    "OMNI_ASR_BIN",
+    "/Users/boydlever/sherpa-build/sherpa-onnx/build/bin/sherpa-onnx-offline",
+)
 
 MODEL_DIR = os.path.abspath("asr_models/omnilingual_1b")
 MODEL = os.path.join(MODEL_DIR, "model.onnx")
 TOKENS = os.path.join(MODEL_DIR, "tokens.txt")
 
-def _run(cmd: str) -> str:
-    print("\n[omni_asr] Executing command:")
-    print(cmd, "\n")
+logger = logging.getLogger(__name__)
 
+def _execute(cmd: str) -> str:
     p = subprocess.run(shlex.split(cmd), capture_output=True, text=True)
 
     stdout = p.stdout or ""
     stderr = p.stderr or ""
     combined = stdout + "\n" + stderr
 
-    print("[omni_asr] returncode:", p.returncode)
-    print("[omni_asr] ---- STDOUT ----")
-    print(stdout)
-    print("[omni_asr] ---- STDERR ----")
-    print(stderr)
-
     if p.returncode != 0:
         raise RuntimeError("sherpa-onnx failed:\n" + combined.strip())
 
     if not combined.strip():
         raise RuntimeError("No output from sherpa-onnx:\n" + combined)
 
+    return combined
+
+def _run(cmd: str) -> str:
+    logger.debug("Executing: %s", cmd)
+
+    combined = _execute(cmd)
+
+    logger.debug("sherpa-onnx output:\n%s", combined)
+
     json_line = None
     for line in combined.splitlines():
         line = line.strip()
@@ -38,18 +45,171 @@ def _run(cmd: str) -> str:
     if not json_line:
         raise RuntimeError("No transcription JSON found:\n" + combined)
 
-    print("[omni_asr] JSON located:", json_line)
-
-    import json
     text = json.loads(json_line).get("text", "").strip()
-    print("[omni_asr] Final ASR text:", text)
+    logger.debug("ASR text: %s", text)
     return text
 
-def transcribe_with_omni_asr(wav_path: str) -> str:
+def _parse_batch(output: str, wav_paths: List[str]) -> Dict[str, str]:
+    """
+    Match the per-file JSON results of a multi-file run to their inputs.
+
+    sherpa-onnx-offline prints each input path followed by its JSON result;
+    results without a recognizable path line are assigned in input order.
+    """
+    by_name = {p: p for p in wav_paths}
+    by_name.update({os.path.basename(p): p for p in wav_paths})
+
+    results: Dict[str, str] = {}
+    pending = list(wav_paths)
+    current = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line in by_name:
+            current = by_name[line]
+            continue
+        if not (line.startswith("{") and line.endswith("}")):
+            continue
+        target = current if current and current not in results else None
+        if target is None:
+            target = next((p for p in pending if p not in results), None)
+        if target is None:
+            continue
+        results[target] = json.loads(line).get("text", "").strip()
+        current = None
+    return results
+
+def _command(wav_paths: Iterable[str], num_threads: Optional[int] = None) -> str:
     cmd = (
         f'{BIN} '
         f'--tokens="{TOKENS}" '
         f'--omnilingual-asr-model="{MODEL}" '
-        f'"{wav_path}"'
     )
-    return _run(cmd)
+    if num_threads:
+        cmd += f'--num-threads={num_threads} '
+    return cmd + " ".join(f'"{p}"' for p in wav_paths)
+
+def transcribe_with_omni_asr(wav_path: str) -> str:
+    return _run(_command([wav_path]))
+
+def transcribe_batch(wav_paths: List[str], num_threads: Optional[int] = None) -> Dict[str, str]:
+    """
+    Transcribe several files with a single sherpa-onnx launch.
+
+    Returns:
+        Mapping of input path to transcribed text
+    """
+    output = _execute(_command(wav_paths, num_threads))
+    results = _parse_batch(output, wav_paths)
+    missing = [p for p in wav_paths if p not in results]
+    if missing:
+        raise RuntimeError(f"No transcription JSON for {len(missing)} file(s): {missing[:3]}")
+    return results
+
+def _transcribe_batch_safe(wav_paths: List[str], num_threads: Optional[int]) -> List[dict]:
+    """Run one batch; on failure retry file by file so one bad file only loses itself."""
+    try:
+        results = transcribe_batch(wav_paths, num_threads)
+        return [{"path": p, "text": results[p]} for p in wav_paths]
+    except Exception as batch_error:
+        if len(wav_paths) == 1:
+            return [{"path": wav_paths[0], "error": str(batch_error)}]
+    records = []
+    for p in wav_paths:
+        try:
+            records.append({"path": p, "text": transcribe_batch([p], num_threads)[p]})
+        except Exception as e:
+            records.append({"path": p, "error": str(e)})
+    return records
+
+def _completed(out_path: str) -> set:
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            if "text" in record:
+                done.add(record["path"])
+    return done
+
+def transcribe_many(paths: Iterable[str], out_path: Optional[str] = None,
+                    batch_size: int = 16, workers: Optional[int] = None,
+                    num_threads: int = 2) -> Dict[str, str]:
+    """
+    Transcribe a large set of files, several per sherpa-onnx launch.
+
+    Batches are spread across a thread pool sized to the machine; each task
+    only launches sherpa-onnx-offline and waits on it, so threads keep the
+    launches busy without extra interpreter processes. When
+    `out_path` is given, results are appended to it as JSONL as each batch
+    finishes, and files already transcribed there are skipped.
+
+    Args:
+        paths: Audio files to transcribe
+        out_path: JSONL results file ({"path", "text"} or {"path", "error"})
+        batch_size: Files per sherpa-onnx launch (amortizes model loading)
+        workers: Concurrent launches (default: cores // num_threads)
+        num_threads: ONNX threads per launch
+
+    Returns:
+        Mapping of path to text for the files transcribed in this call
+    """
+    paths = [os.path.abspath(p) for p in paths]
+    if out_path:
+        done = _completed(out_path)
+        paths = [p for p in paths if p not in done]
+    if not paths:
+        return {}
+
+    workers = workers or max(1, (os.cpu_count() or 1) // num_threads)
+    batch_size = max(1, min(batch_size, -(-len(paths) // workers)))
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+
+    results: Dict[str, str] = {}
+    out = open(out_path, "a", encoding="utf-8") if out_path else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_transcribe_batch_safe, b, num_threads) for b in batches]
+            for future in as_completed(futures):
+                for record in future.result():
+                    if "text" in record:
+                        results[record["path"]] = record["text"]
+                    if out:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if out:
+                    out.flush()
+    finally:
+        if out:
+            out.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-transcribe audio files with OmniASR")
+    parser.add_argument("inputs", nargs="+", help="Audio files or directories")
+    parser.add_argument("-o", "--output", default="transcripts.jsonl", help="JSONL results file")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--num-threads", type=int, default=2)
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log sherpa-onnx commands and output")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    paths = []
+    for item in args.inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, f) for f in sorted(files) if f.lower().endswith(".wav"))
+        else:
+            paths.append(item)
+
+    results = transcribe_many(
+        paths, out_path=args.output, batch_size=args.batch_size,
+        workers=args.workers, num_threads=args.num_threads,
+    )
+    print(f"Transcribed {len(results)} file(s) -> {args.output}")
+
+if __name__ == "__main__":
+    main()
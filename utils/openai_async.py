@@ -0,0 +1,218 @@
+# utils/openai_async.py
+"""
+Shared async OpenAI access for LLMProcessor's a* methods.
+
+One pooled httpx connection pool and one rate limiter per event loop; every
+request goes through the limiter and is retried with jittered exponential
+backoff on rate-limit, timeout, connection and 5xx errors. A failed attempt
+refunds its token reservation, so retries do not drain the bucket. Streamed
+completions are retried only until their first token has arrived.
+
+Point OPENAI_BASE_URL at a local server (see benchmarks/mock_openai.py) to
+exercise this path offline.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple, TypeVar
+
+import httpx
+import openai
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+from utils.context_manager import count_tokens
+from utils.rate_limit import PRIORITY_LIVE, TokenBucketLimiter
+
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+REQUEST_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "5"))
+DEFAULT_COMPLETION_TOKENS = 256
+
+RETRYABLE = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+# Connection pools are bound to the loop that created them
+_per_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[openai.AsyncOpenAI, TokenBucketLimiter]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _resources() -> Tuple[openai.AsyncOpenAI, TokenBucketLimiter]:
+    loop = asyncio.get_running_loop()
+    if loop not in _per_loop:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS // 4),
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=5.0),
+        )
+        client = openai.AsyncOpenAI(
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=http_client,
+            max_retries=0,  # retries are scheduled here, through the limiter
+        )
+        _per_loop[loop] = (client, TokenBucketLimiter())
+    return _per_loop[loop]
+
+
+_T = TypeVar("_T")
+_background: Optional[asyncio.AbstractEventLoop] = None
+_background_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _background
+    with _background_lock:
+        if _background is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="openai-async", daemon=True).start()
+            _background = loop
+        return _background
+
+
+def run_sync(coro: Awaitable[_T], timeout: Optional[float] = None) -> _T:
+    """
+    Run a coroutine from synchronous code (e.g. the Streamlit script)
+
+    Every call shares one long-lived background loop, and with it one
+    connection pool and one rate limiter, instead of creating a fresh pair
+    per asyncio.run.
+
+    Args:
+        coro: Coroutine using this module's requests
+        timeout: Seconds to wait for the result (default: no limit)
+
+    Returns:
+        The coroutine's result
+    """
+    loop = _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync called from the shared loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def get_limiter() -> TokenBucketLimiter:
+    """Rate limiter shared by all async requests on the running loop."""
+    return _resources()[1]
+
+
+async def chat_completion(messages: List[Dict[str, str]], model: str, temperature: float,
+                          priority: int = PRIORITY_LIVE,
+                          max_tokens: int = None, **kwargs: Any) -> str:
+    """
+    Send a chat completion through the shared client and limiter
+
+    Args:
+        messages: OpenAI-format messages ({"role", "content"})
+        model: Model name
+        temperature: Sampling temperature
+        priority: Limiter priority (PRIORITY_LIVE before PRIORITY_BATCH)
+        max_tokens: Completion cap (also used for the token estimate)
+        **kwargs: Passed through to chat.completions.create
+
+    Returns:
+        The reply text
+    """
+    client, limiter = _resources()
+    estimate = sum(count_tokens(m["content"]) + 4 for m in messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception_type(RETRYABLE),
+        wait=wait_random_exponential(multiplier=0.5, max=20),
+        stop=stop_after_attempt(MAX_ATTEMPTS),
+        reraise=True,
+    ):
+        with attempt:
+            await limiter.acquire(estimate, priority)
+            try:
+                response = await client.chat.completions.create(
+                    model=model, messages=messages, temperature=temperature, **kwargs
+                )
+            except BaseException:
+                # No usage was reported: give the estimate back before retrying,
+                # so each logical request holds one reservation at a time
+                limiter.adjust(-estimate)
+                raise
+
+    if response.usage is not None:
+        limiter.adjust(response.usage.total_tokens - estimate)
+    return response.choices[0].message.content or ""
+
+
+async def chat_completion_stream(messages: List[Dict[str, str]], model: str, temperature: float,
+                                 priority: int = PRIORITY_LIVE,
+                                 max_tokens: int = None, **kwargs: Any) -> AsyncIterator[str]:
+    """
+    Stream a chat completion through the shared client and limiter
+
+    Failures before the first token are retried like chat_completion; once
+    text has been yielded an error is raised to the caller, since the reply
+    cannot be restarted under it.
+
+    Args:
+        messages: OpenAI-format messages ({"role", "content"})
+        model: Model name
+        temperature: Sampling temperature
+        priority: Limiter priority (PRIORITY_LIVE before PRIORITY_BATCH)
+        max_tokens: Completion cap (also used for the token estimate)
+        **kwargs: Passed through to chat.completions.create
+
+    Yields:
+        Reply text fragments as they arrive
+    """
+    client, limiter = _resources()
+    estimate = sum(count_tokens(m["content"]) + 4 for m in messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception_type(RETRYABLE),
+        wait=wait_random_exponential(multiplier=0.5, max=20),
+        stop=stop_after_attempt(MAX_ATTEMPTS),
+        reraise=True,
+    ):
+        with attempt:
+            await limiter.acquire(estimate, priority)
+            try:
+                stream = await client.chat.completions.create(
+                    model=model, messages=messages, temperature=temperature, stream=True,
+                    stream_options={"include_usage": True}, **kwargs
+                )
+                chunks = stream.__aiter__()
+                first = await _next_content(chunks)
+            except BaseException:
+                limiter.adjust(-estimate)
+                raise
+
+    usage = None
+    try:
+        if first is None:
+            return
+        yield first
+        async for chunk in chunks:
+            if chunk.usage is not None:
+                usage = chunk.usage.total_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
+        if usage is not None:
+            limiter.adjust(usage - estimate)
+
+
+async def _next_content(chunks: AsyncIterator[Any]) -> Optional[str]:
+    """First non-empty text fragment of a stream, or None if it ends first."""
+    async for chunk in chunks:
+        if chunk.choices and chunk.choices[0].delta.content:
+            return chunk.choices[0].delta.content
+    return None
@@ -0,0 +1,309 @@
+# utils/playback.py
+"""
+Non-blocking reply playback with barge-in.
+
+Clips are streamed through an `sd.OutputStream` callback, so playback runs in
+the background while the caller (the Streamlit script, a StreamingSpeaker)
+carries on. While a reply plays, a monitoring `sd.InputStream` runs the
+energy VAD on the microphone; once the caller has spoken for `barge_in_ms`
+the output callback goes silent on its next block and playback ends.
+
+The manager keeps track of how far playback got, so the part of the reply
+the caller actually heard can be reported to LLMProcessor.note_playback.
+
+Without echo cancellation the bot's own voice reaches the microphone; the
+barge-in threshold (PLAYBACK_BARGE_IN_DB) is therefore set well above the
+recording VAD's, and a headset gives the most reliable results.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Union
+
+import numpy as np
+
+from utils.audio_utils import load_audio
+from utils.metrics import observe
+from utils.resample import resample
+from utils.vad import EnergyVAD
+
+PLAYBACK_SAMPLE_RATE = int(os.getenv("PLAYBACK_SAMPLE_RATE", "24000"))
+BARGE_IN_THRESHOLD_DB = float(os.getenv("PLAYBACK_BARGE_IN_DB", "-30"))
+BARGE_IN_MS = int(os.getenv("PLAYBACK_BARGE_IN_MS", "60"))
+
+logger = logging.getLogger(__name__)
+
+
+class _Clip:
+    def __init__(self, samples: np.ndarray, text: str):
+        self.samples = samples
+        self.text = text
+        self.pos = 0
+
+
+class PlaybackManager:
+    def __init__(self, sample_rate: int = PLAYBACK_SAMPLE_RATE, barge_in: bool = True,
+                 monitor_sample_rate: int = 16000, barge_in_ms: int = BARGE_IN_MS,
+                 threshold_db: float = BARGE_IN_THRESHOLD_DB, block_ms: int = 20):
+        """
+        Background playback of a reply, interruptible by the caller's voice
+
+        Args:
+            sample_rate: Output stream rate; clips are resampled to it
+            barge_in: Monitor the microphone and stop when the caller speaks
+            monitor_sample_rate: Microphone rate for barge-in detection
+            barge_in_ms: Continuous speech needed to interrupt playback
+            threshold_db: Minimum speech level (dBFS) for barge-in
+            block_ms: Output and monitor block length in milliseconds
+        """
+        self.sample_rate = sample_rate
+        self.barge_in = barge_in
+        self.monitor_sample_rate = monitor_sample_rate
+        self.barge_in_ms = barge_in_ms
+        self.threshold_db = threshold_db
+        self.block_ms = block_ms
+
+        self._lock = threading.Lock()
+        self._clips: Deque[_Clip] = deque()
+        self._all: List[_Clip] = []
+        self._current: Optional[_Clip] = None
+        self._streams = []
+        self._done = threading.Event()
+        self._done.set()
+        self._finishing = False
+        self._interrupted = False
+        self._barged_in = False
+        self._speech_frames = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        """Whether a reply is currently playing (or waiting for more clips)"""
+        return not self._done.is_set()
+
+    def clear(self) -> None:
+        """
+        Stop playback and forget the current reply (its result included)
+        """
+        self.stop()
+        with self._lock:
+            self._clips.clear()
+            self._all = []
+            self._current = None
+            self._finishing = False
+            self._interrupted = False
+            self._barged_in = False
+            self._speech_frames = 0
+
+    def start(self) -> None:
+        """
+        Begin a new reply, stopping whatever is still playing
+        """
+        self.clear()
+        self._done.clear()
+        try:
+            self._open_streams()
+        except Exception as e:
+            logger.error("Could not open audio playback streams: %s", e)
+            self._close_streams()
+            self._done.set()
+
+    def enqueue(self, audio: Union[str, bytes, np.ndarray], text: str = "",
+                sample_rate: Optional[int] = None) -> bool:
+        """
+        Queue a clip behind the ones already playing
+
+        Args:
+            audio: Path, encoded bytes, or samples (with `sample_rate`)
+            text: Text spoken in the clip, used to report what was heard
+            sample_rate: Rate of `audio` when it is a sample array
+
+        Returns:
+            False if the reply was interrupted and the clip was dropped
+        """
+        if self._interrupted:
+            return False
+        if not self.active:
+            self.start()
+        samples, sr = load_audio(audio, sample_rate)
+        samples = resample(samples, sr, self.sample_rate)
+        with self._lock:
+            if self._interrupted:
+                return False
+            clip = _Clip(np.ascontiguousarray(samples, dtype=np.float32), text)
+            self._clips.append(clip)
+            self._all.append(clip)
+        return True
+
+    def finish(self) -> None:
+        """
+        Mark the reply complete: playback ends once the queue drains
+        """
+        with self._lock:
+            self._finishing = True
+            if self._current is None and not self._clips:
+                self._done.set()
+
+    def play(self, audio: Union[str, bytes, np.ndarray], text: str = "",
+             sample_rate: Optional[int] = None) -> None:
+        """
+        Play a single clip as a whole reply, without blocking
+        """
+        self.start()
+        self.enqueue(audio, text, sample_rate)
+        self.finish()
+
+    def wait(self, timeout: Optional[float] = None) -> dict:
+        """
+        Block until the reply has finished or was interrupted
+
+        Returns:
+            Playback result (see `result`)
+        """
+        self._done.wait(timeout)
+        if self._done.is_set():
+            self._close_streams()
+        return self.result()
+
+    def stop(self) -> dict:
+        """
+        Stop playback now (e.g. the caller pressed record)
+
+        Returns:
+            Playback result (see `result`)
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._interrupted = True
+                self._done.set()
+        self._close_streams()
+        return self.result()
+
+    def result(self) -> dict:
+        """
+        How much of the current reply has been played
+
+        Returns:
+            {"interrupted": stopped before the end, "barge_in": stopped by
+            the caller's voice, "fraction": share of the reply audio played,
+            "heard_text": reply text up to that point, "played_s", "total_s"}
+        """
+        with self._lock:
+            clips = list(self._all)
+            interrupted = self._interrupted
+            barged_in = self._barged_in
+        total = sum(c.samples.size for c in clips)
+        played = sum(c.pos for c in clips)
+        heard = []
+        for clip in clips:
+            if clip.pos >= clip.samples.size:
+                heard.append(clip.text)
+                continue
+            if clip.pos:
+                heard.append(_truncate(clip.text, clip.pos / clip.samples.size))
+            break
+        return {
+            "interrupted": interrupted,
+            "barge_in": barged_in,
+            "fraction": played / total if total else 1.0,
+            "heard_text": " ".join(t for t in heard if t),
+            "played_s": played / self.sample_rate,
+            "total_s": total / self.sample_rate,
+        }
+
+    def _open_streams(self) -> None:
+        import sounddevice as sd
+
+        output = sd.OutputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            dtype="float32",
+            blocksize=int(self.sample_rate * self.block_ms / 1000),
+            latency="low",
+            callback=self._output_callback,
+        )
+        self._streams = [output]
+        if self.barge_in:
+            self._vad = EnergyVAD(sample_rate=self.monitor_sample_rate, frame_ms=self.block_ms,
+                                  threshold_db=self.threshold_db)
+            monitor = sd.InputStream(
+                samplerate=self.monitor_sample_rate,
+                channels=1,
+                dtype="float32",
+                blocksize=self._vad.frame_len,
+                latency="low",
+                callback=self._monitor_callback,
+            )
+            self._streams.append(monitor)
+        self._opened_at = time.perf_counter()
+        for stream in self._streams:
+            stream.start()
+
+    def _close_streams(self) -> None:
+        streams, self._streams = self._streams, []
+        if self._opened_at is not None:
+            observe("playback", time.perf_counter() - self._opened_at)
+            self._opened_at = None
+        for stream in streams:
+            try:
+                stream.abort()
+                stream.close()
+            except Exception:
+                pass
+
+    def _output_callback(self, outdata, frames, time_info, status) -> None:
+        import sounddevice as sd
+
+        out = outdata[:, 0]
+        filled = 0
+        with self._lock:
+            if self._interrupted or self._done.is_set():
+                outdata.fill(0)
+                raise sd.CallbackStop
+            while filled < frames:
+                if self._current is None:
+                    if not self._clips:
+                        break
+                    self._current = self._clips.popleft()
+                clip = self._current
+                n = min(frames - filled, clip.samples.size - clip.pos)
+                out[filled:filled + n] = clip.samples[clip.pos:clip.pos + n]
+                clip.pos += n
+                filled += n
+                if clip.pos >= clip.samples.size:
+                    self._current = None
+            out[filled:] = 0.0
+            if self._finishing and self._current is None and not self._clips:
+                self._done.set()
+                raise sd.CallbackStop
+
+    def _monitor_callback(self, indata, frames, time_info, status) -> None:
+        import sounddevice as sd
+
+        if self._done.is_set():
+            raise sd.CallbackStop
+        speech = self._vad.classify(self._vad.frames(indata[:, 0]))
+        for is_speech in speech:
+            self._speech_frames = self._speech_frames + 1 if is_speech else 0
+        if self._speech_frames * self.block_ms >= self.barge_in_ms:
+            with self._lock:
+                # Playing anything at all? Otherwise this is just the caller talking
+                if self._current is None and not self._clips:
+                    return
+                self._interrupted = True
+                self._barged_in = True
+                self._done.set()
+            raise sd.CallbackStop
+
+
+def _truncate(text: str, fraction: float) -> str:
+    """
+    Cut text proportionally, backing up to a word boundary when there is one
+    """
+    cut = int(len(text) * fraction)
+    head = text[:cut]
+    if cut < len(text) and " " in head:
+        head = head.rsplit(" ", 1)[0]
+    return head.strip()
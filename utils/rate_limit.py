@@ -0,0 +1,88 @@
+# utils/rate_limit.py
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from typing import List, Optional, Tuple
+
+# Lower value = served first. Live calls must not queue behind batch analysis.
+PRIORITY_LIVE = 0
+PRIORITY_BATCH = 10
+
+REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_RPM", "3500"))
+TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TPM", "90000"))
+
+
+class TokenBucketLimiter:
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = TOKENS_PER_MINUTE):
+        """
+        Async limiter for an API with request and token quotas
+
+        Two token buckets (requests/min and tokens/min) refill continuously.
+        Waiters are served strictly by priority, then arrival order, so a
+        burst of low-priority work cannot starve live traffic.
+
+        Args:
+            requests_per_minute: Request quota
+            tokens_per_minute: Token quota (prompt + completion)
+        """
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = requests_per_minute
+        self._tokens = tokens_per_minute
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, float, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens: float, priority: int = PRIORITY_LIVE) -> None:
+        """
+        Wait until one request costing `tokens` may be sent
+        """
+        # A single request larger than the whole bucket would wait forever
+        tokens = min(tokens, self.tpm)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    def adjust(self, delta_tokens: float) -> None:
+        """
+        Correct the token bucket once actual usage is known
+
+        Args:
+            delta_tokens: Actual minus estimated tokens (negative refunds)
+        """
+        self._refill()
+        self._tokens = min(self.tpm, self._tokens - delta_tokens)
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            priority, seq, tokens, future = self._waiters[0]
+            if future.done():  # caller was cancelled
+                heapq.heappop(self._waiters)
+                continue
+
+            self._refill()
+            if self._requests >= 1 and self._tokens >= tokens:
+                heapq.heappop(self._waiters)
+                self._requests -= 1
+                self._tokens -= tokens
+                future.set_result(None)
+                continue
+
+            wait = max(
+                (1 - self._requests) * 60.0 / self.rpm if self._requests < 1 else 0.0,
+                (tokens - self._tokens) * 60.0 / self.tpm if self._tokens < tokens else 0.0,
+            )
+            await asyncio.sleep(max(wait, 0.005))
@@ -0,0 +1,178 @@
+# utils/resample.py
+"""
+Vectorized polyphase resampling and level normalization.
+
+The anti-aliasing filter is a Kaiser-windowed sinc designed once per
+(up, down) rate pair and cached in polyphase form. `Resampler` is stateful,
+so long recordings can be converted block by block with bounded memory and
+the output is identical to converting the whole signal at once.
+"""
+from functools import lru_cache
+from math import gcd
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Filter half-length, in input/output samples of the slower rate
+HALF_TAPS = 10
+KAISER_BETA = 8.0
+# Outputs computed per vectorized step (bounds the gather buffers)
+OUTPUT_BLOCK = 16384
+
+
+def _ratio(orig_sr: int, target_sr: int) -> Tuple[int, int]:
+    g = gcd(int(orig_sr), int(target_sr))
+    return int(target_sr) // g, int(orig_sr) // g
+
+
+@lru_cache(maxsize=32)
+def polyphase_kernel(up: int, down: int) -> Tuple[np.ndarray, int]:
+    """
+    Design the low-pass filter for a rate pair and split it into phases
+
+    Returns:
+        Tuple of (phases, delay): `phases[p]` holds the taps of phase p,
+        reversed so a dot product with an input window applies them;
+        `delay` is the filter group delay in upsampled samples
+    """
+    factor = max(up, down)
+    half = HALF_TAPS * factor
+    n = np.arange(-half, half + 1, dtype=np.float64)
+    cutoff = 0.95 * 0.5 / factor  # cycles per upsampled sample, a little inside Nyquist
+    h = 2.0 * cutoff * np.sinc(2.0 * cutoff * n) * np.kaiser(n.size, KAISER_BETA) * up
+
+    taps = -(-h.size // up)
+    padded = np.zeros(taps * up)
+    padded[:h.size] = h
+    phases = padded.reshape(taps, up).T[:, ::-1]
+    return np.ascontiguousarray(phases, dtype=np.float32), half
+
+
+class Resampler:
+    def __init__(self, orig_sr: int, target_sr: int):
+        """
+        Streaming polyphase resampler
+
+        Args:
+            orig_sr: Input sampling rate in Hz
+            target_sr: Output sampling rate in Hz
+        """
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.up, self.down = _ratio(orig_sr, target_sr)
+        self.passthrough = self.up == self.down
+        self.phases, delay = polyphase_kernel(self.up, self.down)
+        self.taps = self.phases.shape[1]
+
+        # Input history: _buf[0] is global input sample _base (zeros before 0)
+        self._buf = np.zeros(self.taps - 1, dtype=np.float32)
+        self._base = -(self.taps - 1)
+        self._next = 0                                 # next output index
+        self._delay = int(round(delay / self.down))    # outputs lost to filter delay
+        self._skip = self._delay
+        self._total_in = 0
+        self._emitted = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resample a block of mono samples
+
+        Returns:
+            The output samples that can be computed so far
+        """
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        self._total_in += samples.size
+        if self.passthrough:
+            return samples
+        return self._run(samples)
+
+    def flush(self) -> np.ndarray:
+        """
+        Drain the filter at end of stream
+
+        Returns:
+            Remaining output samples; total output is ceil(input * up / down)
+        """
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        expected = -(-self._total_in * self.up // self.down)
+        remaining = max(0, expected - self._emitted)
+        pad = np.zeros(self.taps + -(-self._delay * self.down // self.up) + 1, dtype=np.float32)
+        out = self._run(pad)[:remaining]
+        self._emitted = expected
+        return out
+
+    def _run(self, samples: np.ndarray) -> np.ndarray:
+        buf = np.concatenate([self._buf, samples])
+        last = self._base + buf.size - 1  # newest input index available
+        if last < 0:
+            self._buf = buf
+            return np.zeros(0, dtype=np.float32)
+
+        end = (last * self.up + self.up - 1) // self.down + 1  # outputs computable
+        windows = sliding_window_view(buf, self.taps)
+        out = np.empty(max(0, end - self._next), dtype=np.float32)
+        for start in range(self._next, end, OUTPUT_BLOCK):
+            n = np.arange(start, min(end, start + OUTPUT_BLOCK), dtype=np.int64)
+            t = n * self.down
+            idx = t // self.up - (self.taps - 1) - self._base
+            out[start - self._next:start - self._next + n.size] = np.einsum(
+                "ij,ij->i", windows[idx], self.phases[t % self.up]
+            )
+
+        # Keep only the history the next output still needs
+        keep_from = (end * self.down) // self.up - (self.taps - 1) - self._base
+        keep_from = max(0, min(keep_from, buf.size))
+        self._buf = buf[keep_from:].copy()
+        self._base += keep_from
+        self._next = end
+
+        if self._skip:
+            dropped = min(self._skip, out.size)
+            out = out[dropped:]
+            self._skip -= dropped
+        self._emitted += out.size
+        return out
+
+
+def resample(samples: np.ndarray, orig_sr: int, target_sr: int,
+             block_size: int = 1 << 18) -> np.ndarray:
+    """
+    Resample a whole mono signal, block by block
+
+    Returns:
+        Float32 samples at `target_sr`
+    """
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+    if orig_sr == target_sr:
+        return samples
+    resampler = Resampler(orig_sr, target_sr)
+    parts = [resampler.process(samples[i:i + block_size]) for i in range(0, samples.size, block_size)]
+    parts.append(resampler.flush())
+    return np.concatenate(parts)
+
+
+def normalize(samples: np.ndarray, target_rms_db: float = -20.0, peak: float = 0.95,
+              max_gain_db: float = 20.0) -> np.ndarray:
+    """
+    Remove DC offset and bring the level to a consistent loudness
+
+    The gain aims for `target_rms_db` but never pushes the peak above
+    `peak`, and never exceeds `max_gain_db` (so near-silence is not blown up
+    into noise).
+
+    Returns:
+        Float32 samples (a new array)
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if not samples.size:
+        return samples.copy()
+    out = samples - np.float32(samples.mean())
+    rms = float(np.sqrt(np.mean(out * out)))
+    top = float(np.max(np.abs(out)))
+    if rms < 1e-9 or top < 1e-9:
+        return out
+    gain = min(10 ** (target_rms_db / 20) / rms, peak / top, 10 ** (max_gain_db / 20))
+    out *= np.float32(gain)
+    return out
@@ -0,0 +1,404 @@
+# utils/speculative.py
+"""
+Speculative reply generation while the caller finishes speaking.
+
+The recorder only ends an utterance after ~700 ms of trailing silence, and
+the reply normally starts after that and after the final transcript. A
+SpeculativeResponder starts the reply early instead: once the caller has
+been quiet for SPECULATIVE_SILENCE_MS and the transcript has not changed for
+SPECULATIVE_STABLE_MS, the current transcript is sent to the LLM and the
+first sentences are rendered to speech in the background.
+
+When the final transcript matches the speculative one, the reply (and its
+audio) is used as is; otherwise it is cancelled and a fresh reply is
+generated. A speculative reply is only offered to the FAQ cache once it has
+been committed, under the final transcript. Time gained by committed speculations and work thrown away by
+discarded ones are tracked in `stats` and as the speculation_saved /
+speculation_wasted metrics.
+
+With a streaming ASR model whose transcript is final (STREAMING_ASR_FINAL)
+the speculation answers the running partial; otherwise
+AudioProcessor.transcribe_audio is run on the audio so far when the silence
+starts, and its result becomes the final transcript if the caller does not
+speak again. Partial captions are shown whenever a streaming model exists.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from utils import streaming_asr
+from utils.language import detect_language
+from utils.metrics import observe
+from utils.streaming_tts import SentenceSegmenter
+from utils.vad import EnergyVAD
+
+STABLE_MS = int(os.getenv("SPECULATIVE_STABLE_MS", "250"))
+SILENCE_MS = int(os.getenv("SPECULATIVE_SILENCE_MS", "250"))
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+_DONE = object()
+
+
+def _same_text(a: str, b: str) -> bool:
+    """Transcripts differing only in case, punctuation or spacing ask the same thing"""
+    def norm(text):
+        return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+    return norm(a) == norm(b)
+
+
+class Speculation:
+    def __init__(self, llm_processor, audio_processor, conversation_history: List[Dict[str, str]],
+                 prompt: Optional[str] = None, transcribe: Optional[Callable[[], str]] = None):
+        """
+        A reply generated in the background for a transcript that may still change
+
+        Args:
+            llm_processor: LLMProcessor generating the reply
+            audio_processor: AudioProcessor rendering its sentences
+            conversation_history: History the reply is based on
+            prompt: Transcript to answer
+            transcribe: Called first to produce the transcript when `prompt`
+                is not known yet
+        """
+        self.llm_processor = llm_processor
+        self.audio_processor = audio_processor
+        self.conversation_history = list(conversation_history)
+        self.prompt = prompt
+        self.transcribe = transcribe
+        self.error: Optional[Exception] = None
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.cancelled = False
+        self.committed_prompt: Optional[str] = None
+        self.lang: Optional[str] = detect_language(prompt) if prompt else None
+
+        self._fragments: List[str] = []
+        self._done = False
+        self._cond = threading.Condition()
+        self._audio: Dict[str, Tuple[threading.Event, List[Optional[bytes]]]] = {}
+        self._synth_queue: "queue.Queue" = queue.Queue()
+        self.transcribed = threading.Event()
+        if prompt is not None:
+            self.transcribed.set()
+        threading.Thread(target=self._run, name="speculative-llm", daemon=True).start()
+        threading.Thread(target=self._synthesize_loop, name="speculative-tts", daemon=True).start()
+
+    def _run(self) -> None:
+        segmenter = SentenceSegmenter()
+        try:
+            if self.prompt is None:
+                self.prompt = self.transcribe()
+                self.lang = detect_language(self.prompt or "")
+                self.transcribed.set()
+            if self.prompt and not self.cancelled:
+                # Not learned here: the prompt may be a truncated question
+                stream = self.llm_processor.stream_response(
+                    self.prompt, conversation_history=self.conversation_history, learn=False)
+                try:
+                    for fragment in stream:
+                        if self.cancelled:
+                            break
+                        with self._cond:
+                            self._fragments.append(fragment)
+                            self._cond.notify_all()
+                        for chunk in segmenter.feed(fragment):
+                            self._queue_chunk(chunk)
+                finally:
+                    # Closed here rather than in cancel(): a generator can only
+                    # be closed by the thread running it. This stops generation.
+                    stream.close()
+                tail = segmenter.flush()
+                if tail and not self.cancelled:
+                    self._queue_chunk(tail)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.transcribed.set()
+            self._synth_queue.put(_DONE)
+            with self._cond:
+                self._done = True
+                self.finished = time.perf_counter()
+                self._cond.notify_all()
+                committed = self.committed_prompt is not None
+            if committed:
+                self._learn()
+
+    def commit(self, transcript: str) -> None:
+        """
+        Accept the speculation as the reply to the final transcript
+
+        The finished reply is then offered to the FAQ cache under `transcript`.
+        """
+        with self._cond:
+            self.committed_prompt = transcript
+            done = self._done
+        if done:
+            self._learn()
+
+    def _learn(self) -> None:
+        if self.error is None and not self.cancelled:
+            self.llm_processor._learn_answer(self.committed_prompt, "".join(self._fragments),
+                                             self.conversation_history)
+
+    def _queue_chunk(self, chunk: str) -> None:
+        with self._cond:
+            self._audio.setdefault(chunk, (threading.Event(), [None]))
+        self._synth_queue.put(chunk)
+
+    def _synthesize_loop(self) -> None:
+        while True:
+            chunk = self._synth_queue.get()
+            if chunk is _DONE:
+                return
+            event, slot = self._audio[chunk]
+            if not self.cancelled:
+                slot[0] = self.audio_processor.text_to_speech(chunk, lang=self.lang)
+            event.set()
+
+    def cancel(self) -> float:
+        """
+        Abandon the speculation
+
+        Returns:
+            Seconds of work that were spent on it
+        """
+        self.cancelled = True
+        with self._cond:
+            self._cond.notify_all()
+            end = self.finished or time.perf_counter()
+        return end - self.started
+
+    def progress(self, at: float) -> float:
+        """
+        Seconds of work the speculation had done by time `at` (perf_counter)
+        """
+        end = min(at, self.finished) if self.finished else at
+        return max(0.0, end - self.started)
+
+    def fragments(self) -> Iterator[str]:
+        """
+        Replay the reply: fragments produced so far, then the rest as it arrives
+        """
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._fragments) and not self._done:
+                    self._cond.wait()
+                pending = self._fragments[index:]
+                done = self._done
+            for fragment in pending:
+                yield fragment
+            index += len(pending)
+            if done and index >= len(self._fragments):
+                if self.error is not None:
+                    raise self.error
+                return
+
+    def synthesize(self, chunk: str) -> Optional[bytes]:
+        """
+        Audio for a chunk of the reply, reusing what was rendered speculatively
+        """
+        with self._cond:
+            entry = self._audio.get(chunk)
+        if entry is not None:
+            event, slot = entry
+            event.wait()
+            if slot[0]:
+                return slot[0]
+        return self.audio_processor.text_to_speech(chunk, lang=self.lang)
+
+
+class Reply:
+    def __init__(self, llm_processor, audio_processor, transcript: str,
+                 conversation_history: List[Dict[str, str]],
+                 speculation: Optional[Speculation] = None):
+        """
+        The reply to a finished utterance: a committed speculation, or a fresh one
+
+        Args:
+            llm_processor: LLMProcessor for a fresh reply
+            audio_processor: AudioProcessor for text-to-speech
+            transcript: Final transcript
+            conversation_history: Conversation history
+            speculation: Committed speculation, if any
+        """
+        self.llm_processor = llm_processor
+        self.audio_processor = audio_processor
+        self.transcript = transcript
+        self.conversation_history = conversation_history
+        self.speculation = speculation
+        self.lang = detect_language(transcript)  # one voice for the whole reply
+
+    @property
+    def speculative(self) -> bool:
+        """Whether the reply comes from a committed speculation"""
+        return self.speculation is not None
+
+    def fragments(self) -> Iterator[str]:
+        """
+        Reply text fragments (see LLMProcessor.stream_response)
+        """
+        if self.speculation is not None:
+            return self.speculation.fragments()
+        return self.llm_processor.stream_response(self.transcript, conversation_history=self.conversation_history)
+
+    def synthesize(self, chunk: str) -> Optional[bytes]:
+        """
+        Render one chunk of the reply (for StreamingSpeaker)
+        """
+        if self.speculation is not None:
+            return self.speculation.synthesize(chunk)
+        return self.audio_processor.text_to_speech(chunk, lang=self.lang)
+
+
+class SpeculativeResponder:
+    def __init__(self, audio_processor, llm_processor, stable_ms: int = STABLE_MS,
+                 silence_ms: int = SILENCE_MS):
+        """
+        Record an utterance and start replying before the caller has finished
+
+        Args:
+            audio_processor: AudioProcessor used for recording, ASR and TTS
+            llm_processor: LLMProcessor used for the reply
+            stable_ms: How long the transcript must stay unchanged
+            silence_ms: Trailing silence after which a reply may start
+                (below the recorder's hangover, so speculation has a head start)
+        """
+        self.audio_processor = audio_processor
+        self.llm_processor = llm_processor
+        self.stable_ms = stable_ms
+        self.silence_ms = silence_ms
+        self.stats = {"speculations": 0, "committed": 0, "discarded": 0,
+                      "saved_s": 0.0, "wasted_s": 0.0}
+        self._lock = threading.Lock()
+
+    def listen(self, conversation_history: List[Dict[str, str]], max_duration: float = 15.0,
+               on_partial: Optional[Callable[[str], None]] = None,
+               **record_kwargs) -> Tuple[Optional[np.ndarray], str, Optional[Reply]]:
+        """
+        Record one utterance, transcribe it and prepare the reply
+
+        Args:
+            conversation_history: Conversation so far (the reply's context)
+            max_duration: Maximum utterance length in seconds
+            on_partial: Called with each new partial transcript
+            **record_kwargs: Passed to AudioProcessor.record_speech
+
+        Returns:
+            Tuple of (recorded samples or None, final transcript, Reply or None)
+        """
+        sample_rate = self.audio_processor.sample_rate
+        captions = (streaming_asr.StreamingTranscriber(sample_rate=sample_rate)
+                    if streaming_asr.is_available() else None)
+        # Only speculate on the partial when it will also be the final transcript
+        transcriber = captions if streaming_asr.FINAL_TRANSCRIPT else None
+        vad = EnergyVAD(sample_rate=sample_rate)
+        frame_s = vad.frame_len / sample_rate
+        blocks: List[np.ndarray] = []
+        state = {"clock": 0.0, "silence": 0.0, "spoke": False, "partial": "", "changed_at": 0.0,
+                 "speculation": None, "spoke_after": False}
+
+        def on_chunk(block: np.ndarray) -> None:
+            blocks.append(block)
+            state["clock"] += len(block) / sample_rate
+            for is_speech in vad.classify(vad.frames(block)):
+                if is_speech:
+                    state["spoke"] = True
+                    state["silence"] = 0.0
+                    if state["speculation"] is not None:
+                        state["spoke_after"] = True
+                else:
+                    state["silence"] += frame_s
+            if captions is not None:
+                text = captions.feed(block)
+                if text:
+                    state["partial"], state["changed_at"] = text, state["clock"]
+                    if on_partial:
+                        on_partial(text)
+            self._update(state, blocks, transcriber, conversation_history)
+
+        audio = self.audio_processor.record_speech(max_duration=max_duration, on_chunk=on_chunk,
+                                                   **record_kwargs)
+        speculation: Optional[Speculation] = state["speculation"]
+        if audio is None:
+            if speculation is not None:
+                self._discard(speculation)
+            return None, "", None
+
+        if transcriber is not None:
+            transcript = transcriber.finalize()
+        elif speculation is not None and not state["spoke_after"]:
+            # Nothing but silence followed the snapshot: its transcript is final
+            speculation.transcribed.wait()
+            transcript = speculation.prompt or ""
+            if speculation.error is not None or not transcript:
+                transcript = self.audio_processor.transcribe_audio(audio)
+        else:
+            transcript = self.audio_processor.transcribe_audio(audio)
+        ready = time.perf_counter()
+
+        if speculation is not None:
+            if (speculation.error is None and speculation.prompt
+                    and _same_text(speculation.prompt, transcript)):
+                self._commit(speculation, transcript, ready)
+            else:
+                self._discard(speculation)
+                speculation = None
+        if not transcript:
+            return audio, "", None
+        return audio, transcript, Reply(self.llm_processor, self.audio_processor, transcript,
+                                        conversation_history, speculation)
+
+    def _update(self, state: dict, blocks: List[np.ndarray], transcriber,
+                conversation_history: List[Dict[str, str]]) -> None:
+        speculation: Optional[Speculation] = state["speculation"]
+        if speculation is not None:
+            # The caller went on talking: the reply is for an unfinished sentence
+            changed = transcriber is not None and not _same_text(speculation.prompt or "", state["partial"])
+            if changed or (transcriber is None and state["spoke_after"]):
+                self._discard(speculation)
+                state["speculation"] = None
+                state["spoke_after"] = False
+            return
+
+        if not state["spoke"] or state["silence"] * 1000 < self.silence_ms:
+            return
+        if transcriber is not None:
+            stable = (state["clock"] - state["changed_at"]) * 1000 >= self.stable_ms
+            if not state["partial"] or not stable:
+                return
+            speculation = Speculation(self.llm_processor, self.audio_processor, conversation_history,
+                                      prompt=state["partial"])
+        else:
+            snapshot = np.concatenate(blocks)
+            speculation = Speculation(self.llm_processor, self.audio_processor, conversation_history,
+                                      transcribe=lambda: self.audio_processor.transcribe_audio(snapshot))
+        state["speculation"] = speculation
+        with self._lock:
+            self.stats["speculations"] += 1
+
+    def _commit(self, speculation: Speculation, transcript: str, ready: float) -> None:
+        speculation.commit(transcript)
+        saved = speculation.progress(ready)
+        observe("speculation_saved", saved)
+        with self._lock:
+            self.stats["committed"] += 1
+            self.stats["saved_s"] += saved
+
+    def _discard(self, speculation: Speculation) -> None:
+        wasted = speculation.cancel()
+        observe("speculation_wasted", wasted)
+        with self._lock:
+            self.stats["discarded"] += 1
+            self.stats["wasted_s"] += wasted
+
+    def hit_rate(self) -> float:
+        """Share of speculations that were committed"""
+        done = self.stats["committed"] + self.stats["discarded"]
+        return self.stats["committed"] / done if done else 0.0
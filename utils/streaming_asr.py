@@ -0,0 +1,166 @@
+# utils/streaming_asr.py
+"""
+Streaming speech recognition with a sherpa-onnx online (streaming) model.
+
+Audio is decoded while it is being captured, so partial hypotheses are
+available during the utterance and only the last few hundred milliseconds
+remain to be decoded once the speaker stops.
+
+The model directory (STREAMING_ASR_MODEL_DIR, default
+asr_models/streaming) holds a streaming transducer from the sherpa-onnx
+releases, e.g. sherpa-onnx-streaming-zipformer-bilingual-zh-en:
+encoder*.onnx, decoder*.onnx, joiner*.onnx and tokens.txt. When several
+variants are present, int8 files are preferred.
+
+Streaming models cover one or two languages, while OmniASR is multilingual.
+By default the streaming hypothesis only drives live captions (and the
+speculative responder's timing) and the turn's final transcript still comes
+from OmniASR on the captured audio. Set STREAMING_ASR_FINAL=1 when every
+caller speaks a language the streaming model covers, to use its transcript
+as final and skip the OmniASR pass.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from utils.metrics import observe
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.getenv("STREAMING_ASR_MODEL_DIR", "asr_models/streaming")
+NUM_THREADS = int(os.getenv("STREAMING_ASR_THREADS", "2"))
+# Trailing silence (s) after which the model itself declares an endpoint
+ENDPOINT_SILENCE = float(os.getenv("STREAMING_ASR_ENDPOINT_SILENCE", "0.8"))
+# Use the streaming transcript as the turn's final transcript (see above)
+FINAL_TRANSCRIPT = os.getenv("STREAMING_ASR_FINAL", "0") == "1"
+
+
+def _pick(model_dir: str, part: str) -> Optional[str]:
+    candidates = sorted(glob.glob(os.path.join(model_dir, f"{part}*.onnx")))
+    if not candidates:
+        return None
+    int8 = [c for c in candidates if ".int8." in c]
+    return (int8 or candidates)[0]
+
+
+def model_files(model_dir: str = MODEL_DIR) -> Optional[dict]:
+    """
+    Locate the transducer files in a model directory
+
+    Returns:
+        Dictionary of encoder/decoder/joiner/tokens paths, or None if incomplete
+    """
+    files = {part: _pick(model_dir, part) for part in ("encoder", "decoder", "joiner")}
+    files["tokens"] = os.path.join(model_dir, "tokens.txt")
+    if not all(files.values()) or not os.path.isfile(files["tokens"]):
+        return None
+    return files
+
+
+@lru_cache(maxsize=None)
+def get_recognizer(model_dir: str = MODEL_DIR):
+    """
+    Load the online recognizer once per process
+
+    Returns:
+        sherpa_onnx.OnlineRecognizer, or None if the bindings or model are missing
+    """
+    files = model_files(model_dir)
+    if files is None:
+        return None
+    try:
+        import sherpa_onnx
+    except ImportError:
+        return None
+    logger.info("Loading streaming ASR model %s", model_dir)
+    return sherpa_onnx.OnlineRecognizer.from_transducer(
+        tokens=files["tokens"],
+        encoder=files["encoder"],
+        decoder=files["decoder"],
+        joiner=files["joiner"],
+        num_threads=NUM_THREADS,
+        sample_rate=16000,
+        feature_dim=80,
+        decoding_method="greedy_search",
+        enable_endpoint_detection=True,
+        rule1_min_trailing_silence=2.4,
+        rule2_min_trailing_silence=ENDPOINT_SILENCE,
+        rule3_min_utterance_length=30,
+    )
+
+
+def is_available() -> bool:
+    """Whether a streaming model can be used in this process"""
+    return get_recognizer() is not None
+
+
+class StreamingTranscriber:
+    def __init__(self, sample_rate: int = 16000, recognizer=None):
+        """
+        Incremental transcription of one utterance
+
+        Feed capture blocks as they arrive; `partial` always holds the current
+        hypothesis and `finalize` returns the final transcript.
+
+        Args:
+            sample_rate: Rate of the fed audio
+            recognizer: Online recognizer (default: the shared one)
+        """
+        self.sample_rate = sample_rate
+        self.recognizer = recognizer or get_recognizer()
+        if self.recognizer is None:
+            raise RuntimeError("No streaming ASR model available")
+        self.stream = self.recognizer.create_stream()
+        self.partial = ""
+        self._lock = threading.Lock()
+
+    def _result(self) -> str:
+        result = self.recognizer.get_result(self.stream)
+        # Newer bindings return the text, older ones a result object
+        text = result if isinstance(result, str) else result.text
+        return text.strip()
+
+    def _decode_ready(self) -> None:
+        while self.recognizer.is_ready(self.stream):
+            self.recognizer.decode_stream(self.stream)
+
+    def feed(self, samples: np.ndarray) -> Optional[str]:
+        """
+        Decode a block of audio
+
+        Returns:
+            The new partial transcript if it changed, else None
+        """
+        with self._lock:
+            self.stream.accept_waveform(self.sample_rate, np.asarray(samples, dtype=np.float32))
+            self._decode_ready()
+            text = self._result()
+        if text != self.partial:
+            self.partial = text
+            return text
+        return None
+
+    @property
+    def endpoint(self) -> bool:
+        """Whether the model has detected the end of the utterance"""
+        return self.recognizer.is_endpoint(self.stream)
+
+    def finalize(self) -> str:
+        """
+        Flush the remaining audio and return the final transcript
+        """
+        start = time.perf_counter()
+        with self._lock:
+            # Trailing padding lets the encoder emit the last frames
+            self.stream.accept_waveform(self.sample_rate, np.zeros(int(0.3 * self.sample_rate), dtype=np.float32))
+            self.stream.input_finished()
+            self._decode_ready()
+            self.partial = self._result()
+        observe("asr", time.perf_counter() - start)
+        return self.partial
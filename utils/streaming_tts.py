@@ -0,0 +1,170 @@
+# utils/streaming_tts.py
+import re
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# Sentence-final punctuation, Latin and CJK
+_SENTENCE_END = re.compile(r'([.!?;…]+["\')\]]*\s|[。！？；]+["\'）」』]*)')
+# Weaker break points used when a sentence runs too long
+_SOFT_BREAK = re.compile(r'([,:，、：]\s?)')
+
+_DONE = object()
+
+
+class SentenceSegmenter:
+    def __init__(self, min_chars: int = 12, max_chars: int = 200):
+        """
+        Cut a stream of text fragments into speakable chunks
+
+        Args:
+            min_chars: Shortest chunk to emit at a sentence boundary
+                (keeps "Hi." or "Mr." from becoming their own utterance)
+            max_chars: Force a cut at a soft break once a chunk grows this long
+        """
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, fragment: str) -> List[str]:
+        """
+        Add a fragment and return any chunks that are now complete
+        """
+        self._buffer += fragment
+        chunks = []
+        while True:
+            chunk = self._next_chunk()
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        return chunks
+
+    def flush(self) -> Optional[str]:
+        """
+        Return whatever text is left once the stream has ended
+        """
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+    def _next_chunk(self) -> Optional[str]:
+        for match in _SENTENCE_END.finditer(self._buffer):
+            if len(self._buffer[:match.end()].strip()) >= self.min_chars:
+                return self._cut(match.end())
+
+        if len(self._buffer) >= self.max_chars:
+            soft = [m.end() for m in _SOFT_BREAK.finditer(self._buffer, 0, self.max_chars)]
+            if soft:
+                return self._cut(soft[-1])
+            space = self._buffer.rfind(" ", 0, self.max_chars)
+            return self._cut(space if space > 0 else self.max_chars)
+        return None
+
+    def _cut(self, end: int) -> str:
+        chunk, self._buffer = self._buffer[:end].strip(), self._buffer[end:]
+        return chunk
+
+
+class StreamingSpeaker:
+    def __init__(self, audio_processor, play_fn: Optional[Callable[[bytes, str], None]] = None,
+                 lang: Optional[str] = None,
+                 synthesize: Optional[Callable[[str], Optional[bytes]]] = None):
+        """
+        Speak an LLM reply sentence by sentence while it is still being generated
+
+        Synthesis and playback each run on their own thread, so the first
+        sentence is audible while later tokens are still arriving and later
+        sentences are still being rendered.
+
+        Args:
+            audio_processor: AudioProcessor used for text-to-speech
+            play_fn: Playback function taking encoded audio bytes and the
+                text they speak (e.g. PlaybackManager.enqueue); None disables
+                playback (synthesis only)
+            lang: Language code passed to text-to-speech; pass the one
+                detected from the caller's transcript so the whole reply
+                keeps one voice (default: detected from each chunk)
+            synthesize: Function rendering one chunk to audio bytes (default:
+                audio_processor.text_to_speech), e.g. to reuse audio rendered
+                by a speculative reply
+        """
+        self.audio_processor = audio_processor
+        self.play_fn = play_fn
+        self.lang = lang
+        self.synthesize = synthesize
+
+    def speak(self, fragments: Iterable[str],
+              on_text: Optional[Callable[[str], None]] = None) -> Tuple[str, List[bytes]]:
+        """
+        Consume a token stream, synthesizing and playing chunks as they complete
+
+        Args:
+            fragments: Iterable of text fragments (e.g. LLMProcessor.stream_response)
+            on_text: Called with the accumulated reply text after every fragment
+
+        Returns:
+            Tuple of (full reply text, audio chunks in playback order)
+
+        Raises:
+            Whatever synthesis raised, once the stream has been consumed
+        """
+        segmenter = SentenceSegmenter()
+        synth_queue: "queue.Queue" = queue.Queue()
+        play_queue: "queue.Queue" = queue.Queue()
+        audio_chunks: List[bytes] = []
+        errors: List[BaseException] = []
+
+        synth_thread = threading.Thread(
+            target=self._synthesize_loop, args=(synth_queue, play_queue, audio_chunks, errors), daemon=True
+        )
+        play_thread = threading.Thread(target=self._play_loop, args=(play_queue,), daemon=True)
+        synth_thread.start()
+        play_thread.start()
+
+        text = ""
+        try:
+            for fragment in fragments:
+                text += fragment
+                if on_text:
+                    on_text(text)
+                for chunk in segmenter.feed(fragment):
+                    synth_queue.put(chunk)
+            tail = segmenter.flush()
+            if tail:
+                synth_queue.put(tail)
+        finally:
+            synth_queue.put(_DONE)
+            synth_thread.join()
+            play_thread.join()
+
+        if errors:
+            raise errors[0]
+        return text, audio_chunks
+
+    def _synthesize_loop(self, synth_queue, play_queue, audio_chunks: List[bytes],
+                         errors: List[BaseException]) -> None:
+        try:
+            while True:
+                chunk = synth_queue.get()
+                if chunk is _DONE:
+                    return
+                if self.synthesize:
+                    audio = self.synthesize(chunk)
+                else:
+                    audio = self.audio_processor.text_to_speech(chunk, lang=self.lang)
+                if audio:
+                    audio_chunks.append(audio)
+                    play_queue.put((audio, chunk))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            # Always release the play thread, or speak() would wait on it forever
+            play_queue.put(_DONE)
+
+    def _play_loop(self, play_queue) -> None:
+        while True:
+            item = play_queue.get()
+            if item is _DONE:
+                return
+            if self.play_fn:
+                self.play_fn(*item)
@@ -0,0 +1,226 @@
+# utils/tts_backends.py
+"""
+Text-to-speech backends.
+
+A backend turns text into encoded audio bytes (`synthesize`) or raw samples
+(`synthesize_pcm`). Backends are picked by name through TTS_BACKEND:
+
+    gtts         Google Translate TTS over the network, MP3
+    sherpa-onnx  Local sherpa-onnx OfflineTts (VITS / Piper models),
+                 kept loaded in memory, WAV
+    auto         sherpa-onnx when its bindings and a model are available,
+                 otherwise gtts (default)
+
+sherpa-onnx models are configured with TTS_SHERPA_MODEL_DIR (one model for
+every language) and/or TTS_SHERPA_MODELS ("en=/models/en,zh=/models/zh") for
+per-language voices. A model directory holds model.onnx (or any single
+.onnx), tokens.txt, and optionally lexicon.txt and espeak-ng-data/.
+"""
+import glob
+import io
+import logging
+import os
+import threading
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+logger = logging.getLogger(__name__)
+
+TTS_BACKEND = os.getenv("TTS_BACKEND", "auto")
+SHERPA_MODEL_DIR = os.getenv("TTS_SHERPA_MODEL_DIR", "tts_models/default")
+SHERPA_MODELS = os.getenv("TTS_SHERPA_MODELS", "")
+SHERPA_NUM_THREADS = int(os.getenv("TTS_SHERPA_THREADS", "2"))
+SHERPA_SPEAKER_ID = int(os.getenv("TTS_SHERPA_SPEAKER_ID", "0"))
+SHERPA_SPEED = float(os.getenv("TTS_SHERPA_SPEED", "1.0"))
+
+
+class TTSBackend:
+    """
+    Base class for text-to-speech backends
+
+    Subclasses implement `synthesize` and/or `synthesize_pcm`; each default
+    is defined in terms of the other.
+    """
+
+    name = "base"
+    ext = "wav"
+    mime = "audio/wav"
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        """
+        Render text to encoded audio bytes (format given by `ext` / `mime`)
+        """
+        samples, sample_rate = self.synthesize_pcm(text, lang)
+        buf = io.BytesIO()
+        sf.write(buf, samples, sample_rate, format="WAV", subtype="PCM_16")
+        return buf.getvalue()
+
+    def synthesize_pcm(self, text: str, lang: str) -> Tuple[np.ndarray, int]:
+        """
+        Render text to float32 mono samples
+
+        Returns:
+            Tuple of (samples, sample rate)
+        """
+        data, sample_rate = sf.read(io.BytesIO(self.synthesize(text, lang)), dtype="float32")
+        if data.ndim > 1:
+            data = data.mean(axis=1)
+        return data, sample_rate
+
+    def available(self) -> bool:
+        """
+        Whether the backend can run in this environment
+        """
+        return True
+
+
+class GTTSBackend(TTSBackend):
+    name = "gtts"
+    ext = "mp3"
+    mime = "audio/mpeg"
+
+    # ISO codes gTTS knows under another name
+    ALIASES = {"he": "iw"}
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        from gtts import gTTS
+        from gtts.lang import tts_langs
+
+        lang = self.ALIASES.get(lang, lang)
+        if lang not in tts_langs():
+            lang = "en"
+        buf = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(buf)
+        return buf.getvalue()
+
+
+def _parse_models(spec: str) -> Dict[str, str]:
+    models = {}
+    for item in spec.split(","):
+        if "=" in item:
+            lang, path = item.split("=", 1)
+            models[lang.strip()] = path.strip()
+    return models
+
+
+class SherpaOnnxTTSBackend(TTSBackend):
+    name = "sherpa-onnx"
+    ext = "wav"
+    mime = "audio/wav"
+
+    def __init__(self, model_dir: str = SHERPA_MODEL_DIR, models: Optional[Dict[str, str]] = None,
+                 num_threads: int = SHERPA_NUM_THREADS, speaker_id: int = SHERPA_SPEAKER_ID,
+                 speed: float = SHERPA_SPEED):
+        """
+        Local sherpa-onnx TTS with models kept resident
+
+        Each model is loaded on first use and reused for every later request;
+        generation on one model is serialized, different languages run in
+        parallel.
+
+        Args:
+            model_dir: Default model directory (used for languages without their own)
+            models: Per-language model directories (default: TTS_SHERPA_MODELS)
+            num_threads: ONNX threads per model
+            speaker_id: Speaker for multi-speaker models
+            speed: Speech rate multiplier
+        """
+        self.model_dir = model_dir
+        self.models = models if models is not None else _parse_models(SHERPA_MODELS)
+        self.num_threads = num_threads
+        self.speaker_id = speaker_id
+        self.speed = speed
+        self._engines: Dict[str, Tuple[object, threading.Lock]] = {}
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        try:
+            import sherpa_onnx  # noqa: F401
+        except ImportError:
+            return False
+        return any(os.path.isfile(os.path.join(d, "tokens.txt"))
+                   for d in [self.model_dir, *self.models.values()])
+
+    def _model_dir(self, lang: str) -> str:
+        return self.models.get(lang) or self.models.get(lang.split("-")[0]) or self.model_dir
+
+    def _load(self, model_dir: str):
+        import sherpa_onnx
+
+        models = glob.glob(os.path.join(model_dir, "*.onnx"))
+        model = os.path.join(model_dir, "model.onnx")
+        if not os.path.isfile(model):
+            if len(models) != 1:
+                raise FileNotFoundError(f"Expected model.onnx or a single .onnx file in {model_dir}")
+            model = models[0]
+
+        def existing(name):
+            path = os.path.join(model_dir, name)
+            return path if os.path.exists(path) else ""
+
+        config = sherpa_onnx.OfflineTtsConfig(
+            model=sherpa_onnx.OfflineTtsModelConfig(
+                vits=sherpa_onnx.OfflineTtsVitsModelConfig(
+                    model=model,
+                    tokens=os.path.join(model_dir, "tokens.txt"),
+                    lexicon=existing("lexicon.txt"),
+                    data_dir=existing("espeak-ng-data"),
+                ),
+                num_threads=self.num_threads,
+                provider="cpu",
+            ),
+            max_num_sentences=1,
+        )
+        if not config.validate():
+            raise ValueError(f"Invalid sherpa-onnx TTS model in {model_dir}")
+        logger.info("Loading TTS model %s", model_dir)
+        return sherpa_onnx.OfflineTts(config)
+
+    def _engine(self, lang: str):
+        model_dir = self._model_dir(lang)
+        with self._lock:
+            if model_dir not in self._engines:
+                self._engines[model_dir] = (self._load(model_dir), threading.Lock())
+            return self._engines[model_dir]
+
+    def synthesize_pcm(self, text: str, lang: str) -> Tuple[np.ndarray, int]:
+        engine, lock = self._engine(lang)
+        with lock:
+            audio = engine.generate(text, sid=self.speaker_id, speed=self.speed)
+        return np.asarray(audio.samples, dtype=np.float32), audio.sample_rate
+
+
+BACKENDS = {
+    "gtts": GTTSBackend,
+    "sherpa-onnx": SherpaOnnxTTSBackend,
+}
+
+
+def register_backend(name: str, backend_cls) -> None:
+    """
+    Make a backend class selectable through TTS_BACKEND
+    """
+    BACKENDS[name] = backend_cls
+    get_backend.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: Optional[str] = None) -> TTSBackend:
+    """
+    Shared backend instance (models stay loaded for the life of the process)
+
+    Args:
+        name: Backend name (default: TTS_BACKEND)
+    """
+    name = name or TTS_BACKEND
+    if name == "auto":
+        local = SherpaOnnxTTSBackend()
+        if local.available():
+            return local
+        return GTTSBackend()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown TTS backend {name!r}; choose from {', '.join(['auto', *BACKENDS])}")
+    return BACKENDS[name]()
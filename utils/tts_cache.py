@@ -0,0 +1,192 @@
+# utils/tts_cache.py
+"""
+Content-addressed on-disk cache for rendered speech.
+
+Entries are keyed by a hash of (normalized text, language, engine) and stored
+under a size-bounded directory; least recently used files are evicted first
+(file mtime is bumped on every hit).
+
+Warm-up:
+    python -m utils.tts_cache warmup [--mode customer_service] [--lang en]
+"""
+import argparse
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from typing import Dict, Optional
+
+CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.expanduser("~/.cache/voice-bot/tts"))
+MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "512"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so trivially different strings share a cache entry."""
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class TTSCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = int(MAX_MB * 1024 * 1024)):
+        """
+        Initialize the TTS cache
+
+        Args:
+            cache_dir: Directory holding cached audio
+            max_bytes: Size bound; 0 disables caching
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = max_bytes > 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = 0
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(text: str, lang: str, engine: str) -> str:
+        payload = "\x1f".join([normalize_text(text), lang, engine])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{ext}")
+
+    def get(self, text: str, lang: str, engine: str, ext: str = "mp3") -> Optional[str]:
+        """
+        Look up rendered audio
+
+        Returns:
+            Path to the cached file, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        path = self._path(self.key(text, lang, engine), ext)
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, text: str, lang: str, engine: str, data: bytes, ext: str = "mp3") -> Optional[str]:
+        """
+        Store rendered audio
+
+        Returns:
+            Path to the cached file, or None if caching is disabled
+        """
+        if not self.enabled:
+            return None
+        path = self._path(self.key(text, lang, engine), ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            # An overwrite replaces the old file, so only the difference counts
+            try:
+                previous = os.path.getsize(path)
+            except OSError:
+                previous = 0
+            os.replace(tmp_path, path)
+            self._size += len(data) - previous
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def evict(self) -> None:
+        """
+        Delete least recently used entries until the cache fits its bound
+        """
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            size = sum(e[1] for e in entries)
+            # Evict down to 90% so we do not rescan on every put
+            target = int(self.max_bytes * 0.9)
+            for path, entry_size, _ in entries:
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                    size -= entry_size
+                    self.evictions += 1
+                except OSError:
+                    pass
+            self._size = size
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self._size,
+        }
+
+
+def warmup(modes=None, lang: Optional[str] = None) -> Dict[str, float]:
+    """
+    Pre-render the common phrases of each LLMProcessor mode
+
+    Args:
+        modes: Mode names to warm (default: all)
+        lang: Language code (default: detected from each phrase)
+
+    Returns:
+        Cache statistics after warm-up
+    """
+    from utils.audio_utils import AudioProcessor
+    from utils.llm_utils import LLMProcessor
+
+    processor = AudioProcessor()
+    modes = modes or list(LLMProcessor.COMMON_PHRASES)
+    for mode in modes:
+        for phrase in LLMProcessor.COMMON_PHRASES[mode]:
+            processor.text_to_speech(phrase, lang=lang)
+    return processor.tts_cache.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS cache maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm = sub.add_parser("warmup", help="Pre-render common phrases")
+    warm.add_argument("--mode", action="append", help="Mode to warm (repeatable)")
+    warm.add_argument("--lang", default=None, help="Language code")
+    sub.add_parser("stats", help="Show cache size")
+    args = parser.parse_args()
+
+    if args.command == "warmup":
+        stats = warmup(args.mode, args.lang)
+        print(f"Warm-up done: {stats['misses']} rendered, {stats['hits']} already cached")
+    else:
+        stats = TTSCache().stats()
+        print(f"{CACHE_DIR}: {stats['size_bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
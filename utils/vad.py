@@ -0,0 +1,172 @@
+# utils/vad.py
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+
+class EnergyVAD:
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 20,
+                 threshold_db: float = -45.0, margin_db: float = 12.0,
+                 max_zcr: float = 0.35):
+        """
+        Frame-level voice activity detector based on energy and zero-crossing rate
+
+        Args:
+            sample_rate: Sampling rate in Hz
+            frame_ms: Frame length in milliseconds
+            threshold_db: Absolute energy floor (dBFS) below which a frame is silence
+            margin_db: How far above the tracked noise floor a frame must be
+            max_zcr: Zero-crossing rate above which quiet frames count as noise
+                (hiss and fans cross zero far more often than voiced speech)
+        """
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.max_zcr = max_zcr
+        self.noise_floor_db: Optional[float] = None
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+    def frames(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Split samples into whole frames, carrying the remainder to the next call
+
+        Returns:
+            Array of shape (n_frames, frame_len)
+        """
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        if self._remainder.size:
+            samples = np.concatenate([self._remainder, samples])
+        n_frames = samples.size // self.frame_len
+        used = n_frames * self.frame_len
+        self._remainder = samples[used:].copy()
+        return samples[:used].reshape(n_frames, self.frame_len)
+
+    def take_remainder(self) -> np.ndarray:
+        """
+        Return (and clear) samples held back because they did not fill a frame
+        """
+        rest, self._remainder = self._remainder, np.zeros(0, dtype=np.float32)
+        return rest
+
+    def classify(self, frames: np.ndarray) -> np.ndarray:
+        """
+        Classify a batch of frames
+
+        Args:
+            frames: Array of shape (n_frames, frame_len)
+
+        Returns:
+            Boolean array, True where the frame contains speech
+        """
+        if frames.size == 0:
+            return np.zeros(0, dtype=bool)
+
+        rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12)
+        energy_db = 20.0 * np.log10(rms)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frames.shape[1] - 1)
+
+        if self.noise_floor_db is None:
+            # Assume a quiet room until the audio shows otherwise, so a stream
+            # that opens mid-speech does not learn speech as its noise floor
+            self.noise_floor_db = min(float(np.percentile(energy_db, 10)),
+                                      self.threshold_db - self.margin_db)
+
+        threshold = max(self.threshold_db, self.noise_floor_db + self.margin_db)
+        loud = energy_db > threshold
+        # Very loud frames are speech regardless of ZCR (fricatives, plosives)
+        speech = loud & ((zcr < self.max_zcr) | (energy_db > threshold + 10.0))
+
+        # Track the noise floor from frames judged to be silence
+        quiet = energy_db[~speech]
+        if quiet.size:
+            self.noise_floor_db = 0.9 * self.noise_floor_db + 0.1 * float(np.median(quiet))
+        return speech
+
+    def reset(self) -> None:
+        self.noise_floor_db = None
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+
+class Endpointer:
+    def __init__(self, vad: EnergyVAD, pre_roll_ms: int = 300, hangover_ms: int = 700,
+                 min_speech_ms: int = 100, max_duration: float = 15.0,
+                 no_speech_timeout: float = 5.0):
+        """
+        Detect start and end of an utterance from a stream of audio blocks
+
+        Args:
+            vad: Frame classifier
+            pre_roll_ms: Audio kept from before the detected speech onset
+            hangover_ms: Silence required after speech before the utterance ends
+            min_speech_ms: Consecutive speech needed to trigger an onset
+            max_duration: Hard cap on the utterance length in seconds
+            no_speech_timeout: Give up if no speech starts within this many seconds
+        """
+        frame_ms = 1000.0 * vad.frame_len / vad.sample_rate
+        self.vad = vad
+        self.pre_roll_frames = int(pre_roll_ms / frame_ms)
+        self.hangover_frames = max(1, int(hangover_ms / frame_ms))
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.max_frames = int(max_duration * 1000 / frame_ms)
+        self.timeout_frames = int(no_speech_timeout * 1000 / frame_ms)
+
+        self._pre_roll = deque(maxlen=self.pre_roll_frames + self.min_speech_frames)
+        self._speech_frames = []
+        self._run = 0
+        self._silence = 0
+        self._seen = 0
+        self.started = False
+        self.finished = False
+        self.timed_out = False
+
+    def process(self, samples: np.ndarray) -> bool:
+        """
+        Feed a block of samples
+
+        Returns:
+            True once the utterance has ended (or capture should stop)
+        """
+        if self.finished:
+            return True
+
+        frames = self.vad.frames(samples)
+        flags = self.vad.classify(frames)
+
+        for frame, is_speech in zip(frames, flags):
+            self._seen += 1
+            if not self.started:
+                self._pre_roll.append(frame)
+                self._run = self._run + 1 if is_speech else 0
+                if self._run >= self.min_speech_frames:
+                    self.started = True
+                    self._speech_frames.extend(self._pre_roll)
+                    self._pre_roll.clear()
+                elif self._seen >= self.timeout_frames:
+                    self.finished = self.timed_out = True
+                    break
+                continue
+
+            self._speech_frames.append(frame)
+            self._silence = 0 if is_speech else self._silence + 1
+            if self._silence >= self.hangover_frames or len(self._speech_frames) >= self.max_frames:
+                self.finished = True
+                break
+
+        return self.finished
+
+    def audio(self) -> Optional[np.ndarray]:
+        """
+        Return the captured utterance with trailing silence trimmed
+
+        Returns:
+            Float32 mono samples, or None if no speech was detected
+        """
+        if not self._speech_frames:
+            return None
+        # Keep a short tail of the hangover so word endings are not clipped
+        tail = max(0, self._silence - self.hangover_frames // 4)
+        frames = self._speech_frames[:len(self._speech_frames) - tail]
+        return np.concatenate(frames).astype(np.float32)
@@ -0,0 +1,136 @@
+# utils/waveform.py
+"""
+Waveform thumbnails whose cost does not depend on audio length.
+
+The file is streamed in blocks and reduced to a min/max envelope with one
+column per output pixel; only the envelope is drawn. The default renderer
+writes the pixels directly with NumPy + Pillow; matplotlib is only used when
+axes are wanted.
+"""
+import hashlib
+import io
+from typing import Tuple
+
+import numpy as np
+import soundfile as sf
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """sha256 of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _reduce(mono: np.ndarray, spp: int):
+    """Min/max of each run of `spp` samples (the last run may be shorter)."""
+    n = mono.size // spp
+    mins, maxs = [], []
+    if n:
+        cols = mono[:n * spp].reshape(n, spp)
+        mins.append(cols.min(axis=1))
+        maxs.append(cols.max(axis=1))
+    if mono.size % spp:
+        tail = mono[n * spp:]
+        mins.append(tail.min(keepdims=True))
+        maxs.append(tail.max(keepdims=True))
+    return mins, maxs
+
+
+def compute_envelope(path, width: int = 1000,
+                     block_size: int = 1 << 16) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Reduce an audio file to per-pixel min/max values
+
+    Args:
+        path: Audio file path or seekable file-like object
+        width: Number of output columns
+        block_size: Samples read per block
+
+    Returns:
+        Tuple of (mins, maxs, duration in seconds); arrays have <= width entries
+    """
+    mins, maxs = [], []
+    with sf.SoundFile(path) as f:
+        frames, sr = f.frames, f.samplerate
+        spp = max(1, -(-frames // width))  # samples per pixel, rounded up
+        # Read whole pixels per block so no column straddles two blocks
+        block_size = max(spp, (block_size // spp) * spp)
+        for block in f.blocks(blocksize=block_size, dtype="float32", always_2d=True):
+            mono = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+            block_mins, block_maxs = _reduce(mono, spp)
+            mins += block_mins
+            maxs += block_maxs
+
+    if not mins:
+        return np.zeros(0, np.float32), np.zeros(0, np.float32), 0.0
+    return np.concatenate(mins), np.concatenate(maxs), frames / sr
+
+
+def samples_envelope(samples: np.ndarray, sample_rate: int,
+                     width: int = 1000) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Reduce in-memory samples to per-pixel min/max values
+
+    Returns:
+        Tuple of (mins, maxs, duration in seconds)
+    """
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+    if not samples.size:
+        return np.zeros(0, np.float32), np.zeros(0, np.float32), 0.0
+    mins, maxs = _reduce(samples, max(1, -(-samples.size // width)))
+    return np.concatenate(mins), np.concatenate(maxs), samples.size / sample_rate
+
+
+def render_png(mins: np.ndarray, maxs: np.ndarray, height: int = 160,
+               color=(31, 119, 180), background=(255, 255, 255)) -> bytes:
+    """
+    Draw an envelope as a PNG without matplotlib
+
+    Returns:
+        PNG bytes, one pixel column per envelope entry
+    """
+    from PIL import Image
+
+    width = max(1, mins.size)
+    mid = (height - 1) / 2.0
+    top = np.clip(np.round(mid - maxs * mid), 0, height - 1).astype(np.int32)
+    bottom = np.clip(np.round(mid - mins * mid), 0, height - 1).astype(np.int32)
+
+    rows = np.arange(height)[:, None]
+    mask = (rows >= top[None, :]) & (rows <= bottom[None, :])
+
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = background
+    image[mask] = color
+    image[int(mid), :] = np.minimum(image[int(mid), :], 200)  # zero line
+
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, format="PNG", optimize=False)
+    return buf.getvalue()
+
+
+def render_png_matplotlib(mins: np.ndarray, maxs: np.ndarray, duration: float,
+                          width: int = 1000, height: int = 200) -> bytes:
+    """
+    Draw an envelope with labelled axes via matplotlib
+
+    Returns:
+        PNG bytes
+    """
+    import matplotlib.pyplot as plt
+
+    dpi = 100
+    fig, ax = plt.subplots(figsize=(width / dpi, height / dpi), dpi=dpi)
+    t = np.linspace(0, duration, mins.size)
+    ax.fill_between(t, mins, maxs, linewidth=0)
+    ax.set_xlim(0, duration)
+    ax.set_xlabel('Time (seconds)')
+    ax.set_ylabel('Amplitude')
+    ax.set_title('Audio Waveform')
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight')
+    plt.close(fig)
+    return buf.getvalue()